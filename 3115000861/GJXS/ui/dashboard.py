@@ -0,0 +1,178 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+import time
+from collections import deque
+
+from kivy.clock import Clock
+from kivy.lang import Builder
+from kivy.properties import (BooleanProperty, NumericProperty,
+                             ObjectProperty, StringProperty)
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.popup import Popup
+
+from pkg_resources import resource_filename
+
+dashboard_template = resource_filename(__name__, "../templates/dashboard.kv")
+Builder.load_file(dashboard_template)
+
+
+def _format(value, fmt="%s"):
+    return "-" if value is None else fmt % value
+
+
+class SlaveSummaryRow(BoxLayout):
+    """
+    One line of the plant overview, a slave and its aggregate statistics
+    """
+    slave = StringProperty('')
+    tables = StringProperty('')
+    request_rate = StringProperty('')
+    last_write = StringProperty('')
+    min_value = StringProperty('')
+    max_value = StringProperty('')
+    mean_value = StringProperty('')
+
+
+class PlantOverview(Popup):
+    """
+    Summary of every slave of the active server: register count per table,
+    request rate, last write time and min/max/mean of the register values.
+
+    Statistics are maintained by a :class:`~GJXS.utils.stats.PlantStats`
+    subscribed to the change feed of the engine process, the popup only
+    polls a snapshot
+    every `refresh_interval` seconds while it is open. There is one
+    recycled row per slave and no per register widget.
+
+    The footer shows the thread count of the simulator and the calls and
+    CPU time of every task of its :class:`~GJXS.utils.reactor.Reactor`.
+    """
+    stats = ObjectProperty(None)
+    reactor = ObjectProperty(None, allownone=True)
+    runtime = StringProperty('')
+    refresh_interval = NumericProperty(1)
+    _refresh_event = None
+
+    def on_open(self):
+        self.update()
+        self._refresh_event = Clock.schedule_interval(self.update,
+                                                      self.refresh_interval)
+
+    def on_dismiss(self):
+        if self._refresh_event is not None:
+            self._refresh_event.cancel()
+            self._refresh_event = None
+
+    def update(self, *args):
+        rows = []
+        for slave in self.stats.snapshot():
+            tables = " ".join(
+                "%s:%d" % (name.split("_")[-1], count)
+                for name, count in sorted(slave['blocks'].items()))
+            last_write = slave['last_write']
+            if last_write is not None:
+                last_write = time.strftime("%H:%M:%S",
+                                           time.localtime(last_write))
+            rows.append({
+                'slave': str(slave['slave_id']),
+                'tables': tables,
+                'request_rate': "%.1f" % slave['request_rate'],
+                'last_write': _format(last_write),
+                'min_value': _format(slave['min']),
+                'max_value': _format(slave['max']),
+                'mean_value': _format(slave['mean'], "%.2f")
+            })
+        self.ids.slaves.data = rows
+        if self.reactor is not None:
+            self.runtime = format_reactor_stats(self.reactor.stats())
+
+
+def format_reactor_stats(stats):
+    """
+    One line summary of :meth:`~GJXS.utils.reactor.Reactor.stats`
+    """
+    tasks = ["%s %d calls %.2fs cpu" % (task['name'], task['calls'],
+                                        task['cpu_time'])
+             for task in stats['tasks']]
+    return "  |  ".join(["%d threads" % stats['threads']] + tasks)
+
+
+class RequestRow(BoxLayout):
+    """
+    One request of the traffic monitor
+    """
+    time = StringProperty('')
+    client = StringProperty('')
+    unit = StringProperty('')
+    function_code = StringProperty('')
+    range = StringProperty('')
+    latency = StringProperty('')
+    exception = StringProperty('')
+
+
+def _request_row(record):
+    if record.address is None:
+        address_range = "-"
+    elif record.count > 1:
+        address_range = "%d-%d" % (record.address,
+                                   record.address + record.count - 1)
+    else:
+        address_range = str(record.address)
+    return {
+        'time': "%s.%03d" % (time.strftime("%H:%M:%S",
+                                           time.localtime(record.timestamp)),
+                             record.timestamp % 1 * 1000),
+        'client': _format(record.client),
+        'unit': str(record.unit),
+        'function_code': _format(record.function_code, "%02d"),
+        'range': address_range,
+        'latency': "%.2f" % (record.latency * 1000),
+        'exception': _format(record.exception, "%02d")
+    }
+
+
+class TrafficMonitor(Popup):
+    """
+    Live view of the requests served by the active server, newest first.
+
+    Requests are recorded by the backend in a
+    :class:`~GJXS.utils.monitor.RequestMonitor` ring buffer; the popup polls
+    the records added since its last poll every `refresh_interval` seconds
+    while it is open and shows the last `max_rows` of them. Requests
+    overwritten in the ring buffer between two polls are not shown.
+    """
+    monitor = ObjectProperty(None)
+    refresh_interval = NumericProperty(.5)
+    max_rows = NumericProperty(500)
+    paused = BooleanProperty(False)
+    _refresh_event = None
+
+    def __init__(self, **kwargs):
+        super(TrafficMonitor, self).__init__(**kwargs)
+        self._rows = deque(maxlen=int(self.max_rows))
+        self._seq = 0
+
+    def on_open(self):
+        self._seq = 0
+        self._rows.clear()
+        self.update()
+        self._refresh_event = Clock.schedule_interval(self.update,
+                                                      self.refresh_interval)
+
+    def on_dismiss(self):
+        if self._refresh_event is not None:
+            self._refresh_event.cancel()
+            self._refresh_event = None
+
+    def update(self, *args):
+        if self.paused:
+            return
+        records, self._seq = self.monitor.since(self._seq)
+        if not records:
+            return
+        self._rows.extend(_request_row(record) for record in records)
+        self.ids.requests.data = list(reversed(self._rows))
+
+    def clear(self):
+        self._rows.clear()
+        self.ids.requests.data = []
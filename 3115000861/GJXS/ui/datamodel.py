@@ -1,22 +1,24 @@
 #!/usr/bin/python
 # -*- coding: UTF-8 -*-
 
-from random import randint
+from threading import Lock
 
-from kivy.adapters.dictadapter import DictAdapter
-from kivy.event import EventDispatcher
+from kivy.clock import Clock
 from kivy.lang import Builder
-from kivy.logger import Logger
-from kivy.properties import BooleanProperty, NumericProperty
+from kivy.properties import (BooleanProperty, NumericProperty,
+                             ObjectProperty, StringProperty)
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.label import Label
-from kivy.uix.listview import ListItemButton, CompositeListItem, ListView, SelectableView
 from kivy.uix.popup import Popup
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.layout import LayoutSelectionBehavior
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.uix.textinput import TextInput
 
-from GJXS.utils.backgroundJob import BackgroundJob
+from GJXS.utils.address_index import AddressIndex
 from pkg_resources import resource_filename
 
 datamodel_template = resource_filename(__name__, "../templates/datamodel.kv")
@@ -58,28 +60,23 @@ class ListItemReprMixin(Label):
         return '<%s text=%s>' % (self.__class__.__name__, text)
 
 
-class NumericTextInput(SelectableView, TextInput):
+class NumericTextInput(TextInput):
     """
-    :class:`~kivy.uix.listview.NumericTextInput` mixes
-    :class:`~kivy.uix.listview.SelectableView` with
-    :class:`~kivy.uix.label.TextInput` to produce a label suitable for use in
-    :class:`~kivy.uix.listview.ListView`.
+    :class:`~kivy.uix.textinput.TextInput` holding the value cell of a
+    :class:`RegisterRow`. Only numeric values within the range of the owning
+    :class:`DataModel` are accepted.
     """
     edit = BooleanProperty(False)
+    row = ObjectProperty(None, allownone=True)
 
-    def __init__(self, data_model, minval, maxval, **kwargs):
-        self.minval = minval
-        self.maxval = maxval
-
+    def __init__(self, **kwargs):
         super(NumericTextInput, self).__init__(**kwargs)
-        try:
-            self.val = int(self.text)
-        except ValueError:
-            error = "Only numeric value in range {0}-{1} to be used".format(minval, maxval)
-            self.hint_text = error
         self.padding_x = self.width
         self.disabled = True
-        self.data_model = data_model
+
+    @property
+    def data_model(self):
+        return self.row.data_model if self.row is not None else None
 
     def on_touch_down(self, touch):
         if self.collide_point(*touch.pos) and not self.edit:
@@ -89,121 +86,128 @@ class NumericTextInput(SelectableView, TextInput):
 
     def select(self, *args):
         self.disabled = False
-        self.bold = True
-        if isinstance(self.parent, CompositeListItem):
-            for child in self.parent.children:
-                # print child.children
-                pass
-            self.parent.select_from_child(self, *args)
 
     def deselect(self, *args):
-        self.bold = False
         self.disabled = True
-        if isinstance(self.parent, CompositeListItem):
-            self.parent.deselect_from_child(self, *args)
-
-    def select_from_composite(self, *args):
-        self.bold = True
-
-    def deselect_from_composite(self, *args):
-        self.bold = False
 
     def on_text_validate(self, *args):
-
+        minval, maxval = self.data_model.minval, self.data_model.maxval
         try:
-            int(self.text)
+            value = int(self.text)
 
-            if not(self.minval <= int(self.text) <= self.maxval):
+            if not(minval <= value <= maxval):
                 raise ValueError
             self.edit = False
-            self.data_model.on_data_update(self.index, self.text)
+            self.data_model.on_data_update(int(self.row.address), value)
             self.deselect()
         except ValueError:
             error_text = ("Only numeric value "
-                          "in range {0}-{1} to be used".format(self.minval,
-                                                               self.maxval))
+                          "in range {0}-{1} to be used".format(minval,
+                                                               maxval))
             ErrorPopup(title="Error", text=error_text)
             self.text = ""
             self.hint_text = error_text
             return
 
-    def on_text_focus(self, instance, focus):
-        if focus is False:
-            self.text = instance.text
+    def on_focus(self, instance, focus):
+        if focus is False and self.row is not None:
+            # drop uncommitted edits, the row may be recycled for another
+            # register at any time
+            self.text = self.row.value
             self.edit = False
             self.deselect()
 
 
-class UpdateEventDispatcher(EventDispatcher):
-    '''
-    Event dispatcher for updates in Data Model
-    '''
-    def __init__(self, **kwargs):
-        self.register_event_type('on_update')
-        super(UpdateEventDispatcher, self).__init__(**kwargs)
+class RegisterRow(RecycleDataViewBehavior, BoxLayout):
+    """
+    Row view of :class:`RegisterGrid` showing one register address and its
+    value. Rows are recycled, only the ones visible on screen exist.
+    """
+    index = None
+    address = StringProperty('')
+    value = StringProperty('')
+    selected = BooleanProperty(False)
+    data_model = ObjectProperty(None, allownone=True)
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.index = index
+        self.data_model = rv.data_model
+        self.value = rv.data_model.value_text(int(data['address']))
+        return super(RegisterRow, self).refresh_view_attrs(rv, index, data)
+
+    def on_touch_down(self, touch):
+        if super(RegisterRow, self).on_touch_down(touch):
+            return True
+        if self.collide_point(*touch.pos):
+            return self.parent.select_with_touch(self.index, touch)
+
+    def apply_selection(self, rv, index, is_selected):
+        self.selected = is_selected
+
+
+class RegisterLayout(LayoutSelectionBehavior, RecycleBoxLayout):
+    """
+    Layout of :class:`RegisterGrid` adding row selection
+    """
+
+
+class RegisterGrid(RecycleView):
+    """
+    Virtualized register table. `data` holds one `{'address': ..}` entry
+    per register sorted by address, values are read from the data model
+    when a row is shown.
+    """
+    data_model = ObjectProperty(None, allownone=True)
+
+    def selected_addresses(self):
+        """
+        Addresses of the selected rows
+        :return:
+        """
+        return [int(self.data[index]['address'])
+                for index in sorted(self.layout_manager.selected_nodes)
+                if index < len(self.data)]
 
-    def on_update(self, _parent, blockname, data):
-        Logger.debug("In UpdateEventDispatcher "
-                     "on_update {parent:%s,"
-                     " blockname: %s, data:%s,}" % (_parent, blockname, data))
-        _parent.sync_data_callback(blockname, data)
+    def clear_selection(self):
+        self.layout_manager.clear_selection()
 
 
 class DataModel(GridLayout):
     """
-    Uses :class:`CompositeListItem` for list item views comprised by two
-    :class:`ListItemButton`s and one :class:`ListItemLabel`. Illustrates how
-    to construct the fairly involved args_converter used with
-    :class:`CompositeListItem`.
+    Register table of one modbus block. Register values are not copied into
+    the model, they are read from and written to the backend datastore
+    through `view` (a :class:`~GJXS.utils.datastore.BlockView`). The
+    addresses shown come from the `addresses` index and are displayed by a
+    :class:`RegisterGrid`, so only the rows visible on screen are backed by
+    widgets.
+
+    Models are created by the GUI when their tab is first shown. Value
+    changes from simulation, masters and edits are queued with
+    :meth:`mark_changed` and applied to the grid at most once per frame,
+    touching only the changed rows.
     """
     minval = NumericProperty(0)
     maxval = NumericProperty(0)
-    simulate = False
-    time_interval = 1
-    dirty_thread = False
     dirty_model = False
-    simulate_timer = None
-    simulate = False
-    dispatcher = None
-    list_view = None
+    register_view = None
+    view = None
     _parent = None
-    is_simulating = False
     blockname = "<BLOCK_NAME_NOT_SET>"
 
     def __init__(self, **kwargs):
         kwargs['cols'] = 2
         kwargs['size_hint'] = (1.0, 1.0)
+        self.blockname = kwargs.pop("blockname", self.blockname)
+        self._parent = kwargs.pop("_parent", None)
+        self.addresses = AddressIndex()
+        self._pending = set()
+        self._stale = False
+        self._pending_lock = Lock()
+        self._trigger_populate = Clock.create_trigger(self._populate)
+        self._trigger_apply = Clock.create_trigger(self._apply_pending)
         super(DataModel, self).__init__(**kwargs)
-        self.init()
-
-    def init(self, simulate=False, time_interval=1, **kwargs):
-        """
-        Initializes Datamodel
-
-        """
-        self.minval = kwargs.get("minval", self.minval)
-        self.maxval = kwargs.get("maxval", self.maxval)
-        self.blockname = kwargs.get("blockname", self.blockname)
-        self.clear_widgets()
-        self.simulate = simulate
-        self.time_interval = time_interval
-        dict_adapter = DictAdapter(data={},
-                                   args_converter=self.arg_converter,
-                                   selection_mode='single',
-                                   allow_empty_selection=True,
-                                   cls=CompositeListItem
-                                   )
-
-        # Use the adapter in our ListView:
-        self.list_view = ListView(adapter=dict_adapter)
-        self.add_widget(self.list_view)
-        self.dispatcher = UpdateEventDispatcher()
-        self._parent = kwargs.get('_parent', None)
-        self.simulate_timer = BackgroundJob(
-            "simulation",
-            self.time_interval,
-            self._simulate_block_values
-        )
+        self.register_view = RegisterGrid(data_model=self)
+        self.add_widget(self.register_view)
 
     def clear_widgets(self, make_dirty=False, **kwargs):
         """
@@ -224,163 +228,156 @@ class DataModel(GridLayout):
         """
         self.minval = kwargs.get("minval", self.minval)
         self.maxval = kwargs.get("maxval", self.maxval)
-        time_interval = kwargs.get("time_interval", None)
-        try:
-            if time_interval and int(time_interval) != self.time_interval:
-                self.time_interval = time_interval
-                if self.is_simulating:
-                    self.simulate_timer.cancel()
-                self.simulate_timer = BackgroundJob("simulation", self.time_interval,
-                                                     self._simulate_block_values)
-                self.dirty_thread = False
-                self.start_stop_simulation(self.simulate)
-        except ValueError:
-            Logger.debug("Error while reinitializing DataModel %s" % kwargs)
 
     def update_view(self):
         """
-        Updates view with listview again
+        Updates view with the register grid again
         :return:
         """
         if self.dirty_model:
-            self.add_widget(self.list_view)
+            self.add_widget(self.register_view)
             self.dirty_model = False
 
-    def arg_converter(self, index, data):
+    def _populate(self, *args):
         """
-        arg converter to convert data to list view
-        :param index:
-        :param data:
+        Rebuilds the register grid rows from the address index. Only runs on
+        the main thread, once per frame at most.
         :return:
         """
-        _id = self.list_view.adapter.sorted_keys[index]
-        return {
-            'text': str(_id),
-            'size_hint_y': None,
-            'height': 30,
-            'cls_dicts': [
-                {
-                    'cls': ListItemButton,
-                    'kwargs': {'text': str(_id)}
-                },
-                {
-                    'cls': NumericTextInput,
-                    'kwargs': {
-                        'data_model': self,
-                        'minval': self.minval,
-                        'maxval': self.maxval,
-                        'text': str(data),
-                        'multiline': False,
-                        'is_representing_cls': True,
-
-                        
-                    }
-                },
-            ]
-        }
-
-    def add_data(self, data, item_strings):
+        self.register_view.data = [{'address': str(address)}
+                                   for address in self.addresses]
+
+    def value_text(self, address):
+        """
+        Text shown for the value of register `address`, read from the backend
+        :param address:
+        :return:
+        """
+        if self.view is None:
+            return ''
+        value = self.view.get(address)
+        return '' if value is None else str(value)
+
+    def set_values(self, changes):
+        """
+        Writes changed values (address -> value) to the backend and queues
+        the rows for redraw. Can be called from any thread.
+        :param changes:
+        :return:
+        """
+        if not changes or self.view is None:
+            return
+        self.view.write_map(changes)
+        self.mark_changed(changes)
+
+    def mark_changed(self, addresses):
+        """
+        Queues the rows of `addresses` for redraw. Can be called from any
+        thread, pending changes are merged and applied on the next frame.
+        :param addresses:
+        :return:
+        """
+        if not addresses:
+            return
+        with self._pending_lock:
+            self._pending.update(addresses)
+        self._trigger_apply()
+
+    def refresh_visible(self):
         """
-        Adds data to the Data model
+        Queues all visible rows for redraw, picking up values written by
+        modbus masters. Can be called from any thread.
+        :return:
+        """
+        self._stale = True
+        self._trigger_apply()
+
+    def _apply_pending(self, *args):
+        """
+        Redraws the visible rows whose register changed since the last frame.
+        Rows scrolled into view later read the current value anyway.
+        :return:
+        """
+        with self._pending_lock:
+            changed, self._pending = self._pending, set()
+            stale, self._stale = self._stale, False
+        rv = self.register_view
+        for row, view in list(rv.view_adapter.views.items()):
+            if row < len(rv.data) and (stale or int(view.address) in changed):
+                view.refresh_view_attrs(rv, row, rv.data[row])
+
+    def add_data(self, data, addresses):
+        """
+        Adds data to the Data model at the first free address
         :param data:
-        :param item_strings:
+        :param addresses: :class:`AddressIndex` of the block
+        :return:
+        """
+        start = addresses.next_free()
+        if start == -1:
+            raise ValueError("block full, no free address left in its %s "
+                             "addresses" % addresses.size)
+        self.add_data_range(start, [data], addresses)
+        return addresses
+
+    def add_data_range(self, start, values, addresses):
+        """
+        Adds `values` at the consecutive addresses from `start` with a single
+        backend write
+        :param start: first address of the range
+        :param values: list of values, one per register to add
+        :param addresses: :class:`AddressIndex` of the block
         :return:
         """
         self.update_view()
-        last_index = len(item_strings)
-        if last_index in item_strings:
-            last_index = int(item_strings[-1]) + 1
-        item_strings.append(last_index)
-        self.list_view.adapter.data.update({last_index: data})
-        self.list_view._trigger_reset_populate()
-        return self.list_view.adapter.data, item_strings
-
-    def delete_data(self, item_strings):
+        addresses.add_range(start, len(values))
+        if self.view is not None:
+            self.view.write(start, values)
+        self._trigger_populate()
+        return addresses
+
+    def delete_data(self, addresses):
         """
-        Delete data from data model
-        :param item_strings:
+        Delete data from data model, the deleted registers are reset to 0 in
+        the backend
+        :param addresses: :class:`AddressIndex` of the block
         :return:
         """
-        selections = self.list_view.adapter.selection
         items_popped = []
-        for item in selections:
-            index_popped = item_strings.pop(item_strings.index(int(item.text)))
-            data_popped = self.list_view.adapter.data.pop(int(item.text), None)
-            self.list_view.adapter.update_for_new_data()
-            self.list_view._trigger_reset_populate()
-            items_popped.append(index_popped)
-        return items_popped,  self.list_view.adapter.data
+        for address in self.register_view.selected_addresses():
+            if addresses.discard(address):
+                items_popped.append(address)
+        if items_popped:
+            if self.view is not None:
+                self.view.write_map(dict.fromkeys(items_popped, 0))
+            self.register_view.clear_selection()
+            self._trigger_populate()
+        return items_popped
 
     def on_selection_change(self, item):
         pass
 
     def on_data_update(self, index, data):
         """
-        Call back function to update data when data is changed in the list view
+        Call back function to update data when data is changed in the
+        register grid
         :param index:
         :param data:
         :return:
         """
-        self.list_view.adapter.data.update({index: data})
-        self.list_view._trigger_reset_populate()
-        self.dispatcher.dispatch('on_update', self._parent, self.blockname,
-                                 self.list_view.adapter.data)
+        self.set_values({index: data})
 
-    def refresh(self, data={}):
+    def refresh(self, view=None, addresses=None):
         """
         Data model refresh function to update when the view when slave is
         selected
-        :param data:
+        :param view: backend :class:`~GJXS.utils.datastore.BlockView`
+        :param addresses: :class:`AddressIndex` of the registers shown
         :return:
         """
         self.update_view()
-        self.list_view.adapter.data = data
-        self.list_view.disabled = False
-        self.list_view._trigger_reset_populate()
-
-    def start_stop_simulation(self, simulate):
-        """
-        Starts or stops simulating data
-        :param simulate:
-        :return:
-        """
-        self.simulate = simulate
-
-        if self.simulate:
-            if self.dirty_thread:
-                self.simulate_timer = BackgroundJob(
-                    "simulation",
-                    self.time_interval,
-                    self._simulate_block_values
-                )
-            self.simulate_timer.start()
-            self.dirty_thread = False
-            self.is_simulating = True
-        else:
-            self.simulate_timer.cancel()
-            self.dirty_thread = True
-            self.is_simulating = False
-
-    def _simulate_block_values(self):
-        if self.simulate:
-            data = self.list_view.adapter.data
-            if data:
-                for index, value in data.items():
-                    data[index] = randint(self.minval, self.maxval)
-                    # print self.minval, self.maxval, data[index]
-                self.refresh(data)
-                self.dispatcher.dispatch('on_update',
-                                         self._parent,
-                                         self.blockname,
-                                         self.list_view.adapter.data)
-
-    def reset_block_values(self):
-        if not self.simulate:
-            data = self.list_view.adapter.data
-            if data:
-                for index, value in data.items():
-                    data[index] = 1
-                self.list_view.adapter.data = data
-                self.list_view.disabled = False
-                self.list_view._trigger_reset_populate()
-                self._parent.sync_data_callback(self.blockname, self.list_view.adapter.data)
+        self.view = view
+        self.addresses = (addresses if addresses is not None
+                          else AddressIndex())
+        self.register_view.disabled = False
+        self._trigger_populate()
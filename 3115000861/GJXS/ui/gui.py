@@ -8,6 +8,7 @@ Modbus Simu App
 import kivy
 kivy.require('1.4.2')
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.properties import ObjectProperty
 from kivy.uix.boxlayout import BoxLayout
 from kivy.animation import Animation
@@ -15,17 +16,24 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.settings import SettingsWithSidebar
 from kivy.uix.listview import ListView, ListItemButton
 from kivy.adapters.listadapter import ListAdapter
-from GJXS.utils.modbus import BLOCK_TYPES, configure_modbus_logger
+from GJXS.utils.modbus import configure_modbus_logger
+from GJXS.utils.address_index import AddressIndex
+from GJXS.utils.datastore import BlockView
+from GJXS.utils.engine import EngineProxy
+from GJXS.utils.profiles import DeviceProfile, ProfileError, load_profiles
+from GJXS.utils.pty_link import PTY_PORT
 from GJXS.ui.settings import SettingIntegerWithRange
-from GJXS.utils.backgroundJob import BackgroundJob
+from GJXS.utils.reactor import Reactor
 import re
 import os
 import platform
+import socket
 
 from json import load, dump
 from kivy.config import Config
 from kivy.lang import Builder
-import GJXS.ui.datamodel  #noqa
+from GJXS.ui.datamodel import DataModel
+from GJXS.ui.dashboard import PlantOverview, TrafficMonitor
 from pkg_resources import resource_filename
 from serial.serialutil import SerialException
 
@@ -38,12 +46,14 @@ if IS_DARWIN:
 else:
     IS_HIGH_SIERRA_OR_ABOVE = False
 
-DEFAULT_SERIAL_PORT = '/dev/ptyp0' if not IS_HIGH_SIERRA_OR_ABOVE else '/dev/ttyp0'
-
-if USE_PYMODBUS:
-    from GJXS.utils.pymodbus_server import ModbusSimu
+if hasattr(os, "openpty"):
+    # a pty line created by the server, see `GJXS.utils.pty_link`
+    DEFAULT_SERIAL_PORT = PTY_PORT
 else:
-    from GJXS.utils.modbus import ModbusSimu
+    DEFAULT_SERIAL_PORT = '/dev/ptyp0' if not IS_HIGH_SIERRA_OR_ABOVE else '/dev/ttyp0'
+
+# the modbus engine runs in a process of its own, see `EngineProxy`
+BACKEND = "pymodbus" if USE_PYMODBUS else "modbus_tk"
 
 
 MAP = {
@@ -55,6 +65,8 @@ MAP = {
 PARENT = __name__.split(".")[0]
 settings_icon = resource_filename(PARENT, "assets/control.png")
 app_icon = resource_filename(PARENT, "assets/logo.png")
+DEVICE_PROFILES_FILE = resource_filename(PARENT,
+                                         "assets/device_profiles.json")
 modbus_template = resource_filename(PARENT, "templates/modbussimu.kv")
 Builder.load_file(modbus_template)
 
@@ -113,10 +125,6 @@ class Gui(BoxLayout):
 
     # Data models
     data_count = ObjectProperty()
-    data_model_Function_C15 = ObjectProperty()
-    data_model_Function_C02 = ObjectProperty()
-    data_model_Function_C16 = ObjectProperty()
-    data_model_Function_C03 = ObjectProperty()
 
     settings = ObjectProperty()
     riptide_logo = ObjectProperty()
@@ -130,12 +138,21 @@ class Gui(BoxLayout):
     server_running = False
     simulating = False
     simu_time_interval = None
+    simulate_timer = None
     anim = None
     restart_simu = False
+    # runs the modbus sync and the redraws of the simulated values, the
+    # server and the simulation run in the engine process
+    reactor = None
     sync_modbus_thread = None
     sync_modbus_time_interval = 5
     _modbus_device = {"tcp": None, 'rtu': None}
     _slaves = {"tcp": None, "rtu": None}
+    _plant_stats = {"tcp": None, "rtu": None}
+    profiles = {}
+    device_profile = ""
+    _default_profile = None
+    _default_profile_geometry = None
 
     last_active_port = {"tcp": "", "serial": ""}
     active_server = "tcp"
@@ -143,15 +160,13 @@ class Gui(BoxLayout):
 
     def __init__(self, **kwargs):
         super(Gui, self).__init__(**kwargs)
-        time_interval = kwargs.get("time_interval", 1)
         self.settings.icon = settings_icon
         self.riptide_logo.app_icon = app_icon
         self.config = Config.get_configparser('app')
         self.slave_list.adapter.bind(on_selection_change=self.select_slave)
         self.data_model_loc.disabled = True
         self.slave_pane.disabled = True
-        self._init_Function_C15()
-        self._init_registers()
+        self._init_data_models()
         self._register_config_change_callback(
             self._update_serial_connection,
             'Modbus Serial'
@@ -173,13 +188,13 @@ class Gui(BoxLayout):
         }
         mod_lib = "modbus_tk" if not USE_PYMODBUS else "pymodbus"
         configure_modbus_logger(cfg, protocol_logger=mod_lib)
-        self.simu_time_interval = time_interval
-        self.sync_modbus_thread = BackgroundJob(
+        self.reactor = Reactor()
+        self.reactor.start()
+        self.sync_modbus_thread = self.reactor.call_every(
             "modbus_sync",
             self.sync_modbus_time_interval,
             self._sync_modbus_block_values
         )
-        self.sync_modbus_thread.start()
         self._slave_misc = {"tcp": [self.slave_start_add.text,
                                     self.slave_end_add.text,
                                     self.slave_count.text],
@@ -203,6 +218,14 @@ class Gui(BoxLayout):
     def slave(self, value):
         self._slaves[self.active_server] = value
 
+    @property
+    def plant_stats(self):
+        return self._plant_stats[self.active_server]
+
+    @plant_stats.setter
+    def plant_stats(self, value):
+        self._plant_stats[self.active_server] = value
+
     @property
     def data_map(self):
         return self._data_map[self.active_server]
@@ -211,58 +234,103 @@ class Gui(BoxLayout):
     def data_map(self, value):
         self._data_map[self.active_server] = value
 
-    def _init_Function_C15(self):
-        time_interval = int(eval(self.config.get("Simulation",
-                                                 "time interval")))
-        minval = int(eval(self.config.get("Modbus Protocol",
-                                          "bin min")))
-        maxval = int(eval(self.config.get("Modbus Protocol",
-                                          "bin max")))
-
-        self.data_model_Function_C15.init(
-            blockname="Function_C15",
-            simulate=self.simulating,
-            time_interval=time_interval,
-            minval=minval,
-            maxval=maxval,
-            _parent=self
-        )
-        self.data_model_Function_C02.init(
-            blockname="Function_C02",
-            simulate=self.simulating,
-            time_interval=time_interval,
-            minval=minval,
-            maxval=maxval,
-            _parent=self
-        )
-
-    def _init_registers(self):
-        time_interval = int(eval(self.config.get("Simulation",
-                                                 "time interval")))
-        minval = int(eval(self.config.get("Modbus Protocol",
-                                          "reg min")))
-        maxval = int(eval(self.config.get("Modbus Protocol",
-                                          "reg max")))
+    def _init_data_models(self):
+        """
+        Reads the data model settings. The data models, their register grids
+        and adapters are only built when their tab is first shown.
+        """
+        self._data_models = {}
+        self.simu_time_interval = int(eval(self.config.get("Simulation",
+                                                           "time interval")))
+        bin_range = (int(eval(self.config.get("Modbus Protocol", "bin min"))),
+                     int(eval(self.config.get("Modbus Protocol", "bin max"))))
+        reg_range = (int(eval(self.config.get("Modbus Protocol", "reg min"))),
+                     int(eval(self.config.get("Modbus Protocol", "reg max"))))
+        self._value_ranges = {
+            "Function_C15": bin_range,
+            "Function_C02": bin_range,
+            "Function_C16": reg_range,
+            "Function_C03": reg_range
+        }
         self.block_start = int(eval(self.config.get("Modbus Protocol",
                                                     "block start")))
         self.block_size = int(eval(self.config.get("Modbus Protocol",
                                                    "block size")))
-        self.data_model_Function_C16.init(
-            blockname="Function_C16",
-            simulate=self.simulating,
-            time_interval=time_interval,
-            minval=minval,
-            maxval=maxval,
-            _parent=self
-        )
-        self.data_model_Function_C03.init(
-            blockname="Function_C03",
-            simulate=self.simulating,
-            time_interval=time_interval,
-            minval=minval,
-            maxval=maxval,
-            _parent=self
-        )
+        self.device_profile = self.config.get("Modbus Protocol",
+                                              "device profile")
+        self.load_profiles(self.config.get("Modbus Protocol",
+                                           "device profiles"))
+        # TabbedPanel.switch_to clears the panel after switching, tab
+        # contents are added on the next frame
+        self._trigger_show_tab = Clock.create_trigger(self._show_current_tab)
+        self.data_models.bind(current_tab=self._trigger_show_tab)
+        self._trigger_show_tab()
+
+    def load_profiles(self, path):
+        """
+        Loads the device profiles slaves can be added with
+        """
+        self.profiles = {}
+        if not path:
+            return
+        try:
+            self.profiles = load_profiles(path)
+        except ProfileError as e:
+            self.show_error("ProfileError: %s" % e)
+
+    def _profile(self, name=None):
+        """
+        DeviceProfile `name`, the `device profile` setting by default. Falls
+        back to `block start`/`block size` on every table if there is no
+        such profile.
+        """
+        name = name if name is not None else self.device_profile
+        if name in self.profiles:
+            return self.profiles[name]
+        if name:
+            self.show_error("ProfileError: unknown device profile '%s', "
+                            "using block start/size" % name)
+        geometry = (self.block_start, self.block_size)
+        if self._default_profile is None or \
+                self._default_profile_geometry != geometry:
+            self._default_profile = DeviceProfile.uniform("", *geometry)
+            self._default_profile_geometry = geometry
+        return self._default_profile
+
+    def _data_model(self, block_name):
+        """
+        DataModel of `block_name`, built on first use
+        """
+        dm = self._data_models.get(block_name)
+        if dm is None:
+            minval, maxval = self._value_ranges[block_name]
+            dm = DataModel(blockname=block_name, minval=minval, maxval=maxval,
+                           _parent=self)
+            self._data_models[block_name] = dm
+        return dm
+
+    def _visible_model(self, block_name=None):
+        """
+        DataModel of the current tab, None if it is not built yet or does not
+        show `block_name`
+        """
+        tab = self.data_models.current_tab
+        if tab is None or tab.content is None:
+            return None
+        if block_name is not None and MAP[tab.text] != block_name:
+            return None
+        return tab.content
+
+    def _show_current_tab(self, *args):
+        tab = self.data_models.current_tab
+        if tab is None:
+            return
+        if tab.content is None:
+            tab.add_widget(self._data_model(MAP[tab.text]))
+        if self.active_slave:
+            self.refresh()
+        else:
+            tab.content.clear_widgets(make_dirty=True)
 
     def _register_config_change_callback(self, callback, section, key=None):
         self.config.add_callback(callback, section, key)
@@ -290,7 +358,7 @@ class Gui(BoxLayout):
                 self.config.get('Modbus Serial', "dsrdtr")))
             kwargs["writetimeout"] = int(eval(
                 self.config.get('Modbus Serial', "writetimeout")))
-            kwargs["timeout"] = bool(eval(
+            kwargs["timeout"] = float(eval(
                 self.config.get('Modbus Serial', "timeout")))
         elif self.active_server == 'tcp':
             kwargs['address'] = self.config.get('Modbus Tcp', 'ip')
@@ -306,11 +374,15 @@ class Gui(BoxLayout):
             else:
                 create_new = True
         if create_new:
-
-            self.modbus_device = ModbusSimu(server=self.active_server,
-                                            port=self.port.text,
-                                            **kwargs
-                                            )
+            if self.modbus_device is not None:
+                self.modbus_device.close()
+            self.modbus_device = EngineProxy(BACKEND,
+                                             server=self.active_server,
+                                             port=self.port.text,
+                                             **kwargs
+                                             )
+            # maintained by the engine, polled by the plant overview
+            self.plant_stats = self.modbus_device.plant_stats
             if self.slave is None:
 
                 adapter = ListAdapter(
@@ -321,17 +393,16 @@ class Gui(BoxLayout):
                 self.slave = ListView(adapter=adapter)
 
             self._serial_settings_changed = False
-        elif self.active_server == "rtu":
-            if not USE_PYMODBUS:
-                self.modbus_device._serial.open()
 
     def start_server(self, btn):
         if btn.state == "down":
             try:
                 self._start_server()
-            except SerialException as e:
+            except (SerialException, OSError, socket.error) as e:
+                # OSError: out of pseudo terminals, socket.error: tcp port
+                # taken
                 btn.state = "normal"
-                self.show_error("Error in opening Serial port: %s" % e)
+                self.show_error("Error in starting the server: %s" % e)
                 return
             btn.text = "Stop"
         else:
@@ -341,7 +412,14 @@ class Gui(BoxLayout):
     def _start_server(self):
         self._create_modbus_device()
 
-        self.modbus_device.start()
+        # a stopped server keeps its socket/port, restarting it is instant
+        if self.modbus_device.paused:
+            self.modbus_device.resume()
+        else:
+            self.modbus_device.start()
+        if self.modbus_device.master_path:
+            self.show_error("Serving rtu, connect the masters to %s"
+                            % self.modbus_device.master_path)
         self.server_running = True
         self.interface_settings.disabled = True
         self.interfaces.disabled = True
@@ -354,7 +432,7 @@ class Gui(BoxLayout):
     def _stop_server(self):
         self.simulating = False
         self._simulate()
-        self.modbus_device.stop()
+        self.modbus_device.pause()
         self.server_running = False
         self.interface_settings.disabled = False
         self.interfaces.disabled = False
@@ -392,54 +470,58 @@ class Gui(BoxLayout):
             Animation(top=0, opacity=0, d=2)
         self.anim.start(self.info_label)
 
+    def show_overview(self, *args):
+        if self.plant_stats is None:
+            self.show_error("Start the modbus server to see the plant overview")
+            return
+        PlantOverview(stats=self.plant_stats,
+                      reactor=self.modbus_device.reactor).open()
+
+    def show_monitor(self, *args):
+        if self.modbus_device is None:
+            self.show_error("Start the modbus server to monitor its traffic")
+            return
+        TrafficMonitor(monitor=self.modbus_device.monitor).open()
+
     def add_slaves(self, *args):
         selected = self.slave_list.adapter.selection
         data = self.slave_list.adapter.data
         ret = self._process_slave_data(data)
         self._add_slaves(selected, data, ret)
 
-    def _add_slaves(self, selected, data, ret):
+    def _add_slaves(self, selected, data, ret, profile=None):
         if ret[0]:
             start_slave_add, slave_count = ret[1:]
         else:
             return
 
-        for slave_to_add in xrange(start_slave_add,
-                                   start_slave_add + slave_count):
-            if str(slave_to_add) in self.data_map:
-                return
-            self.data_map[str(slave_to_add)] = {
-                "Function_C15": {
-                    'data': {},
-                    'item_strings': [],
-                    "instance": self.data_model_Function_C15,
-                    "dirty": False
-                },
-                "Function_C02": {
-                    'data': {},
-                    'item_strings': [],
-                    "instance": self.data_model_Function_C02,
-                    "dirty": False
-                },
-                "Function_C16": {
-                    'data': {},
-                    'item_strings': [],
-                    "instance": self.data_model_Function_C16,
-                    "dirty": False
-                },
-                "Function_C03": {
-                    'data': {},
-                    'item_strings': [],
-                    "instance": self.data_model_Function_C03,
-                    "dirty": False
-                }
-            }
-            self.modbus_device.add_slave(slave_to_add)
-            for block_name, block_type in BLOCK_TYPES.items():
-                self.modbus_device.add_block(slave_to_add,
-                                             block_name, block_type, self.block_start, self.block_size)
-
-            data.append(str(slave_to_add))
+        slave_ids = [slave_id for slave_id in xrange(
+            start_slave_add, start_slave_add + slave_count)
+            if str(slave_id) not in self.data_map]
+        if not slave_ids:
+            self.show_error("slaves already present (%s-%s)" % (
+                start_slave_add, start_slave_add + slave_count - 1))
+            return
+        profile = self._profile(profile)
+        # the slaves of a profile share its template pages until written
+        try:
+            added = self.modbus_device.add_slaves(slave_ids,
+                                                  profile.template())
+        except MemoryError as e:
+            self.show_error("Error in adding the slaves: %s" % e)
+            return
+        for slave_id in added:
+            self.data_map[str(slave_id)] = dict(
+                (block_name, {
+                    'addresses': AddressIndex(),
+                    'dirty': False,
+                    'blocks': profile.geometry(block_name),
+                    'profile': profile.name
+                })
+                for block_name in profile.tables
+            )
+        data.extend(str(slave_id) for slave_id in added)
+        data.sort(key=int)
         self.slave_list.adapter.data = data
         self.slave_list._trigger_reset_populate()
 
@@ -466,10 +548,6 @@ class Gui(BoxLayout):
         except ValueError:
             slave_count = 1
 
-        if str(starting_address) in data:
-            self.show_error("slave already present (%s)" % starting_address)
-            success = False
-            return [success]
         if starting_address < 1:
             self.show_error("slave address (%s)"
                             " should be greater than 0 "% starting_address)
@@ -485,10 +563,10 @@ class Gui(BoxLayout):
         size = (end_address - starting_address) + 1
         size = slave_count if slave_count > size else size
 
-        if (size + starting_address) > 247:
+        if (size + starting_address - 1) > 247:
             self.show_error("address range (%s) beyond "
                             "allowed modbus slave "
-                            "devices(247)" % (size + starting_address))
+                            "devices(247)" % (size + starting_address - 1))
             success = False
             return [success]
         self.slave_end_add.text = str(starting_address + size - 1)
@@ -497,75 +575,92 @@ class Gui(BoxLayout):
 
     def delete_slaves(self, *args):
         selected = self.slave_list.adapter.selection
-        slave = self.active_slave
-        ct = self.data_models.current_tab
-        for item in selected:
-            self.modbus_device.remove_slave(int(item.text))
-            self.slave_list.adapter.data.remove(item.text)
-            self.slave_list._trigger_reset_populate()
-            ct.content.clear_widgets(make_dirty=True)
+        if not selected:
+            return
+        removed = set(item.text for item in selected)
+        self.modbus_device.remove_slaves([int(slave) for slave in removed])
+        for slave in removed:
+            self.data_map.pop(slave, None)
+        if self.active_slave in removed:
+            dm = self._visible_model()
+            if dm is not None:
+                dm.clear_widgets(make_dirty=True)
             if self.simulating:
                 self.simulating = False
                 self.restart_simu = True
                 self._simulate()
-            self.data_map.pop(slave)
+            self.active_slave = None
+        self.slave_list.adapter.data = [
+            slave for slave in self.slave_list.adapter.data
+            if slave not in removed]
+        self.slave_list._trigger_reset_populate()
 
     def update_data_models(self, *args):
         active = self.active_slave
         tab = self.data_models.current_tab
         count = self.data_count.text
-        self._update_data_models(active, tab, count, 1)
-
-    def _update_data_models(self, active, tab, count, value):
-        ct = tab
-        current_tab = MAP[ct.text]
-
-        ct.content.update_view()
-        # self.data_map[self.active_slave][current_tab]['dirty'] = False
-        _data = self.data_map[active][current_tab]
-        item_strings = _data['item_strings']
-        for i in xrange(int(count)):
-            if len(item_strings) < self.block_size:
-                _value = 1 if isinstance(value, int) else value[i]
-                updated_data, item_strings = ct.content.add_data(_value, item_strings)
-                _data['data'].update(updated_data)
-                _data['item_strings'] = item_strings
-                for k, v in updated_data.iteritems():
-                    self.modbus_device.set_values(int(active),
-                                                  current_tab, k, v)
-            else:
-                msg = ("OutOfModbusBlockError: address %s"
-                       " is out of block size %s" % (len(item_strings),
-                                                     self.block_size))
-                self.show_error(msg)
+        self._update_data_models(active, MAP[tab.text], count, 1)
+
+    def _update_data_models(self, active, block_name, count, value):
+        # only the visible model is bound to the active slave, the others
+        # pick up the index on their next refresh
+        dm = (self._visible_model(block_name)
+              if active == self.active_slave else None)
+        if dm is not None:
+            dm.update_view()
+        _data = self.data_map[active].get(block_name)
+        if _data is None:
+            self.show_error("MissingModbusBlockError: slave %s has no %s "
+                            "table" % (active, block_name))
+            return
+        addresses = _data['addresses']
+        table_size = sum(size for _, size in _data['blocks'])
+        count = int(count)
+        available = table_size - len(addresses)
+        if count > available:
+            msg = ("OutOfModbusBlockError: %s registers requested, only %s"
+                   " left in table size %s" % (count, max(available, 0),
+                                               table_size))
+            self.show_error(msg)
+            count = max(available, 0)
+        if not count:
+            return
+        # first block of the table with `count` consecutive free addresses
+        for block_start, block_size in _data['blocks']:
+            start = addresses.next_free(block_start, count)
+            if start != -1 and start + count <= block_start + block_size:
                 break
-
-    def sync_data_callback(self, blockname, data):
-        ct = self.data_models.current_tab
-        current_tab = MAP[ct.text]
-        if blockname != current_tab:
-            current_tab = blockname
-        try:
-            _data = self.data_map[self.active_slave][current_tab]
-            _data['data'].update(data)
-            for k, v in data.iteritems():
-                self.modbus_device.set_values(int(self.active_slave),
-                                              current_tab, k, int(v))
-        except KeyError:
-            pass
+        else:
+            msg = ("OutOfModbusBlockError: no %s consecutive free addresses"
+                   " in any block of table size %s" % (count, table_size))
+            self.show_error(msg)
+            return
+        if isinstance(value, int):
+            values = [1] * count
+        else:
+            values = [int(v) for v in value[:count]]
+        if dm is not None and dm.view is not None:
+            dm.add_data_range(start, values, addresses)
+        else:
+            addresses.add_range(start, count)
+            self.modbus_device.set_values(int(active), block_name, start,
+                                          values)
+        if self.simulating:
+            self._simulate()
 
     def delete_data_entry(self, *args):
         ct = self.data_models.current_tab
+        if ct.content is None:
+            return
         current_tab = MAP[ct.text]
-        _data = self.data_map[self.active_slave][current_tab]
-        item_strings = _data['item_strings']
-        deleted, data = ct.content.delete_data(item_strings)
-        dm = _data['data']
-        for index in deleted:
-            dm.pop(index, None)
+        _data = self.data_map[self.active_slave].get(current_tab)
+        if _data is None:
+            return
+        deleted = ct.content.delete_data(_data['addresses'])
+        if deleted and self.simulating:
+            self._simulate()
 
         if deleted:
-            self.update_backend(int(self.active_slave), current_tab, data)
             msg = ("Deleting "
                "individual modbus register/discrete_inputs/Function_C15 is not supported."
                "The data is removed from GUI and the corresponding value is"
@@ -573,10 +668,11 @@ class Gui(BoxLayout):
             self.show_error(msg)
 
     def select_slave(self, adapter):
-        ct = self.data_models.current_tab
+        dm = self._visible_model()
         if len(adapter.selection) != 1:
             # Multiple selection - No Data Update
-            ct.content.clear_widgets(make_dirty=True)
+            if dm is not None:
+                dm.clear_widgets(make_dirty=True)
             if self.simulating:
                 self.simulating = False
                 self.restart_simu = True
@@ -586,44 +682,56 @@ class Gui(BoxLayout):
 
         else:
             self.data_model_loc.disabled = False
+            self.active_slave = self.slave_list.adapter.selection[0].text
             if self.restart_simu:
                 self.simulating = True
                 self.restart_simu = False
+            if self.simulating:
+                # the simulation follows the active slave
                 self._simulate()
-            self.active_slave = self.slave_list.adapter.selection[0].text
             self.refresh()
 
     def refresh(self):
-        for child in self.data_models.tab_list:
-            dm = self.data_map[self.active_slave][MAP[child.text]]['data']
-            child.content.refresh(dm)
-
-    def update_backend(self, slave_id, blockname, new_data, ):
-        self.modbus_device.remove_block(slave_id, blockname)
-        self.modbus_device.add_block(slave_id, blockname,
-                                     BLOCK_TYPES[blockname], 0,
-                                     self.block_size)
-        for k, v in new_data.iteritems():
-            self.modbus_device.set_values(slave_id, blockname, k, int(v))
-
-    def change_simulation_settings(self, **kwargs):
-        self.data_model_Function_C15.reinit(**kwargs)
-        self.data_model_Function_C02.reinit(**kwargs)
-        self.data_model_Function_C16.reinit(**kwargs)
-        self.data_model_Function_C03.reinit(**kwargs)
+        """
+        Binds the model of the visible tab to the active slave, the other
+        tabs are refreshed when shown.
+        """
+        dm = self._visible_model()
+        if dm is None or not self.active_slave:
+            return
+        block_name = dm.blockname
+        # tables missing from the slave profile show up empty
+        table = self.data_map[self.active_slave].get(block_name)
+        dm.refresh(BlockView(self.modbus_device, int(self.active_slave),
+                             block_name),
+                   table['addresses'] if table is not None else None)
+
+    def change_simulation_settings(self, time_interval=None, **kwargs):
+        if time_interval is None:
+            return
+        self.simu_time_interval = time_interval
+        if self.simulate_timer is not None:
+            # read by the reactor task when rescheduled
+            self.simulate_timer.interval = time_interval
+            self._simulate()
 
     def change_datamodel_settings(self, key, value):
-        if "max" in key:
-            data = {"maxval": int(value)}
-        else:
-            data = {"minval": int(value)}
-
         if "bin" in key:
-            self.data_model_Function_C15.reinit(**data)
-            self.data_model_Function_C02.reinit(**data)
+            block_names = ("Function_C15", "Function_C02")
         else:
-            self.data_model_Function_C16.reinit(**data)
-            self.data_model_Function_C03.reinit(**data)
+            block_names = ("Function_C16", "Function_C03")
+        for block_name in block_names:
+            minval, maxval = self._value_ranges[block_name]
+            if "max" in key:
+                maxval = int(value)
+            else:
+                minval = int(value)
+            self._value_ranges[block_name] = minval, maxval
+            dm = self._data_models.get(block_name)
+            if dm is not None:
+                dm.reinit(minval=minval, maxval=maxval)
+        if self.simulating:
+            self._simulate()
 
     def start_stop_simulation(self, btn):
         if btn.state == "down":
@@ -637,45 +745,74 @@ class Gui(BoxLayout):
         self._simulate()
 
     def _simulate(self):
-        self.data_model_Function_C15.start_stop_simulation(self.simulating)
-        self.data_model_Function_C02.start_stop_simulation(self.simulating)
-        self.data_model_Function_C16.start_stop_simulation(self.simulating)
-        self.data_model_Function_C03.start_stop_simulation(
-            self.simulating)
+        """
+        Starts, updates or stops the simulation of the tables of the active
+        slave, whether their tab was shown or not. Values are written by the
+        engine process, the GUI only redraws the visible rows every
+        simulation interval.
+        """
+        slave = self.active_slave
+        device = self.modbus_device
+        if self.simulating and slave in self.data_map and device is not None:
+            device.simulate(int(slave), self._simulation_tables(slave),
+                            self.simu_time_interval)
+            if self.simulate_timer is None:
+                self.simulate_timer = self.reactor.call_every(
+                    "simulation_view",
+                    self.simu_time_interval,
+                    self._sync_modbus_block_values
+                )
+            return
+        if device is not None:
+            device.stop_simulation()
+        if self.simulate_timer is not None:
+            self.simulate_timer.cancel()
+            self.simulate_timer = None
+
+    def _simulation_tables(self, slave):
+        """
+        `{block_name: (runs, minval, maxval)}` of the registers of `slave`
+        shown in the GUI, see `EngineProxy.simulate`
+        """
+        tables = {}
+        for block_name, table in self.data_map[slave].items():
+            runs = list(table['addresses'].runs())
+            if runs:
+                minval, maxval = self._value_ranges[block_name]
+                tables[block_name] = (runs, minval, maxval)
+        return tables
+
+    def _write_block_values(self, slave, block_name, changes):
+        """
+        Writes `changes` (address -> value) to a table of `slave` and
+        redraws them if the table is on screen. Can be called from any
+        thread.
+        """
+        if not changes or self.modbus_device is None:
+            return
+        BlockView(self.modbus_device, int(slave), block_name).write_map(
+            changes)
+        dm = (self._visible_model(block_name)
+              if slave == self.active_slave else None)
+        if dm is not None:
+            dm.mark_changed(changes)
 
     def reset_simulation(self, *args):
-        if not self.simulating:
-            self.data_model_Function_C15.reset_block_values()
-            self.data_model_Function_C02.reset_block_values()
-            self.data_model_Function_C16.reset_block_values()
-            self.data_model_Function_C03.reset_block_values()
+        slave = self.active_slave
+        if not self.simulating and slave in self.data_map:
+            for block_name, table in self.data_map[slave].items():
+                self._write_block_values(
+                    slave, block_name, dict.fromkeys(table['addresses'], 1))
 
     def _sync_modbus_block_values(self):
         """
-        track external changes in modbus block values and sync GUI
-        ToDo:
-        A better way to update GUI when simulation is on going  !!
+        track external changes in modbus block values and sync GUI.
+        Values are read straight from the backend, so only the rows of the
+        visible tab on screen need redrawing.
         """
-        if not self.simulating:
-            if self.active_slave:
-                _data_map = self.data_map[self.active_slave]
-                for block_name, value in _data_map.items():
-                    updated = {}
-                    for k, v in value['data'].items():
-                        actual_data = self.modbus_device.get_values(
-                            int(self.active_slave),
-                            block_name,
-                            int(k),
-
-                        )
-                        try:
-                            if actual_data[0] != int(v):
-                                updated[k] = actual_data[0]
-                        except TypeError:
-                            pass
-                    if updated:
-                        value['data'].update(updated)
-                        self.refresh()
+        dm = self._visible_model()
+        if self.active_slave and dm is not None:
+            dm.refresh_visible()
 
     def _backup(self):
         if self.slave is not None:
@@ -705,14 +842,21 @@ class Gui(BoxLayout):
         with open(SLAVES_FILE, 'w') as f:
             slave = [int(slave_no) for slave_no in self.slave_list.adapter.data]
             slaves_memory = []
+            slave_profiles = {}
             for slaves, mem in self.data_map.iteritems():
                 for name, value in mem.iteritems():
-                    if len(value['data']) != 0:
-                        slaves_memory.append((slaves, name, map(int, value['data'].values())))
+                    slave_profiles[slaves] = value['profile']
+                    view = BlockView(self.modbus_device, int(slaves), name)
+                    values = []
+                    for start, count in value['addresses'].runs():
+                        values.extend(int(v) for v in view.read(start, count))
+                    if values:
+                        slaves_memory.append((slaves, name, values))
 
             dump(dict(
                 slaves_list=slave, active_server=self.active_server,
-                port=self.port.text, slaves_memory=slaves_memory
+                port=self.port.text, slaves_memory=slaves_memory,
+                slave_profiles=slave_profiles
             ), f, indent=4)
 
     def load_state(self):
@@ -754,35 +898,30 @@ class Gui(BoxLayout):
 
             self._create_modbus_device()
 
-            start_slave = 0
-            temp_list = []
-            slave_count = 1
-            for first, second in zip(slaves_list[:-1], slaves_list[1:]):
-                if first+1 == second:
-                    slave_count += 1
+            # runs of consecutive slaves added with the same profile
+            slave_profiles = data.get('slave_profiles', {})
+            runs = []
+            for slave_id in sorted(slaves_list):
+                profile = slave_profiles.get(str(slave_id))
+                if runs and runs[-1][0] + runs[-1][1] == slave_id and \
+                        runs[-1][2] == profile:
+                    runs[-1][1] += 1
                 else:
-                    temp_list.append((slaves_list[start_slave], slave_count))
-                    start_slave += slave_count
-                    slave_count = 1
-            temp_list.append((slaves_list[start_slave], slave_count))
+                    runs.append([slave_id, 1, profile])
 
-            for start_slave, slave_count in temp_list:
+            for start_slave, slave_count, profile in runs:
                 self._add_slaves(
                     self.slave_list.adapter.selection,
                     self.slave_list.adapter.data,
-                    (True, start_slave, slave_count)
+                    (True, start_slave, slave_count),
+                    profile
                 )
 
-            memory_map = {
-                'Function_C15': self.data_models.tab_list[3],
-                'Function_C02': self.data_models.tab_list[2],
-                'Function_C16': self.data_models.tab_list[1],
-                'Function_C03': self.data_models.tab_list[0]
-            }
             slaves_memory = data['slaves_memory']
             for slave_memory in slaves_memory:
                 active_slave, memory_type, memory_data = slave_memory
-                self._update_data_models(active_slave, memory_map[memory_type], len(memory_data), memory_data)
+                self._update_data_models(active_slave, memory_type,
+                                         len(memory_data), memory_data)
 
 
 #!/usr/bin/python
@@ -891,6 +1030,20 @@ setting_panel = """
     "section": "Modbus Protocol",
     "key": "Block Size"
   },
+  {
+    "type": "path",
+    "title": "Device profiles",
+    "desc": "JSON file of device profiles, the block layout of every table per device type",
+    "section": "Modbus Protocol",
+    "key": "device profiles"
+  },
+  {
+    "type": "string",
+    "title": "Device profile",
+    "desc": "Profile of the slaves added, leave empty to use Block Start/Block Size on every table",
+    "section": "Modbus Protocol",
+    "key": "device profile"
+  },
   {
     "type": "numeric_range",
     "title": "Function_C15/Discrete Input MinValue",
@@ -1022,7 +1175,11 @@ class ModbusSimuApp(App):
                 self.gui.simulating = False
                 self.gui._simulate()
             self.gui.modbus_device.stop()
+        for device in self.gui._modbus_device.values():
+            if device is not None:
+                device.close()
         self.gui.sync_modbus_thread.cancel()
+        self.gui.reactor.stop()
         self.config.write()
         self.gui.save_state()
 
@@ -1036,6 +1193,8 @@ class ModbusSimuApp(App):
         config.set('Modbus Tcp', "ip", '127.0.0.1')
         config.set('Modbus Protocol', "block start", 0)
         config.set('Modbus Protocol', "block size", 100)
+        config.set('Modbus Protocol', "device profiles", DEVICE_PROFILES_FILE)
+        config.set('Modbus Protocol', "device profile", "")
         config.set('Modbus Protocol', "bin min", 0)
         config.set('Modbus Protocol', "bin max", 1)
         config.set('Modbus Protocol', "reg min", 0)
@@ -1086,6 +1245,10 @@ class ModbusSimuApp(App):
             self.gui.block_start = int(value)
         if section == "Modbus Protocol" and key == "block size":
             self.gui.block_size = int(value)
+        if section == "Modbus Protocol" and key == "device profiles":
+            self.gui.load_profiles(value)
+        if section == "Modbus Protocol" and key == "device profile":
+            self.gui.device_profile = value
 
     def close_settings(self, *args):
         super(ModbusSimuApp, self).close_settings()
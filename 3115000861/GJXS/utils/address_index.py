@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+ADDRESS_SPACE = 65536
+
+_USED = b'\x01'
+_FREE = b'\x00'
+
+
+class AddressIndex(object):
+    """
+    Ordered set of the register addresses in use within one modbus table.
+
+    Addresses are kept in a bitmap spanning the whole modbus address space,
+    so membership, insertion and deletion are O(1), while ordered iteration,
+    range queries, rank and free address lookups are plain byte scans done
+    by `bytearray.find`/`bytearray.count`.
+    """
+
+    def __init__(self, addresses=(), size=ADDRESS_SPACE):
+        self._size = size
+        self._bitmap = bytearray(size)
+        self._count = 0
+        self.update(addresses)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, address):
+        return 0 <= address < self._size and self._bitmap[address] == 1
+
+    def __iter__(self):
+        return self.range()
+
+    def __repr__(self):
+        return '<%s count=%d>' % (self.__class__.__name__, self._count)
+
+    @property
+    def size(self):
+        return self._size
+
+    def add(self, address):
+        """
+        Marks `address` as used. Returns False if it already was.
+        """
+        if not 0 <= address < self._size:
+            raise ValueError("address %s is out of the address space (%s)" %
+                             (address, self._size))
+        if self._bitmap[address]:
+            return False
+        self._bitmap[address] = 1
+        self._count += 1
+        return True
+
+    def discard(self, address):
+        """
+        Marks `address` as free. Returns False if it was not used.
+        """
+        if not 0 <= address < self._size or not self._bitmap[address]:
+            return False
+        self._bitmap[address] = 0
+        self._count -= 1
+        return True
+
+    def update(self, addresses):
+        for address in addresses:
+            self.add(address)
+
+    def add_range(self, start, count):
+        """
+        Marks the `count` addresses starting at `start` as used.
+        """
+        stop = start + count
+        if start < 0 or stop > self._size:
+            raise ValueError("address range %s-%s is out of the address "
+                             "space (%s)" % (start, stop - 1, self._size))
+        self._count += count - self._bitmap.count(_USED, start, stop)
+        self._bitmap[start:stop] = _USED * count
+
+    def discard_range(self, start, count):
+        """
+        Marks the `count` addresses starting at `start` as free.
+        """
+        start = max(start, 0)
+        stop = min(start + count, self._size)
+        if stop <= start:
+            return
+        self._count -= self._bitmap.count(_USED, start, stop)
+        self._bitmap[start:stop] = _FREE * (stop - start)
+
+    def clear(self):
+        self._bitmap = bytearray(self._size)
+        self._count = 0
+
+    def range(self, start=0, stop=None):
+        """
+        Yields the used addresses within [start, stop) in ascending order.
+        """
+        stop = self._size if stop is None else min(stop, self._size)
+        find = self._bitmap.find
+        address = find(_USED, max(start, 0), stop)
+        while address != -1:
+            yield address
+            address = find(_USED, address + 1, stop)
+
+    def runs(self, start=0, stop=None):
+        """
+        Yields `(first, count)` for every run of consecutive used addresses
+        within [start, stop) in ascending order.
+        """
+        stop = self._size if stop is None else min(stop, self._size)
+        find = self._bitmap.find
+        first = find(_USED, max(start, 0), stop)
+        while first != -1:
+            end = find(_FREE, first, stop)
+            if end == -1:
+                end = stop
+            yield first, end - first
+            first = find(_USED, end, stop)
+
+    def first(self):
+        """
+        Lowest used address or -1 if the index is empty.
+        """
+        return self._bitmap.find(_USED)
+
+    def last(self):
+        """
+        Highest used address or -1 if the index is empty.
+        """
+        return self._bitmap.rfind(_USED)
+
+    def rank(self, address):
+        """
+        Number of used addresses lower than `address`, i.e. the position
+        `address` has (or would have) in the ordered index.
+        """
+        return self._bitmap.count(_USED, 0, address)
+
+    def next_free(self, start=0, count=1):
+        """
+        First address >= `start` followed by `count` consecutive free
+        addresses, or -1 if there is no such gap.
+        """
+        return self._bitmap.find(_FREE * count, max(start, 0))
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Modbus ascii framing: a frame is ':', the hexadecimal characters of the
+unit, pdu and LRC, then CR LF. The servers convert a frame to the binary
+adu (unit, pdu, LRC byte) on reading and back on writing, and split what
+the port holds with an :class:`AsciiFramer`, read the same way as the rtu
+frames (see :func:`~GJXS.utils.rtu_framing.read_frames`).
+"""
+from __future__ import absolute_import, unicode_literals
+
+import binascii
+import struct
+import time
+
+START = b":"
+END = b"\r\n"
+# longest silence within a frame, the ascii mode allows 1s between
+# characters
+ASCII_TIMEOUT = 1.0
+
+
+def lrc(data):
+    """
+    Longitudinal redundancy check of `data`: two's complement of the sum
+    of its bytes
+    """
+    return -sum(bytearray(data)) & 0xFF
+
+
+def check_lrc(adu):
+    """
+    True if the binary `adu` ends with the LRC of the bytes before
+    """
+    if len(adu) < 2:
+        return False
+    (expected, ) = struct.unpack_from(">B", adu, len(adu) - 1)
+    return lrc(adu[:-1]) == expected
+
+
+def with_lrc(data):
+    return data + struct.pack(">B", lrc(data))
+
+
+def from_ascii(frame):
+    """
+    Binary adu of an ascii `frame`, None if it holds no hexadecimal pairs
+    """
+    try:
+        return binascii.unhexlify(frame[len(START):-len(END)])
+    except (TypeError, ValueError, binascii.Error):
+        return None
+
+
+def to_ascii(adu):
+    """
+    Ascii frame of the binary `adu`
+    """
+    return START + binascii.hexlify(adu).upper() + END
+
+
+class AsciiFramer(object):
+    """
+    Splits the bytes read from a port into ascii frames, with the interface
+    of :class:`~GJXS.utils.rtu_framing.RtuFramer`. A frame is complete on
+    its CR LF, a ':' restarts the frame, bytes between frames are skipped
+    and a silence of `t35` (the 1s ascii timeout, named as the rtu
+    silence that ends a frame) drops an incomplete frame. `dropped` counts
+    the incomplete frames.
+    """
+    t15 = t35 = ASCII_TIMEOUT
+
+    def __init__(self):
+        self._buffer = b""
+        self._last = 0.0
+        self.dropped = 0
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    def needs_silence(self):
+        # frames end with CR LF, never with a silence
+        return False
+
+    def feed(self, data, now=None):
+        """
+        Adds the bytes of a read, returns the frames they complete
+        """
+        now = time.time() if now is None else now
+        if self._buffer and now - self._last >= self.t35:
+            self.flush()
+        if not data:
+            return []
+        self._last = now
+        buf = self._buffer + data
+        frames = []
+        while True:
+            start = buf.find(START)
+            if start < 0:
+                buf = b""
+                break
+            end = buf.find(END, start)
+            restart = buf.find(START, start + 1)
+            if restart >= 0 and (end < 0 or restart < end):
+                self.dropped += 1
+                buf = buf[restart:]
+                continue
+            if end < 0:
+                buf = buf[start:]
+                break
+            frames.append(buf[start:end + len(END)])
+            buf = buf[end + len(END):]
+        self._buffer = buf
+        return frames
+
+    def flush(self):
+        """
+        Drops the pending bytes, an incomplete frame
+        """
+        if self._buffer:
+            self.dropped += 1
+        self._buffer = b""
+        return []
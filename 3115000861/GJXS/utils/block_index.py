@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from bisect import bisect_right
+
+
+class BlockIndex(object):
+    """
+    Interval index of the non overlapping blocks of one modbus table.
+
+    Blocks are kept sorted by starting address in parallel lists, so
+    finding the block holding an address range is a single bisect,
+    O(log n) whatever the number of blocks of the table.
+
+    The lists are never modified in place: adding or removing a block
+    builds new lists and publishes them with a single assignment (read-copy-
+    update), so lookups need no lock and always see a consistent index.
+    Blocks are added and removed far less often than they are looked up.
+    """
+
+    def __init__(self):
+        self._state = ((), (), ())
+
+    def __len__(self):
+        return len(self._state[2])
+
+    def __iter__(self):
+        return iter(self._state[2])
+
+    def __repr__(self):
+        return '<%s blocks=%d>' % (self.__class__.__name__, len(self))
+
+    def spans(self):
+        """
+        Yields `(starting_address, size, block)` in ascending address order
+        """
+        for start, stop, block in zip(*self._state):
+            yield start, stop - start, block
+
+    def overlapping(self, starting_address, size):
+        """
+        Block overlapping [starting_address, starting_address + size), None
+        if the range is free
+        """
+        starts, stops, blocks = self._state
+        i = bisect_right(starts, starting_address)
+        if i and stops[i - 1] > starting_address:
+            return blocks[i - 1]
+        if i < len(starts) and starts[i] < starting_address + size:
+            return blocks[i]
+        return None
+
+    def add(self, starting_address, size, block):
+        """
+        Indexes `block` as holding [starting_address, starting_address +
+        size). Raises ValueError if it overlaps an indexed block.
+        """
+        if self.overlapping(starting_address, size) is not None:
+            raise ValueError("block %s-%s overlaps an existing block" % (
+                starting_address, starting_address + size - 1))
+        starts, stops, blocks = [list(items) for items in self._state]
+        i = bisect_right(starts, starting_address)
+        starts.insert(i, starting_address)
+        stops.insert(i, starting_address + size)
+        blocks.insert(i, block)
+        self._state = (starts, stops, blocks)
+        return i
+
+    def remove(self, starting_address):
+        """
+        Removes and returns the block starting at `starting_address`, None
+        if there is none.
+        """
+        starts, stops, blocks = self._state
+        i = bisect_right(starts, starting_address) - 1
+        if i < 0 or starts[i] != starting_address:
+            return None
+        block = blocks[i]
+        self._state = (starts[:i] + starts[i + 1:], stops[:i] + stops[i + 1:],
+                       blocks[:i] + blocks[i + 1:])
+        return block
+
+    def clear(self):
+        self._state = ((), (), ())
+
+    def find(self, address, count=1):
+        """
+        Returns `(block, offset)` of the block holding the `count`
+        addresses from `address`, `(None, None)` if no single block does.
+        """
+        starts, stops, blocks = self._state
+        i = bisect_right(starts, address) - 1
+        if i >= 0 and address + count <= stops[i]:
+            return blocks[i], address - starts[i]
+        return None, None
+
+    def split(self, address, count=1):
+        """
+        Returns `(block, offset, count)` runs covering the `count`
+        addresses from `address` across adjacent blocks, None if any of
+        them is in no block.
+        """
+        starts, stops, blocks = self._state
+        i = bisect_right(starts, address) - 1
+        stop = address + count
+        runs = []
+        while address < stop:
+            if i < 0 or i >= len(starts) or not \
+                    starts[i] <= address < stops[i]:
+                return None
+            end = min(stop, stops[i])
+            runs.append((blocks[i], address - starts[i], end - address))
+            address = end
+            i += 1
+        return runs
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Modbus over udp: one mbap request per datagram, all the peers served
+from a single non-blocking socket by the server thread or a
+:class:`~GJXS.utils.reactor.Reactor`, without a thread per peer or per
+datagram. A wakeup reads the datagrams queued (up to `DRAIN_LIMIT`), the
+socket receive buffer is enlarged for the bursts. :class:`DatagramStats`
+counts the datagrams and the drops: malformed requests, responses the
+socket refused and requests the kernel dropped on a full receive buffer
+(Linux only).
+"""
+from __future__ import absolute_import, unicode_literals
+
+import errno
+import logging
+import os
+import socket
+import struct
+import time
+
+log = logging.getLogger(__name__)
+
+# largest mbap adu
+MAX_DATAGRAM = 260
+# receive buffer asked for the socket, bursts of requests queue there
+RECEIVE_BUFFER = 1 << 20
+# datagrams read per wakeup, the other tasks of a reactor get their turn
+DRAIN_LIMIT = 64
+_AGAIN = (errno.EAGAIN, errno.EWOULDBLOCK)
+# sockets of the kernel, with their drop counters
+_PROC_UDP = ("/proc/net/udp", "/proc/net/udp6")
+
+
+def bind_udp(address):
+    """
+    Non-blocking udp socket bound to `address`, with a receive buffer of
+    `RECEIVE_BUFFER` bytes (or the system limit)
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        tune_socket(sock)
+        sock.bind(address)
+    except socket.error:
+        sock.close()
+        raise
+    return sock
+
+
+def tune_socket(sock):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+    sock.setblocking(0)
+
+
+def mbap_request(datagram):
+    """
+    True if `datagram` is a whole mbap request: a 7 bytes header of
+    protocol 0 whose length counts the unit and the pdu that follow
+    """
+    if len(datagram) < 8:
+        return False
+    _, protocol, length = struct.unpack_from(">HHH", datagram)
+    return protocol == 0 and length == len(datagram) - 6
+
+
+def drain(sock, handle, limit=DRAIN_LIMIT):
+    """
+    Calls `handle(datagram, address)` for the datagrams queued on `sock`,
+    `limit` at most. Returns the number read.
+    """
+    for count in range(limit):
+        try:
+            datagram, address = sock.recvfrom(MAX_DATAGRAM + 1)
+        except socket.error as excpt:
+            if excpt.args[0] in _AGAIN:
+                return count
+            raise
+        handle(datagram, address)
+    return limit
+
+
+def kernel_drops(sock):
+    """
+    Datagrams the kernel dropped for `sock` (receive buffer full), None
+    where the counter cannot be read
+    """
+    try:
+        inode = str(os.fstat(sock.fileno()).st_ino)
+    except (OSError, socket.error, ValueError):
+        return None
+    for proc_path in _PROC_UDP:
+        try:
+            with open(proc_path) as proc:
+                for line in proc:
+                    fields = line.split()
+                    if len(fields) > 12 and fields[9] == inode:
+                        return int(fields[12])
+        except (IOError, ValueError):
+            continue
+    return None
+
+
+class DatagramStats(object):
+    """
+    Datagrams of a udp server since :meth:`clear`: requests received,
+    responses sent and the drops, those of the kernel counted on the
+    socket currently bound. Updated by the serving thread only.
+    """
+
+    def __init__(self):
+        self._sock = None
+        self._kernel_drops = None
+        self.clear()
+
+    def bound(self, sock):
+        """
+        Counts the kernel drops of `sock` from now on, a server rebinding
+        on restart keeps the other counters
+        """
+        self._sock = sock
+        self._kernel_drops = kernel_drops(sock)
+
+    def clear(self):
+        self._started = time.time()
+        if self._sock is not None:
+            self._kernel_drops = kernel_drops(self._sock)
+        self.received = 0
+        self.answered = 0
+        self.malformed = 0
+        self.send_errors = 0
+
+    def send(self, sock, data, address):
+        """
+        Sends the response `data` to `address`, a response the socket
+        refuses (buffer full) is dropped
+        """
+        try:
+            sock.sendto(data, address)
+        except socket.error as excpt:
+            self.send_errors += 1
+            log.debug("Response to %s dropped: %s", address, excpt)
+            return
+        self.answered += 1
+
+    def stats(self):
+        """
+        Datagrams received and answered, per second, and the drops with
+        their causes (`kernel` None where unknown)
+        """
+        elapsed = time.time() - self._started
+        kernel = None
+        if self._kernel_drops is not None:
+            current = kernel_drops(self._sock)
+            if current is not None:
+                kernel = current - self._kernel_drops
+        dropped = self.malformed + self.send_errors + (kernel or 0)
+        return {
+            'received': self.received,
+            'answered': self.answered,
+            'per_second': self.received / elapsed if elapsed > 0 else 0.0,
+            'dropped': dropped,
+            'malformed': self.malformed,
+            'send_errors': self.send_errors,
+            'kernel': kernel,
+        }
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+# Datastore change events published through a `ChangeFeed`
+SLAVE_ADDED = "slave_added"
+SLAVE_REMOVED = "slave_removed"
+BLOCK_ADDED = "block_added"
+BLOCK_REMOVED = "block_removed"
+VALUES_CHANGED = "values_changed"
+REQUEST = "request"
+
+
+class ChangeFeed(object):
+    """
+    Fan-out of datastore change events to subscribers.
+
+    Backends publish an event whenever slaves or blocks are added/removed,
+    values are written (by masters, the simulation or the GUI) and requests
+    are served. Subscribers are callables taking
+    `(event, slave_id, block_name, address, old, new)`:
+
+        - `SLAVE_ADDED`/`SLAVE_REMOVED`: only `slave_id` is set.
+        - `BLOCK_ADDED`: `new` holds the initial values of the block.
+        - `BLOCK_REMOVED`: `old` holds the values the block had.
+        - `VALUES_CHANGED`: `old` and `new` hold the values replaced/written
+          from `address` on.
+        - `REQUEST`: `address` holds the function code of the request.
+
+    Subscribers are called on the thread publishing the event and must be
+    cheap. Publishing with no subscribers costs a single truth test.
+    """
+
+    def __init__(self):
+        self._subscribers = ()
+
+    def __nonzero__(self):
+        return bool(self._subscribers)
+
+    __bool__ = __nonzero__
+
+    def subscribe(self, subscriber):
+        if subscriber not in self._subscribers:
+            # copy on write, publishers iterate without locking
+            self._subscribers = self._subscribers + (subscriber,)
+
+    def unsubscribe(self, subscriber):
+        self._subscribers = tuple(s for s in self._subscribers
+                                  if s is not subscriber)
+
+    def publish(self, event, slave_id, block_name=None, address=None,
+                old=(), new=()):
+        for subscriber in self._subscribers:
+            subscriber(event, slave_id, block_name, address, old, new)
+
+
+class BlockView(object):
+    """
+    View of one block of a slave in the backend datastore.
+
+    The backend is the only place register values are stored, the GUI reads
+    and writes them through this view instead of keeping copies. The view
+    resolves the backend `accessor` of its table on first use, views are
+    meant to be short lived (one refresh or sync pass).
+
+    Args:
+        device: `ModbusSimu` instance of either backend.
+        slave_id: Unit id of the slave.
+        block_name: Name of the block, one of `BLOCK_TYPES`.
+    """
+
+    def __init__(self, device, slave_id, block_name):
+        self._device = device
+        self.slave_id = slave_id
+        self.block_name = block_name
+        self._table = None
+
+    def __repr__(self):
+        return '<%s slave=%s block=%s>' % (self.__class__.__name__,
+                                           self.slave_id, self.block_name)
+
+    def __getitem__(self, address):
+        return self.read(address)[0]
+
+    def get(self, address, default=None):
+        """
+        Value at `address` or `default` if the backend can't provide it
+        (missing slave/block or out of block address).
+        """
+        try:
+            values = self.read(address)
+        except Exception:
+            # modbus_tk raises for out of block reads, pymodbus returns None
+            return default
+        return values[0] if values else default
+
+    def _accessor(self):
+        table = self._table
+        if table is None:
+            table = self._table = self._device.accessor(self.slave_id,
+                                                        self.block_name)
+        return table
+
+    def read(self, address, count=1):
+        values = self._accessor().read(address, count)
+        return list(values) if values is not None else []
+
+    def write(self, address, values):
+        self._accessor().write(address, list(values))
+
+    def write_map(self, changes):
+        """
+        Writes `changes` (address -> value) with one backend call per run of
+        consecutive addresses.
+        """
+        start, run = None, []
+        for address in sorted(changes):
+            if run and address != start + len(run):
+                self.write(start, run)
+                run = []
+            if not run:
+                start = address
+            run.append(changes[address])
+        if run:
+            self.write(start, run)
@@ -0,0 +1,625 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import importlib
+import logging
+import multiprocessing
+import threading
+import time
+from multiprocessing.sharedctypes import RawArray
+from random import randint
+
+from GJXS.utils.block_index import BlockIndex
+from GJXS.utils.datastore import (
+    SLAVE_REMOVED, BLOCK_ADDED, BLOCK_REMOVED, VALUES_CHANGED)
+from GJXS.utils.reactor import Reactor
+from GJXS.utils.slave_template import as_template
+from GJXS.utils.stats import PlantStats
+
+log = logging.getLogger(__name__)
+
+BACKENDS = {
+    "modbus_tk": "GJXS.utils.modbus",
+    "pymodbus": "GJXS.utils.pymodbus_server"
+}
+
+# registers of the shared memory, 4MB
+MEMORY_SIZE = 1 << 21
+
+
+def _context():
+    """
+    multiprocessing context of the engine, `spawn` when available so the
+    engine does not inherit the GUI threads and window
+    """
+    get_context = getattr(multiprocessing, "get_context", None)
+    return get_context("spawn") if get_context else multiprocessing
+
+
+class SharedRegisters(object):
+    """
+    Register memory shared by the engine process and the GUI process.
+
+    The engine copies every block of the datastore to a segment of an
+    array of unsigned 16 bit words, the GUI reads the registers there
+    without any round trip to the engine. The engine is the only writer, a
+    version counter kept odd while it writes makes every :meth:`read_runs`
+    a consistent snapshot (a sequence lock across processes).
+
+    Args:
+        size: Number of registers of the memory.
+    """
+
+    def __init__(self, size=MEMORY_SIZE):
+        self.size = size
+        self.words = RawArray(str("H"), size)
+        self.version = RawArray(str("L"), 1)
+
+    def __repr__(self):
+        return '<%s size=%d>' % (self.__class__.__name__, self.size)
+
+    def write(self, offset, values):
+        """
+        Writes `values` from `offset`, engine side and under the lock of
+        the writer
+        """
+        version = self.version
+        version[0] += 1
+        try:
+            self.words[offset:offset + len(values)] = values
+        finally:
+            version[0] += 1
+
+    def read_runs(self, runs):
+        """
+        Values of `(offset, count)` runs, retried until no write of the
+        engine overlapped the read
+        """
+        words = self.words
+        version = self.version
+        while True:
+            start = version[0]
+            if start & 1:
+                time.sleep(0)
+                continue
+            values = []
+            for offset, count in runs:
+                values.extend(words[offset:offset + count])
+            if version[0] == start:
+                return values
+
+
+class SegmentAllocator(object):
+    """
+    First fit allocation of the segments of a :class:`SharedRegisters`,
+    free segments are merged with their free neighbours
+    """
+
+    def __init__(self, size):
+        self._free = [(0, size)]
+
+    def allocate(self, size):
+        return self._take(self._free, size)
+
+    def available(self):
+        return sum(free for _, free in self._free)
+
+    def check(self, sizes):
+        """
+        Raises MemoryError unless segments of `sizes` can be allocated,
+        leaves the free segments untouched
+        """
+        segments = list(self._free)
+        try:
+            for size in sizes:
+                self._take(segments, size)
+        except MemoryError:
+            raise MemoryError(
+                "%d registers do not fit in the shared memory (%d left)" %
+                (sum(sizes), self.available()))
+
+    @staticmethod
+    def _take(segments, size):
+        for i, (offset, free) in enumerate(segments):
+            if free >= size:
+                if free == size:
+                    del segments[i]
+                else:
+                    segments[i] = (offset + size, free - size)
+                return offset
+        raise MemoryError("no %d registers left in the shared memory" %
+                          size)
+
+    def free(self, offset, size):
+        segments = self._free
+        i = 0
+        while i < len(segments) and segments[i][0] < offset:
+            i += 1
+        segments.insert(i, (offset, size))
+        if i + 1 < len(segments) and offset + size == segments[i + 1][0]:
+            segments[i] = (offset, size + segments.pop(i + 1)[1])
+        if i and segments[i - 1][0] + segments[i - 1][1] == offset:
+            previous = segments.pop(i - 1)
+            segments[i - 1] = (previous[0], previous[1] + segments[i - 1][1])
+
+
+class SharedMirror(object):
+    """
+    Change feed subscriber of the engine copying the datastore to a
+    :class:`SharedRegisters`. The segments of the blocks of each table are
+    indexed by address, :meth:`changes` returns the layout of the slaves
+    whose blocks were added or removed since the last call.
+    """
+
+    def __init__(self, memory):
+        self.memory = memory
+        self._allocator = SegmentAllocator(memory.size)
+        self._lock = threading.Lock()
+        # slave_id -> {table: BlockIndex of segment offsets}
+        self._tables = {}
+        self._changed = set()
+
+    def __call__(self, event, slave_id, block_name, address, old, new):
+        if event == VALUES_CHANGED:
+            self._write(slave_id, block_name, address, new)
+        elif event == BLOCK_ADDED:
+            self._add(slave_id, block_name, address, new)
+        elif event == BLOCK_REMOVED:
+            self._remove(slave_id, block_name, address)
+        elif event == SLAVE_REMOVED:
+            self._remove_slave(slave_id)
+
+    def _write(self, slave_id, table, address, values):
+        index = self._tables.get(slave_id, {}).get(table)
+        runs = index.split(address, len(values)) if index else None
+        if runs is None:
+            return
+        with self._lock:
+            written = 0
+            for offset, start, count in runs:
+                self.memory.write(offset + start,
+                                  values[written:written + count])
+                written += count
+
+    def _add(self, slave_id, table, starting_address, values):
+        size = len(values)
+        with self._lock:
+            offset = self._allocator.allocate(size)
+            index = self._tables.setdefault(slave_id, {}).setdefault(
+                table, BlockIndex())
+            index.add(starting_address, size, offset)
+            self.memory.write(offset, list(values))
+            self._changed.add(slave_id)
+
+    def _remove(self, slave_id, table, starting_address):
+        with self._lock:
+            index = self._tables.get(slave_id, {}).get(table)
+            spans = dict((start, (size, offset)) for start, size, offset
+                         in (index.spans() if index else ()))
+            if starting_address not in spans:
+                return
+            index.remove(starting_address)
+            self._allocator.free(spans[starting_address][1],
+                                 spans[starting_address][0])
+            self._changed.add(slave_id)
+
+    def _remove_slave(self, slave_id):
+        with self._lock:
+            for index in self._tables.pop(slave_id, {}).values():
+                for _, size, offset in index.spans():
+                    self._allocator.free(offset, size)
+            self._changed.add(slave_id)
+
+    def reserve(self, sizes):
+        """
+        Checks that blocks of `sizes` fit in the memory, before the
+        datastore is changed: a block the mirror cannot copy would leave
+        the datastore half updated
+        """
+        with self._lock:
+            self._allocator.check(sizes)
+
+    def discard(self, slave_ids):
+        """
+        Frees the segments of `slave_ids`, rolling back a failed add
+        """
+        for slave_id in slave_ids:
+            self._remove_slave(slave_id)
+
+    def layout(self, slave_id):
+        """
+        `{table: [(starting_address, size, offset)]}` of `slave_id`, None
+        if it has no block
+        """
+        tables = self._tables.get(slave_id)
+        if not tables:
+            return None
+        return dict((table, list(index.spans()))
+                    for table, index in tables.items())
+
+    def changes(self):
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            return dict((slave_id, self.layout(slave_id))
+                        for slave_id in changed)
+
+
+class Simulation(object):
+    """
+    Random values written by the engine to tables of a slave every
+    `interval` seconds, from a task of the engine reactor
+    """
+
+    def __init__(self, device, reactor):
+        self._device = device
+        self._reactor = reactor
+        self._task = None
+        self.slave_id = None
+        self.tables = {}
+
+    def start(self, slave_id, tables, interval):
+        """
+        Simulates `tables`, `{block_name: (runs, minval, maxval)}` with
+        `runs` the `(address, count)` runs of registers to simulate.
+        Updates the running simulation if any.
+        """
+        self.slave_id = slave_id
+        self.tables = tables
+        if self._task is None:
+            self._task = self._reactor.call_every("simulation", interval,
+                                                  self._tick)
+        else:
+            self._task.interval = interval
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _tick(self):
+        slave_id = self.slave_id
+        for block_name, (runs, minval, maxval) in self.tables.items():
+            table = self._device.accessor(slave_id, block_name)
+            for address, count in runs:
+                table.write(address, [randint(minval, maxval)
+                                      for _ in range(count)])
+
+
+class Engine(object):
+    """
+    Engine process side of an :class:`EngineProxy`: the `ModbusSimu` of the
+    backend, served with the simulation by a
+    :class:`~GJXS.utils.reactor.Reactor`, and the mirror of its datastore
+    in the shared memory
+    """
+
+    def __init__(self, backend, memory, server, kwargs):
+        module = importlib.import_module(BACKENDS[backend])
+        self.device = module.ModbusSimu(server=server, **kwargs)
+        self.reactor = Reactor("modbus_engine")
+        self.mirror = SharedMirror(memory)
+        self.plant_stats = PlantStats()
+        self.device.feed.subscribe(self.mirror)
+        self.device.feed.subscribe(self.plant_stats)
+        self.simulation = Simulation(self.device, self.reactor)
+        self._targets = {
+            "device": self.device,
+            "engine": self,
+            "monitor": self.device.monitor,
+            "plant_stats": self.plant_stats,
+            "reactor": self.reactor,
+            "simulation": self.simulation
+        }
+        self.reactor.start()
+
+    def add_slaves(self, slave_ids, blocks=()):
+        """
+        `ModbusSimu.add_slaves` once the blocks of the new slaves fit in the
+        shared memory, the slaves added are removed again if it fails
+        """
+        template = as_template(blocks)
+        new_ids = set(slave_ids) - set(self.device.get_slaves() or ())
+        self.mirror.reserve([size for _ in new_ids
+                             for _, _, _, size in template])
+        try:
+            return self.device.add_slaves(slave_ids, template)
+        except Exception:
+            self.device.remove_slaves(sorted(new_ids))
+            self.mirror.discard(new_ids)
+            raise
+
+    def add_block(self, slave_id, block_name, block_type, starting_add, size):
+        self.mirror.reserve([size])
+        self.device.add_block(slave_id, block_name, block_type, starting_add,
+                              size)
+
+    def call(self, target, method, args):
+        if target == "device" and method == "start":
+            return self.device.start(self.reactor)
+        return getattr(self._targets[target], method)(*args)
+
+    def close(self):
+        self.simulation.stop()
+        self.device.close()
+        self.reactor.stop()
+
+
+def _reply(conn, reply):
+    try:
+        conn.send(reply)
+    except Exception as excpt:
+        # unpicklable result or exception
+        conn.send(("error", RuntimeError(repr(excpt)), reply[2]))
+
+
+def _serve(conn, backend, memory, server, kwargs):
+    """
+    Main function of the engine process, serves the calls of the proxy
+    until it exits or its end of the pipe is closed
+    """
+    try:
+        engine = Engine(backend, memory, server, kwargs)
+    except Exception as excpt:
+        _reply(conn, ("error", excpt, {}))
+        return
+    _reply(conn, ("ok", engine.device.master_path, {}))
+    while True:
+        try:
+            target, method, args = conn.recv()
+        except (EOFError, IOError):
+            break
+        if target is None:
+            break
+        try:
+            reply = ("ok", engine.call(target, method, args))
+        except Exception as excpt:
+            reply = ("error", excpt)
+        _reply(conn, reply + (engine.mirror.changes(), ))
+    engine.close()
+    conn.close()
+
+
+class RemoteObject(object):
+    """
+    Object of the engine process, its methods called through an
+    :class:`EngineProxy`
+    """
+
+    def __init__(self, proxy, target):
+        self._proxy = proxy
+        self._target = target
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        def call(*args):
+            return self._proxy._call(self._target, method, *args)
+        return call
+
+
+class SharedTable(object):
+    """
+    Accessor of a table of an :class:`EngineProxy`: reads from the shared
+    memory, writes through the engine
+    """
+
+    def __init__(self, proxy, slave_id, block_name):
+        self._proxy = proxy
+        self.slave_id = slave_id
+        self.block_name = block_name
+
+    def read(self, address, count=1):
+        index = self._proxy._layout.get(self.slave_id, {}).get(
+            self.block_name)
+        runs = index.split(address, count) if index else None
+        if runs is None:
+            return None
+        return self._proxy.memory.read_runs(
+            [(offset + start, run) for offset, start, run in runs])
+
+    def write(self, address, values):
+        self._proxy.set_values(self.slave_id, self.block_name, address,
+                               values)
+        return True
+
+
+class EngineProxy(object):
+    """
+    `ModbusSimu` of a backend running in an engine process of its own,
+    with the simulation, so that the GUI (rendering, list repopulation)
+    never holds the interpreter lock of the server.
+
+    Register values are read from a :class:`SharedRegisters` the engine
+    keeps up to date, without leaving the GUI process. Everything else
+    (datastore changes, writes, start/stop, request monitor and plant
+    statistics) is a call to the engine through a pipe::
+
+        device = EngineProxy("pymodbus", server="tcp", port=5440)
+        device.add_slaves([1, 2], profile.template())
+        device.start()
+        values = device.get_values(1, "Function_C03", 0, 10)
+        device.simulate(1, {"Function_C03": ([(0, 10)], 0, 100)}, 1.0)
+        device.close()
+
+    Args:
+        backend: `modbus_tk` or `pymodbus`.
+        server: `tcp`, `udp`, `rtu_tcp`, `rtu` or `ascii`.
+        memory_size: Registers of the shared memory.
+        kwargs: `ModbusSimu` arguments, with a serial server and
+            `port="pty"` the engine serves a pty line of its own, see
+            :attr:`master_path`.
+    """
+
+    def __init__(self, backend="modbus_tk", server="tcp",
+                 memory_size=MEMORY_SIZE, **kwargs):
+        context = _context()
+        self._server_type = server
+        self._port = kwargs.get('port', None)
+        self._lock = threading.Lock()
+        self._paused = False
+        # slave_id -> {table: BlockIndex of segment offsets}
+        self._layout = {}
+        self.memory = SharedRegisters(memory_size)
+        self._conn, child = context.Pipe()
+        self._process = context.Process(
+            target=_serve, name="modbus_engine",
+            args=(child, backend, self.memory, server, kwargs))
+        self._process.daemon = True
+        self._process.start()
+        child.close()
+        self.monitor = RemoteObject(self, "monitor")
+        self.plant_stats = RemoteObject(self, "plant_stats")
+        self.reactor = RemoteObject(self, "reactor")
+        with self._lock:
+            self._master_path = self._receive()
+
+    def __repr__(self):
+        return '<%s %s:%s pid=%s>' % (self.__class__.__name__,
+                                      self._server_type, self._port,
+                                      self._process.pid)
+
+    @property
+    def server_type(self):
+        return self._server_type
+
+    @property
+    def port(self):
+        return self._port
+
+    @property
+    def master_path(self):
+        """
+        Tty of the rtu line of the engine for the masters, see
+        `ModbusSimu.master_path`
+        """
+        return self._master_path
+
+    def _receive(self):
+        reply = self._conn.recv()
+        status, result, changes = reply
+        for slave_id, tables in changes.items():
+            if tables is None:
+                self._layout.pop(slave_id, None)
+                continue
+            layout = {}
+            for table, spans in tables.items():
+                index = layout[table] = BlockIndex()
+                for start, size, offset in spans:
+                    index.add(start, size, offset)
+            self._layout[slave_id] = layout
+        if status == "error":
+            raise result
+        return result
+
+    def _call(self, target, method, *args):
+        with self._lock:
+            if self._conn is None:
+                raise RuntimeError("modbus engine is closed")
+            self._conn.send((target, method, args))
+            return self._receive()
+
+    def add_slave(self, slave_id):
+        self._call("device", "add_slave", slave_id)
+
+    def remove_slave(self, slave_id):
+        self._call("device", "remove_slave", slave_id)
+
+    def add_slaves(self, slave_ids, blocks=()):
+        return self._call("engine", "add_slaves", list(slave_ids), blocks)
+
+    def remove_slaves(self, slave_ids):
+        return self._call("device", "remove_slaves", list(slave_ids))
+
+    def remove_all_slave(self):
+        self._call("device", "remove_all_slave")
+
+    def add_block(self, slave_id, block_name, block_type, starting_add, size):
+        self._call("engine", "add_block", slave_id, block_name, block_type,
+                   starting_add, size)
+
+    def remove_block(self, slave_id, block_name):
+        self._call("device", "remove_block", slave_id, block_name)
+
+    def remove_all_blocks(self, slave_id):
+        self._call("device", "remove_all_blocks", slave_id)
+
+    def accessor(self, slave_id, block_name):
+        return SharedTable(self, slave_id, block_name)
+
+    def set_values(self, slave_id, block_name, address, values):
+        self._call("device", "set_values", slave_id, block_name, address,
+                   list(values))
+
+    def get_values(self, slave_id, block_name, address, size=1):
+        return self.accessor(slave_id, block_name).read(address, size)
+
+    def get_slaves(self):
+        return sorted(self._layout)
+
+    def lock_stats(self):
+        return self._call("device", "lock_stats")
+
+    def set_response_delay(self, slave_id, delay):
+        self._call("device", "set_response_delay", slave_id, delay)
+
+    def bus_stats(self):
+        return self._call("device", "bus_stats")
+
+    def datagram_stats(self):
+        return self._call("device", "datagram_stats")
+
+    def start(self, reactor=None):
+        """
+        Starts the server, from the reactor of the engine (`reactor` is
+        ignored)
+        """
+        self._call("device", "start")
+        self._paused = False
+
+    def stop(self):
+        self._call("device", "stop")
+        self._paused = False
+
+    @property
+    def paused(self):
+        return self._paused
+
+    def pause(self):
+        """
+        Pauses the server of the engine, see `ModbusSimu.pause`
+        """
+        self._call("device", "pause")
+        self._paused = True
+
+    def resume(self):
+        self._call("device", "resume")
+        self._paused = False
+
+    def simulate(self, slave_id, tables, interval):
+        """
+        Starts or updates the simulation of `tables` of `slave_id`, see
+        :meth:`Simulation.start`
+        """
+        self._call("simulation", "start", slave_id, tables, interval)
+
+    def stop_simulation(self):
+        self._call("simulation", "stop")
+
+    def close(self):
+        """
+        Stops the engine process
+        """
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                self._conn.send((None, None, ()))
+            except IOError:
+                pass
+            self._conn.close()
+            self._conn = None
+        self._process.join(5)
+        if self._process.is_alive():
+            self._process.terminate()
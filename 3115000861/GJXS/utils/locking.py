@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import time
+from contextlib import contextmanager
+from threading import RLock, current_thread
+
+LOCK_STATS = ("reads", "read_retries", "read_waits", "read_wait_time",
+              "writes", "write_waits", "write_wait_time")
+
+
+class StoreLock(object):
+    """
+    Writers lock of a datastore table or slave, with contention counters.
+
+    Register values are published read-copy-update by
+    :class:`~GJXS.utils.slave_template.CowRegisters` and block lookups by
+    :class:`~GJXS.utils.block_index.BlockIndex`, so only writers serialize
+    (`with lock:`) while readers go through :meth:`read` without locking
+    and never wait behind the simulation or the GUI writing::
+
+        with lock:
+            block[offset:offset + count] = values
+        values = lock.read(block.__getitem__, slice(offset, offset + count))
+
+    A write to one block is published at once, so a read within one block
+    is a consistent snapshot. Writes spanning several blocks are made
+    under :meth:`spanning`, which keeps `version` odd while they run, and
+    reads spanning several blocks go through :meth:`read_spanning`, which
+    retries them until no such write overlapped them (a sequence lock
+    restricted to the rare multi-block accesses)::
+
+        with lock.spanning():
+            first[14:16] = words[:2]
+            second[0:2] = words[2:]
+        words = lock.read_spanning(read_both)
+
+    Write counters are exact, read counters are updated without locking and
+    may miss increments under concurrent readers.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self._owner = None
+        self.version = 0
+        self.reads = 0
+        self.read_retries = 0
+        self.read_waits = 0
+        self.read_wait_time = 0.0
+        self.writes = 0
+        self.write_waits = 0
+        self.write_wait_time = 0.0
+
+    def _acquire(self):
+        """
+        Acquires the lock, returns the time spent waiting for it
+        """
+        lock = self._lock
+        if lock.acquire(False):
+            return 0.0
+        started = time.time()
+        lock.acquire()
+        return time.time() - started
+
+    def __enter__(self):
+        waited = self._acquire()
+        if waited:
+            self.write_waits += 1
+            self.write_wait_time += waited
+        self.writes += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+    @contextmanager
+    def spanning(self):
+        """
+        Writers lock for writes spanning several blocks
+        """
+        with self:
+            self._owner = current_thread()
+            self.version += 1
+            try:
+                yield self
+            finally:
+                self.version += 1
+                self._owner = None
+
+    def read(self, func, *args):
+        """
+        Returns `func(*args)`, `func` reading published values of one block
+        """
+        self.reads += 1
+        return func(*args)
+
+    def read_spanning(self, func, *args):
+        """
+        Returns `func(*args)`, `func` reading several blocks, retried until
+        no write spanning blocks overlapped it
+        """
+        self.reads += 1
+        while True:
+            version = self.version
+            if version & 1:
+                if self._owner is current_thread():
+                    # read from within the spanning write of this thread
+                    return func(*args)
+                self.read_retries += 1
+                time.sleep(0)
+                continue
+            result = func(*args)
+            if self.version == version:
+                return result
+            self.read_retries += 1
+
+    def stats(self):
+        return dict((name, getattr(self, name)) for name in LOCK_STATS)
+
+
+class MutexLock(StoreLock):
+    """
+    :class:`StoreLock` with readers taking the writers lock, as the
+    datastore used to. Kept to compare both schemes, see
+    `tools/bench_locking.py`.
+    """
+
+    def read(self, func, *args):
+        waited = self._acquire()
+        try:
+            self.reads += 1
+            if waited:
+                self.read_waits += 1
+                self.read_wait_time += waited
+            return func(*args)
+        finally:
+            self._lock.release()
+
+    read_spanning = read
+
+
+def merge_stats(locks):
+    """
+    Sums the :meth:`StoreLock.stats` of `locks`
+    """
+    total = dict.fromkeys(LOCK_STATS, 0)
+    for lock in locks:
+        for name in LOCK_STATS:
+            total[name] += getattr(lock, name)
+    return total
@@ -4,14 +4,43 @@ from __future__ import absolute_import, unicode_literals
 
 import logging
 import os
+import select
+import socket
+import time
 
 import serial
 from modbus_tk.defines import (
-    COILS, DISCRETE_INPUTS, HOLDING_REGISTERS, ANALOG_INPUTS)
-from modbus_tk.modbus_rtu import RtuServer, RtuMaster
+    COILS, DISCRETE_INPUTS, HOLDING_REGISTERS, ANALOG_INPUTS,
+    ILLEGAL_DATA_ADDRESS, ILLEGAL_DATA_VALUE, READ_COILS,
+    READ_DISCRETE_INPUTS, READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS)
+from modbus_tk import hooks
+from modbus_tk.hooks import call_hooks
+from modbus_tk.exceptions import (
+    DuplicatedKeyError, InvalidArgumentError, InvalidModbusBlockError,
+    MissingKeyError, ModbusError, ModbusInvalidRequestError,
+    OutOfModbusBlockError, OverlapModbusBlockError)
+from modbus_tk.modbus import Databank, ModbusBlock, Slave
+from modbus_tk.modbus_rtu import RtuQuery, RtuServer, RtuMaster
 from modbus_tk.modbus_tcp import TcpServer, TcpMaster
 
+from GJXS.utils.ascii_framing import (
+    AsciiFramer, check_lrc, from_ascii, to_ascii, with_lrc)
+from GJXS.utils.block_index import BlockIndex
 from GJXS.utils.common import path, make_dir, remove_file
+from GJXS.utils.datagram import (
+    DatagramStats, bind_udp, drain, mbap_request)
+from GJXS.utils.datastore import (
+    ChangeFeed, SLAVE_ADDED, SLAVE_REMOVED, BLOCK_ADDED, BLOCK_REMOVED,
+    VALUES_CHANGED, REQUEST)
+from GJXS.utils.locking import StoreLock, merge_stats
+from GJXS.utils.monitor import RequestMonitor, decode_pdu, decode_exception
+from GJXS.utils.pty_link import PTY_PORT, PtyLink, tty_settings
+from GJXS.utils.rtu_bus import RtuBus, frame_unit
+from GJXS.utils.rtu_framing import (
+    RtuFramer, crc_cache, read_frames, stream_frames)
+from GJXS.utils.slave_template import as_registers, as_template
+
+log = logging.getLogger(__name__)
 
 ADDRESS_RANGE = {
     COILS: 0,
@@ -30,20 +59,537 @@ REGISTER_QUERY_FIELDS = {"bit": range(0, 16),
                          "wordcount": 1,
                          "wordorder": ["big", "little"]}
 
-SERVERS = {
-    "tcp": TcpServer,
-    "rtu": RtuServer
-}
-
 MASTERS = {
     "tcp": TcpMaster,
     "rtu": RtuMaster
 }
 
+class MonitoredServerMixin(object):
+    """
+    Records every request handled by a modbus_tk server, with the client,
+    the time spent handling it and the exception code returned if any, in
+    the server `monitor` (a :class:`~GJXS.utils.monitor.RequestMonitor`).
+    """
+    monitor = None
+    # bytes before/after the pdu in a request or response adu
+    _PDU_SLICE = slice(None)
+    _UNIT_INDEX = 0
+
+    def _client(self):
+        return None
+
+    def _handle(self, request):
+        monitor = self.monitor
+        if monitor is None or not monitor.enabled:
+            return super(MonitoredServerMixin, self)._handle(request)
+        started = time.time()
+        response = super(MonitoredServerMixin, self)._handle(request)
+        latency = time.time() - started
+        try:
+            (unit, ) = struct.unpack_from(">B", request, self._UNIT_INDEX)
+            function_code, address, count = decode_pdu(
+                request[self._PDU_SLICE])
+        except struct.error:
+            # too short to be decoded, modbus_tk already logged it
+            return response
+        exception = decode_exception(response[self._PDU_SLICE]
+                                     if response else None)
+        monitor.record(self._client(), unit, function_code, address, count,
+                       latency, exception)
+        return response
+
+
+class PausableServerMixin(object):
+    """
+    Pause of a modbus_tk server: requests are still read but discarded
+    unanswered, while the listening socket or serial port, the client
+    connections and the server thread or reactor task are kept, so that
+    resuming is a flag flip.
+    """
+    paused = False
+
+    def _handle(self, request):
+        if self.paused:
+            return None
+        return super(PausableServerMixin, self)._handle(request)
+
+
+class ReactorServerMixin(object):
+    """
+    Serves a modbus_tk server from a :class:`~GJXS.utils.reactor.Reactor`
+    instead of its own thread. `_do_run` runs whenever the listening
+    socket, a client socket or the serial port is readable, its `select`
+    then returns at once.
+    """
+    READER_NAME = "modbus_server"
+    _reactor = None
+
+    @property
+    def attached(self):
+        return self._reactor is not None
+
+    @property
+    def reader_name(self):
+        """
+        Reactor task of the server, one per endpoint so that many servers
+        share a reactor
+        """
+        return "%s %s" % (self.READER_NAME, self._endpoint())
+
+    @property
+    def _poll_timeout(self):
+        """
+        Wait of the `select` of `_do_run`: none from the reactor, which
+        calls it once ready
+        """
+        return 0 if self._reactor is not None else 1.0
+
+    def _endpoint(self):
+        raise NotImplementedError()
+
+    def _readable(self):
+        raise NotImplementedError()
+
+    def attach(self, reactor):
+        self._do_init()
+        self._reactor = reactor
+        reactor.add_reader(self.reader_name, self._readable,
+                           lambda ready: self._do_run())
+
+    def detach(self):
+        reactor, self._reactor = self._reactor, None
+        if reactor is not None:
+            reactor.run_sync(self._detach, reactor)
+
+    def _detach(self, reactor):
+        reactor.remove_reader(self.reader_name)
+        self._do_exit()
+
+
+class MbapFramer(object):
+    """
+    Splits the bytes read from a tcp client into mbap requests, on the
+    length of their header: several requests in one read, or one across
+    reads
+    """
+    # unit and pdu counted by the header, at least a function code
+    _LENGTHS = (2, 254)
+
+    def __init__(self):
+        self._buffer = b""
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    def feed(self, data):
+        """
+        Adds the bytes of a read, returns the requests they complete.
+        Raises ModbusInvalidRequestError on a length no request has.
+        """
+        buf = self._buffer + data
+        frames = []
+        while len(buf) >= 6:
+            (length, ) = struct.unpack_from(">H", buf, 4)
+            if not self._LENGTHS[0] <= length <= self._LENGTHS[1]:
+                self._buffer = b""
+                raise ModbusInvalidRequestError(
+                    "Invalid mbap length {0}".format(length))
+            if len(buf) < length + 6:
+                break
+            frames.append(buf[:length + 6])
+            buf = buf[length + 6:]
+        self._buffer = buf
+        return frames
+
+
+class SimuTcpServer(ReactorServerMixin, PausableServerMixin,
+                    MonitoredServerMixin, TcpServer):
+    """
+    TcpServer reading its clients without blocking: what a client sent is
+    split into requests by its :class:`MbapFramer` and only whole requests
+    are handled, so that a client sending a partial request delays no
+    other client, nor the other tasks of a reactor
+    """
+    _PDU_SLICE = slice(7, None)
+    _UNIT_INDEX = 6
+
+    def __init__(self, *args, **kwargs):
+        super(SimuTcpServer, self).__init__(*args, **kwargs)
+        self._peers = {}
+        self._peer = None
+        # client socket -> framer of its requests
+        self._framers = {}
+
+    def _do_init(self):
+        """
+        Binds the listening socket, with SO_REUSEADDR so that a restart
+        does not fail on the connections of the previous run left in
+        TIME_WAIT
+        """
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if os.name != "nt":
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self._timeout_in_sec:
+            self._sock.settimeout(self._timeout_in_sec)
+        self._sock.setblocking(0)
+        self._sock.bind(self._sa)
+        self._sock.listen(10)
+        self._sockets.append(self._sock)
+
+    def _do_exit(self):
+        """
+        Closes the listening socket and every client connection
+        """
+        sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            try:
+                sock.close()
+            except socket.error as msg:
+                log.warning("Error while closing socket: %s", msg)
+        self._framers.clear()
+        self._sock = None
+
+    def _do_run(self):
+        try:
+            ready = select.select(self._sockets, [], [],
+                                  self._poll_timeout)[0]
+        except (select.error, socket.error, ValueError):
+            # sockets closed by `_do_exit`
+            return
+        for sock in ready:
+            if sock is self._sock:
+                self._accept()
+                continue
+            try:
+                data = sock.recv(1024)
+            except socket.error as msg:
+                log.warning("Error while reading socket %d: %s",
+                            sock.fileno(), msg)
+                data = b""
+            if not data:
+                self._disconnect(sock)
+                continue
+            self._peer = self._peers.get(sock)
+            try:
+                requests = self._requests(self._framers[sock], data)
+            except ModbusInvalidRequestError as excpt:
+                log.warning("Closing %s: %s", self._peer, excpt)
+                self._disconnect(sock)
+                continue
+            for request in requests:
+                try:
+                    response = self._handle(request)
+                    if response:
+                        sock.sendall(response)
+                except Exception as excpt:
+                    log.error("Error while handling request: %s", excpt)
+                    call_hooks("modbus_tcp.TcpServer.on_error",
+                               (self, sock, excpt))
+
+    def _client_framer(self):
+        return MbapFramer()
+
+    def _requests(self, framer, data):
+        """
+        Requests completed by `data`, read from the client of `framer`
+        """
+        return framer.feed(data)
+
+    def _accept(self):
+        try:
+            client, address = self._sock.accept()
+        except socket.error:
+            return
+        # reads follow select, the timeout bounds the writes
+        client.settimeout(1.0)
+        self._sockets.append(client)
+        self._framers[client] = self._client_framer()
+        call_hooks("modbus_tcp.TcpServer.on_connect",
+                   (self, client, address))
+
+    def _disconnect(self, sock):
+        call_hooks("modbus_tcp.TcpServer.on_disconnect", (self, sock))
+        self._framers.pop(sock, None)
+        self._sockets.remove(sock)
+        sock.close()
+
+    def _client(self):
+        return self._peer
+
+    def _endpoint(self):
+        return "%s:%s" % self._sa
+
+    def _readable(self):
+        return self._sockets
+
+
+class SimuUdpServer(SimuTcpServer):
+    """
+    Modbus over udp: mbap requests, one per datagram, answered to their
+    sender from the single socket of the server (see
+    :mod:`GJXS.utils.datagram`), with the datagrams counted in
+    `datagrams`
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SimuUdpServer, self).__init__(*args, **kwargs)
+        self.datagrams = DatagramStats()
+
+    def _do_init(self):
+        self._sock = bind_udp(self._sa)
+        self._sockets.append(self._sock)
+        self.datagrams.bound(self._sock)
+
+    def _do_run(self):
+        try:
+            ready = select.select(self._sockets, [], [],
+                                  self._poll_timeout)[0]
+        except (select.error, socket.error, ValueError):
+            # socket closed by `_do_exit`
+            return
+        if ready:
+            drain(self._sock, self._datagram)
+
+    def _datagram(self, datagram, address):
+        datagrams = self.datagrams
+        datagrams.received += 1
+        if not mbap_request(datagram):
+            datagrams.malformed += 1
+            return
+        self._peer = "%s:%s" % address[:2]
+        try:
+            response = self._handle(datagram)
+        except Exception as excpt:
+            log.error("Error while handling request: %s", excpt)
+            return
+        if response:
+            datagrams.send(self._sock, response, address)
+
+    def _endpoint(self):
+        return "udp %s:%s" % self._sa
+
+
+class SimuRtuTcpServer(SimuTcpServer):
+    """
+    Rtu frames over tcp, as served by serial gateways: no mbap header, the
+    requests of a client are split by an
+    :class:`~GJXS.utils.rtu_framing.RtuFramer` without silences (several
+    per read, or one across reads) and checked with
+    :data:`~GJXS.utils.rtu_framing.crc_cache`.
+    """
+    _PDU_SLICE = slice(1, -2)
+    _UNIT_INDEX = 0
+
+    def _make_query(self):
+        return SimuRtuQuery()
+
+    def _client_framer(self):
+        return RtuFramer(silences=False)
+
+    def _requests(self, framer, data):
+        requests = []
+        for request in stream_frames(framer, data):
+            if crc_cache.check(request):
+                requests.append(request)
+            else:
+                log.debug("Invalid CRC in request from %s", self._peer)
+        return requests
+
+
+class SimuRtuQuery(RtuQuery):
+    """
+    RtuQuery checking and building the CRCs with
+    :data:`~GJXS.utils.rtu_framing.crc_cache` rather than the bit by bit
+    `calculate_crc` of modbus_tk
+    """
+
+    def parse_request(self, request):
+        if len(request) < 3:
+            raise ModbusInvalidRequestError(
+                "Request length is invalid {0}".format(len(request)))
+        (self._request_address, ) = struct.unpack(">B", request[0:1])
+        if not crc_cache.check(request):
+            raise ModbusInvalidRequestError("Invalid CRC in request")
+        return self._request_address, request[1:-2]
+
+    def build_response(self, response_pdu):
+        self._response_address = self._request_address
+        data = struct.pack(">B", self._response_address) + response_pdu
+        return data + crc_cache.trailer(data)
+
+
+class SimuRtuServer(ReactorServerMixin, PausableServerMixin,
+                    MonitoredServerMixin, RtuServer):
+    """
+    RtuServer splitting the requests with a
+    :class:`~GJXS.utils.rtu_framing.RtuFramer`: a request is handled as
+    soon as its last byte is read rather than after a read timeout, and
+    the response is not followed by a t3.5 sleep. CRCs are those of
+    :class:`SimuRtuQuery`. With a `bus` (a
+    :class:`~GJXS.utils.rtu_bus.RtuBus`) the responses are timed by it.
+    """
+    _PDU_SLICE = slice(1, -2)
+    _UNIT_INDEX = 0
+    _CHECK = "CRC"
+    bus = None
+
+    def __init__(self, serial, *args, **kwargs):
+        super(SimuRtuServer, self).__init__(serial, *args, **kwargs)
+        self.framer = self._make_framer(serial)
+        self._serial.inter_byte_timeout = self.framer.t15
+        self.set_timeout(self.framer.t35)
+
+    def _make_framer(self, serial):
+        return RtuFramer(serial.baudrate, serial.bytesize, serial.parity,
+                         serial.stopbits)
+
+    def _decode(self, frame):
+        """
+        Binary adu of a frame read (unit, pdu, check)
+        """
+        return frame
+
+    def _encode(self, response):
+        """
+        Frame written for a binary response adu
+        """
+        return response
+
+    def _check(self, request):
+        return crc_cache.check(request)
+
+    def _do_run(self):
+        try:
+            requests = read_frames(self._serial, self.framer)
+        except (serial.SerialException, OSError) as excpt:
+            log.error("Error while reading %s: %s", self._serial.port, excpt)
+            self._serial.close()
+            self._serial.open()
+            return
+        bus = self.bus
+        for frame in requests:
+            if bus is not None:
+                bus.request(len(frame))
+            try:
+                request = self._decode(frame)
+                retval = call_hooks("modbus_rtu.RtuServer.after_read",
+                                    (self, request))
+                if retval is not None:
+                    request = retval
+                if not self._check(request):
+                    # discarded unanswered, as a slave does
+                    log.debug("Invalid %s in request on %s", self._CHECK,
+                              self._serial.port)
+                    continue
+                response = self._handle(request)
+                retval = call_hooks("modbus_rtu.RtuServer.before_write",
+                                    (self, response))
+                if retval is not None:
+                    response = retval
+                if response and bus is not None:
+                    bus.respond(frame_unit(request), self._encode(response),
+                                self._serial.write)
+                elif response:
+                    self._serial.write(self._encode(response))
+                call_hooks("modbus_rtu.RtuServer.after_write",
+                           (self, response))
+            except Exception as excpt:
+                log.error("Error while handling request: %s", excpt)
+                call_hooks("modbus_rtu.RtuServer.on_error", (self, excpt))
+
+    def _make_query(self):
+        return SimuRtuQuery()
+
+    def _client(self):
+        return self._serial.port
+
+    def _endpoint(self):
+        return self._serial.port
+
+    def _readable(self):
+        return [self._serial] if self._serial.is_open else []
+
+
+class SimuAsciiQuery(SimuRtuQuery):
+    """
+    Query of the ascii mode, on the binary adu: unit, pdu and LRC byte (see
+    :mod:`GJXS.utils.ascii_framing`)
+    """
+
+    def parse_request(self, request):
+        if len(request) < 2:
+            raise ModbusInvalidRequestError(
+                "Request length is invalid {0}".format(len(request)))
+        (self._request_address, ) = struct.unpack(">B", request[0:1])
+        if not check_lrc(request):
+            raise ModbusInvalidRequestError("Invalid LRC in request")
+        return self._request_address, request[1:-1]
+
+    def build_response(self, response_pdu):
+        self._response_address = self._request_address
+        return with_lrc(struct.pack(">B", self._response_address) +
+                        response_pdu)
+
+
+class SimuAsciiServer(SimuRtuServer):
+    """
+    Modbus ascii on a serial port: the frames split by an
+    :class:`~GJXS.utils.ascii_framing.AsciiFramer` are handled as binary
+    adus (LRC instead of CRC), the responses written back in ascii
+    """
+    _PDU_SLICE = slice(1, -1)
+    _CHECK = "LRC"
+
+    def _make_framer(self, serial):
+        return AsciiFramer()
+
+    def _decode(self, frame):
+        return from_ascii(frame) or b""
+
+    def _encode(self, response):
+        return to_ascii(response)
+
+    def _check(self, request):
+        return check_lrc(request)
+
+    def _make_query(self):
+        return SimuAsciiQuery()
+
+
+def _on_connect(args):
+    server, sock, address = args
+    if isinstance(server, SimuTcpServer):
+        server._peers[sock] = "%s:%s" % address[:2]
+
+
+def _on_disconnect(args):
+    server, sock = args
+    if isinstance(server, SimuTcpServer):
+        server._peers.pop(sock, None)
+
+
+hooks.install_hook("modbus_tcp.TcpServer.on_connect", _on_connect)
+hooks.install_hook("modbus_tcp.TcpServer.on_disconnect", _on_disconnect)
+
+SERVERS = {
+    "tcp": SimuTcpServer,
+    "rtu": SimuRtuServer,
+    "rtu_tcp": SimuRtuTcpServer,
+    "ascii": SimuAsciiServer,
+    "udp": SimuUdpServer
+}
+# servers on a serial port, the others listen on a tcp port
+SERIAL_SERVERS = ("rtu", "ascii")
+
 BLOCK_TYPES = {"Function_C15": COILS,
                "Function_C02": DISCRETE_INPUTS,
                "Function_C03": HOLDING_REGISTERS,
                "Function_C16": ANALOG_INPUTS}
+_TABLES = dict((block_type, table) for table, block_type in BLOCK_TYPES.items())
+# served by SimuSlave without taking the slave lock
+_READ_FUNCTIONS = frozenset([READ_COILS, READ_DISCRETE_INPUTS,
+                             READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS])
 MODBUS_TCP_PORT = 5440
 
 
@@ -78,21 +624,370 @@ class PseudoSerial(object):
         return self.ser
 
 
+class ObservedBlock(ModbusBlock):
+    """
+    ModbusBlock publishing every write (from masters or the simulator) to a
+    :class:`~GJXS.utils.datastore.ChangeFeed`, under the name of its `table`
+    (one of `BLOCK_TYPES`). Values are stored in
+    :class:`~GJXS.utils.slave_template.CowRegisters`, `registers` when given
+    (e.g. those of a :class:`~GJXS.utils.slave_template.SlaveTemplate`).
+    """
+
+    def __init__(self, starting_address, size, name='', slave_id=None,
+                 feed=None, registers=None, table=None):
+        self.starting_address = starting_address
+        # copy-on-write storage, readers need no lock
+        self._data = as_registers(registers if registers is not None
+                                  else size)
+        self.size = len(self._data)
+        self.name = name
+        self.table = table if table is not None else name
+        self.slave_id = slave_id
+        self.feed = feed
+
+    def __setitem__(self, item, value):
+        feed = self.feed
+        if not feed:
+            return super(ObservedBlock, self).__setitem__(item, value)
+        old = self._data[item]
+        super(ObservedBlock, self).__setitem__(item, value)
+        if isinstance(item, slice):
+            address = self.starting_address + (item.start or 0)
+            old, new = list(old), list(value)
+        else:
+            address = self.starting_address + item
+            old, new = [old], [value]
+        feed.publish(VALUES_CHANGED, self.slave_id, self.table, address,
+                     old, new)
+
+
+def block_key(table, starting_address):
+    """
+    Name of the block of `table` starting at `starting_address`, for
+    slaves holding several blocks per table
+    """
+    return "%s@%d" % (table, starting_address)
+
+
+class SimuSlave(Slave):
+    """
+    modbus_tk Slave storing its values in :class:`ObservedBlock` and
+    publishing block and request events to `feed`.
+
+    A table may hold any number of blocks. Each table has a
+    :class:`~GJXS.utils.block_index.BlockIndex`, so requests find their
+    block with a bisect instead of scanning the blocks of the table, and
+    `get_values`/`set_values` accept a table name (one of `BLOCK_TYPES`) to
+    address the whole table, whichever block holds the address.
+
+    The slave lock is a :class:`~GJXS.utils.locking.StoreLock` (see
+    `lock_class`): writes serialize on it, read requests and table reads
+    run without it and never wait behind the simulation writing.
+    """
+    lock_class = StoreLock
+
+    def __init__(self, slave_id, unsigned=True, memory=None, feed=None):
+        super(SimuSlave, self).__init__(slave_id, unsigned, memory)
+        self._data_lock = self.lock_class()
+        self._feed = feed
+        self._index = {}
+        for block_type, blocks in self._memory.items():
+            index = self._index[block_type] = BlockIndex()
+            for block in blocks:
+                index.add(block.starting_address, block.size, block)
+
+    def add_block(self, block_name, block_type, starting_address, size,
+                  registers=None):
+        """
+        Same as `Slave.add_block`, the block values being stored in
+        `registers` if given.
+        """
+        with self._data_lock:
+            if size <= 0:
+                raise InvalidArgumentError("size must be a positive number")
+            if starting_address < 0:
+                raise InvalidArgumentError(
+                    "starting address must be zero or positive number")
+            if block_name in self._blocks:
+                raise DuplicatedKeyError(
+                    "Block {0} already exists. ".format(block_name))
+            if block_type not in self._memory:
+                raise InvalidModbusBlockError(
+                    "Invalid block type {0}".format(block_type))
+            index = self._index[block_type]
+            block = index.overlapping(starting_address, size)
+            if block is not None:
+                raise OverlapModbusBlockError(
+                    "Overlap block at {0} size {1}".format(
+                        block.starting_address, block.size))
+            block = ObservedBlock(starting_address, size, block_name,
+                                  self._id, self._feed, registers,
+                                  _TABLES.get(block_type))
+            position = index.add(starting_address, size, block)
+            self._blocks[block_name] = (block_type, starting_address)
+            self._memory[block_type].insert(position, block)
+        if self._feed:
+            self._feed.publish(BLOCK_ADDED, self._id, block.table,
+                               starting_address, new=block[:])
+
+    def remove_block(self, block_name):
+        with self._data_lock:
+            block = self._get_block(block_name)
+            block_type = self._blocks.pop(block_name)[0]
+            self._index[block_type].remove(block.starting_address)
+            self._memory[block_type].remove(block)
+        if self._feed:
+            self._feed.publish(BLOCK_REMOVED, self._id, block.table,
+                               block.starting_address, old=block[:])
+
+    def remove_all_blocks(self):
+        with self._data_lock:
+            blocks = [self._get_block(name) for name in self._blocks]
+            super(SimuSlave, self).remove_all_blocks()
+            for index in self._index.values():
+                index.clear()
+        if self._feed:
+            for block in blocks:
+                self._feed.publish(BLOCK_REMOVED, self._id, block.table,
+                                   block.starting_address, old=block[:])
+
+    def _get_block(self, block_name):
+        if block_name not in self._blocks:
+            raise MissingKeyError("block {0} not found".format(block_name))
+        block_type, starting_address = self._blocks[block_name]
+        return self._index[block_type].find(starting_address)[0]
+
+    def _get_block_and_offset(self, block_type, address, length):
+        block, offset = self._index[block_type].find(address, length)
+        if block is None:
+            raise ModbusError(ILLEGAL_DATA_ADDRESS)
+        return block, offset
+
+    def _table_runs(self, table, address, size):
+        runs = self._index[BLOCK_TYPES[table]].split(address, size)
+        if runs is None:
+            raise OutOfModbusBlockError(
+                "address {0} size {1} is out of table {2}".format(
+                    address, size, table))
+        return runs
+
+    def set_values(self, block_name, address, values):
+        """
+        Same as `Slave.set_values`, `block_name` being a block or a table
+        name. Table writes may span adjacent blocks.
+        """
+        if block_name not in BLOCK_TYPES:
+            return super(SimuSlave, self).set_values(block_name, address,
+                                                     values)
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        runs = self._table_runs(block_name, address, len(values))
+        # writes spanning blocks are published at once to table readers
+        lock = self._data_lock if len(runs) == 1 \
+            else self._data_lock.spanning()
+        with lock:
+            written = 0
+            for block, offset, count in runs:
+                block[offset:offset + count] = \
+                    values[written:written + count]
+                written += count
+
+    def get_values(self, block_name, address, size=1):
+        """
+        Same as `Slave.get_values`, `block_name` being a block or a table
+        name. Table reads may span adjacent blocks.
+        """
+        if block_name not in BLOCK_TYPES:
+            return super(SimuSlave, self).get_values(block_name, address,
+                                                     size)
+        runs = self._table_runs(block_name, address, size)
+        if len(runs) == 1:
+            block, offset, count = runs[0]
+            return tuple(self._data_lock.read(
+                block.__getitem__, slice(offset, offset + count)))
+        return self._data_lock.read_spanning(self._read_runs, runs)
+
+    @staticmethod
+    def _read_runs(runs):
+        values = []
+        for block, offset, count in runs:
+            values.extend(block[offset:offset + count])
+        return tuple(values)
+
+    def _write_multiple_registers(self, request_pdu):
+        """
+        Same as `Slave._write_multiple_registers`, writing the registers
+        at once so that no read sees a 32/64 bits value half written
+        """
+        call_hooks("modbus.Slave.handle_write_multiple_registers_request",
+                   (self, request_pdu))
+        starting_address, quantity_of_x, byte_count = struct.unpack(
+            ">HHB", request_pdu[1:6])
+        if quantity_of_x <= 0 or quantity_of_x > 123 or \
+                byte_count != quantity_of_x * 2:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        block, offset = self._get_block_and_offset(
+            HOLDING_REGISTERS, starting_address, quantity_of_x)
+        fmt = ">%d%s" % (quantity_of_x, "H" if self.unsigned else "h")
+        block[offset:offset + quantity_of_x] = struct.unpack(
+            fmt, request_pdu[6:6 + byte_count])
+        return struct.pack(">HH", starting_address, quantity_of_x)
+
+    def _write_multiple_coils(self, request_pdu):
+        """
+        Same as `Slave._write_multiple_coils`, writing the coils at once
+        """
+        call_hooks("modbus.Slave.handle_write_multiple_coils_request",
+                   (self, request_pdu))
+        starting_address, quantity_of_x, byte_count = struct.unpack(
+            ">HHB", request_pdu[1:6])
+        if quantity_of_x <= 0 or quantity_of_x > 1968 or \
+                byte_count != (quantity_of_x + 7) // 8:
+            raise ModbusError(ILLEGAL_DATA_VALUE)
+        block, offset = self._get_block_and_offset(
+            COILS, starting_address, quantity_of_x)
+        bits = struct.unpack(">%dB" % byte_count,
+                             request_pdu[6:6 + byte_count])
+        block[offset:offset + quantity_of_x] = [
+            (bits[i >> 3] >> (i & 7)) & 1 for i in range(quantity_of_x)]
+        return struct.pack(">HH", starting_address, quantity_of_x)
+
+    @property
+    def lock(self):
+        return self._data_lock
+
+    def handle_request(self, request_pdu, broadcast=False):
+        function_code = None
+        if request_pdu:
+            (function_code, ) = struct.unpack(">B", request_pdu[0:1])
+            if self._feed:
+                self._feed.publish(REQUEST, self._id, address=function_code)
+        if broadcast or function_code not in _READ_FUNCTIONS:
+            return super(SimuSlave, self).handle_request(request_pdu,
+                                                         broadcast)
+        # same as Slave.handle_request for reads, without the slave lock
+        retval = call_hooks("modbus.Slave.handle_request", (self, request_pdu))
+        if retval is not None:
+            return retval
+        try:
+            response_pdu = self._data_lock.read(
+                self._fn_code_map[function_code], request_pdu)
+        except ModbusError as excpt:
+            call_hooks("modbus.Slave.on_exception",
+                       (self, function_code, excpt))
+            return struct.pack(">BB", function_code + 128,
+                               excpt.get_exception_code())
+        return struct.pack(">B", function_code) + response_pdu
+
+
+class TableAccessor(object):
+    """
+    Handle on one table of a :class:`SimuSlave`, see `ModbusSimu.accessor`
+    """
+
+    def __init__(self, slave, block_name):
+        self.slave = slave
+        self.block_name = block_name
+
+    def read(self, address, count=1):
+        return self.slave.get_values(self.block_name, address, count)
+
+    def write(self, address, values):
+        self.slave.set_values(self.block_name, address, values)
+        return True
+
+
+class SimuDatabank(Databank):
+    """
+    modbus_tk Databank creating :class:`SimuSlave` slaves
+    """
+
+    def __init__(self, feed=None, error_on_missing_slave=True):
+        super(SimuDatabank, self).__init__(error_on_missing_slave)
+        self._feed = feed
+
+    def add_slave(self, slave_id, unsigned=True, memory=None):
+        with self._lock:
+            if (slave_id <= 0) or (slave_id > 255):
+                raise Exception("Invalid slave id {0}".format(slave_id))
+            if slave_id in self._slaves:
+                raise DuplicatedKeyError(
+                    "Slave {0} already exists".format(slave_id))
+            self._slaves[slave_id] = SimuSlave(slave_id, unsigned, memory,
+                                               self._feed)
+            return self._slaves[slave_id]
+
+    def add_slaves(self, slave_ids, blocks=(), unsigned=True):
+        """
+        Adds the slaves `slave_ids` with `blocks` (a
+        :class:`~GJXS.utils.slave_template.SlaveTemplate` or `(block_name,
+        block_type, starting_address, size)` tuples, `block_name` being the
+        table of the block) under a single lock. Blocks are named after
+        :func:`block_key`. The slaves share the template values until
+        written. Slaves already present are skipped, returns the ids added.
+        """
+        template = as_template(blocks)
+        added = []
+        with self._lock:
+            for slave_id in slave_ids:
+                if (slave_id <= 0) or (slave_id > 255):
+                    raise Exception("Invalid slave id {0}".format(slave_id))
+                if slave_id in self._slaves:
+                    continue
+                slave = SimuSlave(slave_id, unsigned, None, self._feed)
+                for table, block_type, starting_address, size in template:
+                    slave.add_block(block_key(table, starting_address),
+                                    block_type, starting_address, size,
+                                    template.registers(table,
+                                                       starting_address))
+                self._slaves[slave_id] = slave
+                added.append(slave_id)
+        return added
+
+    def remove_slaves(self, slave_ids):
+        """
+        Removes the slaves `slave_ids` under a single lock, returns the ids
+        removed.
+        """
+        with self._lock:
+            return [slave_id for slave_id in slave_ids
+                    if self._slaves.pop(slave_id, None) is not None]
+
+
 class ModbusSimu(object):
     _server_add = ()
+    # rtu line of port "pty", see `master_path`
+    link = None
+    # rtu line timing, see `bus_stats`
+    bus = None
 
     def __init__(self, server="tcp", *args, **kwargs):
         self._server_type = server
         self._port = kwargs.get('port', None)
-        if server == 'rtu':
+        # datastore change events (writes, blocks, requests)
+        self.feed = ChangeFeed()
+        # recent requests served, see `GJXS.utils.monitor`
+        self.monitor = RequestMonitor()
+        if server in SERIAL_SERVERS:
             tty_name = kwargs['port']
             kwargs.pop('port', None)
+            turnaround = kwargs.pop('turnaround', None)
+            if turnaround is not None:
+                self.bus = RtuBus.from_settings(
+                    kwargs, turnaround, wire=tty_name == PTY_PORT)
+            if tty_name == PTY_PORT:
+                self.link = PtyLink()
+                tty_name = self.link.server_path
+                kwargs = tty_settings(kwargs)
             self._serial = PseudoSerial(tty_name, **kwargs)
             kwargs = {k: v for k, v in kwargs.iteritems() if k == "serial"}
             kwargs['serial'] = self._serial.ser
         else:
             kwargs['port'] = int(kwargs['port'])
+        kwargs['databank'] = SimuDatabank(self.feed)
         self.server = SERVERS.get(server, None)(*args, **kwargs)
+        self.server.monitor = self.monitor
+        self.server.bus = self.bus
         self.simulate = kwargs.get('simulate', False)
 
     @property
@@ -103,14 +998,50 @@ class ModbusSimu(object):
     def port(self):
         return self._port
 
+    @property
+    def master_path(self):
+        """
+        Tty the masters open when serving rtu on port "pty" (a
+        :class:`~GJXS.utils.pty_link.PtyLink`), None otherwise
+        """
+        if self.link is not None:
+            return self.link.master_path
+
     def add_slave(self, slave_id):
         self.server.add_slave(slave_id)
+        self.feed.publish(SLAVE_ADDED, slave_id)
 
     def remove_slave(self, slave_id):
         self.server.remove_slave(slave_id)
+        self.feed.publish(SLAVE_REMOVED, slave_id)
+
+    def add_slaves(self, slave_ids, blocks=()):
+        """
+        Adds a range of slaves, each with `blocks` (a
+        :class:`~GJXS.utils.slave_template.SlaveTemplate` or `(block_name,
+        block_type, starting_address, size)` tuples), in one databank
+        operation. Returns the ids added, existing slaves are left untouched.
+        """
+        added = self.server._databank.add_slaves(slave_ids, blocks)
+        for slave_id in added:
+            self.feed.publish(SLAVE_ADDED, slave_id)
+        return added
+
+    def remove_slaves(self, slave_ids):
+        """
+        Removes a range of slaves in one databank operation. Returns the ids
+        removed.
+        """
+        removed = self.server._databank.remove_slaves(slave_ids)
+        for slave_id in removed:
+            self.feed.publish(SLAVE_REMOVED, slave_id)
+        return removed
 
     def remove_all_slave(self):
+        slave_ids = list(self.get_slaves())
         self.server.remove_all_slaves()
+        for slave_id in slave_ids:
+            self.feed.publish(SLAVE_REMOVED, slave_id)
 
     def add_block(self, slave_id, block_name, block_type, starting_add, size):
         slave = self.server.get_slave(slave_id)
@@ -124,6 +1055,15 @@ class ModbusSimu(object):
         slave = self.server.get_slave(slave_id)
         slave.remove_all_blocks()
 
+    def accessor(self, slave_id, block_name):
+        """
+        Handle on the `block_name` table of `slave_id`, with
+        `read(address, count)` and `write(address, values)` skipping the
+        databank lookup of every call. A handle kept past the removal of
+        its slave is detached from the server.
+        """
+        return TableAccessor(self.server.get_slave(slave_id), block_name)
+
     def set_values(self, slave_id, block_name, address, values):
         slave = self.server.get_slave(slave_id)
         slave.set_values(block_name, address, values)
@@ -132,21 +1072,104 @@ class ModbusSimu(object):
         slave = self.server.get_slave(slave_id)
         return slave.get_values(block_name, address, size)
 
-    def start(self):
-        self.server.start()
-        if self._server_type == "tcp":
+    def start(self, reactor=None):
+        """
+        Starts serving requests, from the server thread or from `reactor`
+        (a :class:`~GJXS.utils.reactor.Reactor`)
+        """
+        self.server.paused = False
+        if self.link is not None:
+            self.link.start(reactor)
+        if reactor is None:
+            self.server.start()
+        else:
+            if self.bus is not None:
+                self.bus.attach(reactor)
+            self.server.attach(reactor)
+        if self._server_type not in SERIAL_SERVERS:
             self._server_add = self.server._sa
 
     def stop(self):
-        self.server.stop()
-        if self._server_type == 'rtu':
+        if self.server.attached:
+            self.server.detach()
+        else:
+            self.server.stop()
+        if self.bus is not None:
+            self.bus.detach()
+        if self._server_type in SERIAL_SERVERS:
             self._serial.close()
+        # the pty line is kept, masters stay connected across restarts
+        if self.link is not None:
+            self.link.stop()
         self._server_add = ()
 
+    def close(self):
+        """
+        Stops the server if running and releases the pty line if any
+        """
+        self.stop()
+        if self.link is not None:
+            self.link.close()
+
+    @property
+    def paused(self):
+        return self.server.paused
+
+    def pause(self):
+        """
+        Stops answering requests while keeping the bound socket or open
+        serial port, the client connections, the datastore and the server
+        thread or reactor task, see :meth:`resume`. Requests received while
+        paused are discarded.
+        """
+        self.server.paused = True
+
+    def resume(self):
+        """
+        Answers requests again after :meth:`pause`, at once
+        """
+        self.server.paused = False
+
+    def set_response_delay(self, slave_id, delay):
+        """
+        Response delay of `slave_id` on the rtu line, in seconds, None for
+        the `turnaround` of the line. Requires a bus model (`turnaround`
+        given), see :class:`~GJXS.utils.rtu_bus.RtuBus`.
+        """
+        if self.bus is None:
+            raise ValueError("no bus model, give a turnaround to the "
+                             "rtu server")
+        self.bus.set_response_delay(slave_id, delay)
+
+    def bus_stats(self):
+        """
+        Utilization and turnaround of the rtu line (see
+        :meth:`~GJXS.utils.rtu_bus.RtuBus.stats`), None without a bus model
+        """
+        if self.bus is not None:
+            return self.bus.stats()
+
+    def datagram_stats(self):
+        """
+        Datagrams served and dropped by a udp server (see
+        :meth:`~GJXS.utils.datagram.DatagramStats.stats`), None otherwise
+        """
+        datagrams = getattr(self.server, 'datagrams', None)
+        if datagrams is not None:
+            return datagrams.stats()
+
     def get_slaves(self):
         if self.server is not None:
             return self.server._databank._slaves
 
+    def lock_stats(self):
+        """
+        Contention counters of the locks of all the slaves, see
+        :class:`~GJXS.utils.locking.StoreLock`
+        """
+        return merge_stats(slave.lock
+                           for slave in list(self.get_slaves().values()))
+
 
 def swap_bytes(byte_array):
     temp = []
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import struct
+import time
+from collections import namedtuple
+from itertools import count as _count
+
+MONITOR_SIZE = 4096
+
+RequestRecord = namedtuple("RequestRecord", [
+    "seq", "timestamp", "client", "unit", "function_code", "address",
+    "count", "latency", "exception"])
+
+# function codes whose pdu starts with a (starting address, quantity) pair
+_RANGE_FUNCTIONS = frozenset([1, 2, 3, 4, 15, 16, 23])
+# function codes writing a single coil/register
+_SINGLE_FUNCTIONS = frozenset([5, 6])
+
+
+def decode_pdu(pdu):
+    """
+    Returns `(function_code, address, count)` of a request pdu. Address and
+    count are None/0 for function codes not addressing registers.
+    """
+    if not pdu:
+        return None, None, 0
+    (function_code, ) = struct.unpack_from(">B", pdu)
+    if function_code in _RANGE_FUNCTIONS and len(pdu) >= 5:
+        address, count = struct.unpack_from(">HH", pdu, 1)
+        return function_code, address, count
+    if function_code in _SINGLE_FUNCTIONS and len(pdu) >= 3:
+        (address, ) = struct.unpack_from(">H", pdu, 1)
+        return function_code, address, 1
+    return function_code, None, 0
+
+
+def decode_exception(pdu):
+    """
+    Returns the exception code of a response pdu or None if it is not an
+    exception response.
+    """
+    if not pdu or len(pdu) < 2:
+        return None
+    function_code, exception_code = struct.unpack_from(">BB", pdu)
+    return exception_code if function_code & 0x80 else None
+
+
+class RequestMonitor(object):
+    """
+    Fixed size ring buffer of the requests served by a backend.
+
+    Writers (the server threads) never block: a record takes a slot number
+    from an `itertools.count` and is stored with a single list assignment,
+    both of which are atomic under the GIL. Once the buffer is full the
+    oldest records are overwritten. Readers (the GUI) poll at their own pace
+    with :meth:`since`, passing the sequence number returned by the previous
+    call, and simply miss the records overwritten in between::
+
+        seq = 0
+        records, seq = monitor.since(seq)
+
+    Args:
+        size: Number of records kept.
+    """
+
+    def __init__(self, size=MONITOR_SIZE):
+        self._size = size
+        self._slots = [None] * size
+        self._counter = _count()
+        self._next = 0
+        # running totals, see `totals`
+        self._exceptions = 0
+        self._latency = 0.0
+        self.enabled = True
+
+    def __len__(self):
+        return min(self._next, self._size)
+
+    @property
+    def size(self):
+        return self._size
+
+    def record(self, client, unit, function_code, address, count, latency,
+               exception=None):
+        seq = next(self._counter)
+        self._slots[seq % self._size] = RequestRecord(
+            seq, time.time(), client, unit, function_code, address, count,
+            latency, exception)
+        self._latency += latency
+        if exception is not None:
+            self._exceptions += 1
+        # may briefly lag behind with concurrent writers, readers check the
+        # sequence number stored in every slot
+        self._next = seq + 1
+
+    def since(self, seq=0):
+        """
+        Returns `(records, next_seq)`, the records numbered `seq` and above
+        still in the buffer, oldest first, and the sequence number to pass
+        to the next call.
+        """
+        stop = self._next
+        size = self._size
+        slots = self._slots
+        records = []
+        for expected in range(max(seq, stop - size), stop):
+            record = slots[expected % size]
+            if record is not None and record.seq == expected:
+                records.append(record)
+        return records, stop
+
+    def recent(self, count=100):
+        """
+        Returns the last `count` records, oldest first.
+        """
+        return self.since(self._next - count)[0]
+
+    def totals(self):
+        """
+        Requests recorded since the monitor was created, with the exception
+        responses among them and their mean latency, including the records
+        overwritten since (concurrent writers may lose an increment)
+        """
+        requests = self._next
+        return {'requests': requests, 'exceptions': self._exceptions,
+                'latency': self._latency / requests if requests else 0.0}
+
+    def clear(self):
+        self._slots = [None] * self._size
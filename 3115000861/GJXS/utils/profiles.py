@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from json import load
+
+from GJXS.utils.address_index import ADDRESS_SPACE
+from GJXS.utils.modbus import BLOCK_TYPES
+from GJXS.utils.slave_template import SlaveTemplate
+
+
+class ProfileError(ValueError):
+    pass
+
+
+class DeviceProfile(object):
+    """
+    Register layout of a device type: the blocks of every table the device
+    has, as `block_name -> [(starting_address, size, values), ...]` sorted
+    by address. Tables not in the profile are not allocated for the slaves
+    using it.
+
+    All the slaves added with a profile share the pages of its
+    :meth:`template` until written.
+
+    Args:
+        name: Profile name.
+        tables: `block_name -> block` or `block_name -> [block, ...]`,
+            blocks being `(starting_address, size)` or `(starting_address,
+            size, values)` with the initial values of the block, `values`
+            being None for zeros.
+    """
+
+    def __init__(self, name, tables):
+        self.name = name
+        self.tables = {}
+        for block_name, blocks in tables.items():
+            if blocks and not isinstance(blocks[0], (list, tuple)):
+                blocks = [blocks]
+            self.tables[block_name] = sorted(
+                (block[0], block[1], block[2] if len(block) > 2 else None)
+                for block in blocks)
+        self._template = None
+        self.validate()
+
+    def __repr__(self):
+        return '<%s name=%s tables=%s>' % (self.__class__.__name__,
+                                           self.name, sorted(self.tables))
+
+    @classmethod
+    def uniform(cls, name, starting_address, size):
+        """
+        Profile with the same block on every table
+        """
+        return cls(name, dict((block_name, (starting_address, size))
+                              for block_name in BLOCK_TYPES))
+
+    def validate(self):
+        if not self.tables:
+            raise ProfileError("profile '%s' has no table" % self.name)
+        for block_name, blocks in self.tables.items():
+            if block_name not in BLOCK_TYPES:
+                raise ProfileError("profile '%s': unknown table '%s', "
+                                   "expected one of %s" % (
+                                       self.name, block_name,
+                                       ", ".join(sorted(BLOCK_TYPES))))
+            if not blocks:
+                raise ProfileError("profile '%s': table '%s' has no block"
+                                   % (self.name, block_name))
+            stop = 0
+            for start, size, values in blocks:
+                if start < 0 or size <= 0 or start + size > ADDRESS_SPACE:
+                    raise ProfileError("profile '%s': invalid block %s-%s "
+                                       "for table '%s'" % (
+                                           self.name, start,
+                                           start + size - 1, block_name))
+                if start < stop:
+                    raise ProfileError("profile '%s': block %s-%s overlaps "
+                                       "another block of table '%s'" % (
+                                           self.name, start,
+                                           start + size - 1, block_name))
+                if values is not None and len(values) != size:
+                    raise ProfileError("profile '%s': %s values given for "
+                                       "the %s registers of block %s-%s of "
+                                       "table '%s'" % (
+                                           self.name, len(values), size,
+                                           start, start + size - 1,
+                                           block_name))
+                stop = start + size
+
+    def geometry(self, block_name):
+        """
+        `[(starting_address, size), ...]` of the blocks of `block_name`,
+        None if the device has no such table
+        """
+        blocks = self.tables.get(block_name)
+        if blocks is None:
+            return None
+        return [(start, size) for start, size, _ in blocks]
+
+    def template(self):
+        """
+        :class:`~GJXS.utils.slave_template.SlaveTemplate` of the profile,
+        built once
+        """
+        if self._template is None:
+            self._template = SlaveTemplate(
+                (block_name, BLOCK_TYPES[block_name], start,
+                 values if values is not None else size)
+                for block_name, blocks in sorted(self.tables.items())
+                for start, size, values in blocks)
+        return self._template
+
+
+def _parse_block(name, block_name, block):
+    try:
+        return int(block['start']), int(block['size']), block.get('values')
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise ProfileError("profile '%s': blocks of table '%s' need integer "
+                           "'start' and 'size'" % (name, block_name))
+
+
+def parse_profiles(data):
+    """
+    Builds the profiles of `data`, a dict of profile name to tables, a
+    table being a block or a list of blocks::
+
+        {
+            "power_meter": {
+                "Function_C03": [{"start": 0, "size": 64},
+                                 {"start": 1000, "size": 16}],
+                "Function_C16": {"start": 100, "size": 4,
+                                 "values": [230, 231, 229, 50]}
+            }
+        }
+    """
+    if not isinstance(data, dict):
+        raise ProfileError("device profiles must be an object of profiles")
+    profiles = {}
+    for name, tables in data.items():
+        if not isinstance(tables, dict):
+            raise ProfileError("profile '%s' must be an object of tables"
+                               % name)
+        geometry = {}
+        for block_name, blocks in tables.items():
+            if not isinstance(blocks, list):
+                blocks = [blocks]
+            geometry[block_name] = [_parse_block(name, block_name, block)
+                                    for block in blocks]
+        profiles[name] = DeviceProfile(name, geometry)
+    return profiles
+
+
+def load_profiles(path):
+    """
+    Loads the device profiles of the json file `path`, see
+    :func:`parse_profiles`
+    """
+    try:
+        with open(path) as f:
+            data = load(f)
+    except (IOError, ValueError) as e:
+        raise ProfileError("failed to load device profiles %s: %s"
+                           % (path, e))
+    return parse_profiles(data)
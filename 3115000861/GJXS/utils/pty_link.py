@@ -0,0 +1,189 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Virtual serial lines made of pseudo terminals, so that rtu is served (and
+benchmarked) without serial hardware nor the legacy BSD ptys such as
+`/dev/ptyp0` modern Linux no longer has, as many lines as needed::
+
+    link = PtyLink()
+    device = ModbusSimu(server="rtu", port=link.server_path)
+    link.start(reactor)
+    # masters open link.master_path
+"""
+from __future__ import absolute_import, unicode_literals
+
+import errno
+import os
+
+try:
+    import fcntl
+    import tty
+except ImportError:  # windows
+    fcntl = tty = None
+
+from GJXS.utils.reactor import Reactor
+
+# `port` of an rtu `ModbusSimu` served on a `PtyLink` of its own
+PTY_PORT = "pty"
+_CHUNK = 4096
+
+
+def tty_settings(settings):
+    """
+    Serial `settings` as applied to a pty: no parity bit, which ptys do
+    not carry (recent Linux kernels reject PARENB on them). Masters open
+    the master tty without parity too.
+    """
+    settings = dict(settings)
+    settings['parity'] = "N"
+    return settings
+
+
+def _open_pty():
+    """
+    Opens a pseudo terminal, returns its (non-blocking) controlling fd, its
+    raw tty fd (kept open so that the line never hangs up) and the path of
+    the tty
+    """
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    flags = fcntl.fcntl(master, fcntl.F_GETFL)
+    fcntl.fcntl(master, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+    return master, slave, os.ttyname(slave)
+
+
+class PtyLink(object):
+    """
+    Null-modem cable between two pseudo terminals: bytes written to
+    `server_path` (the tty the rtu server opens) are read from
+    `master_path` (the tty given to modbus masters) and the other way
+    round, as with `socat pty pty`.
+
+    The bytes are forwarded by a reader task of a
+    :class:`~GJXS.utils.reactor.Reactor`, see :meth:`start`. Bytes the
+    other end is too slow to take are dropped, as a uart overrun would, and
+    counted in :meth:`stats`.
+    """
+
+    def __init__(self):
+        if not hasattr(os, "openpty") or fcntl is None:
+            raise OSError(errno.ENOSYS,
+                          "pseudo terminals are not supported on %s" %
+                          os.name)
+        self._server_fd, self._server_tty, self.server_path = _open_pty()
+        try:
+            self._master_fd, self._master_tty, self.master_path = \
+                _open_pty()
+        except OSError:
+            os.close(self._server_fd)
+            os.close(self._server_tty)
+            raise
+        # [bytes forwarded, bytes dropped] each way
+        self._to_master = [0, 0]
+        self._to_server = [0, 0]
+        # fd read -> (fd written, counters)
+        self._routes = {
+            self._server_fd: (self._master_fd, self._to_master),
+            self._master_fd: (self._server_fd, self._to_server)}
+        self._reactor = None
+        self._own_reactor = False
+        self.reader_name = "pty_link %s" % self.master_path
+
+    def __repr__(self):
+        return '<%s %s <-> %s>' % (self.__class__.__name__,
+                                   self.server_path, self.master_path)
+
+    @property
+    def closed(self):
+        return self._server_fd is None
+
+    @property
+    def running(self):
+        return self._reactor is not None
+
+    def start(self, reactor=None):
+        """
+        Forwards the bytes from `reactor`, from a reactor thread of the link
+        if None. Does nothing if already started.
+        """
+        if self.closed:
+            raise ValueError("%r is closed" % self)
+        if self._reactor is not None:
+            return
+        self._own_reactor = reactor is None
+        if reactor is None:
+            reactor = Reactor("pty_link")
+            reactor.start()
+        self._reactor = reactor
+        reactor.add_reader(self.reader_name, self._readable, self._forward)
+
+    def stop(self):
+        """
+        Stops forwarding, the ttys stay open (masters keep their line)
+        """
+        reactor, self._reactor = self._reactor, None
+        if reactor is None:
+            return
+        # not polled anymore once this returns, the fds can be closed
+        reactor.run_sync(reactor.remove_reader, self.reader_name)
+        if self._own_reactor:
+            reactor.stop()
+
+    def close(self):
+        self.stop()
+        if self.closed:
+            return
+        for fd in (self._server_fd, self._server_tty, self._master_fd,
+                   self._master_tty):
+            os.close(fd)
+        self._server_fd = self._master_fd = None
+        self._routes = {}
+
+    def _readable(self):
+        if self.closed:
+            return []
+        return [self._server_fd, self._master_fd]
+
+    def _forward(self, ready):
+        for fd in ready:
+            try:
+                data = os.read(fd, _CHUNK)
+            except OSError as excpt:
+                if excpt.errno in (errno.EAGAIN, errno.EIO):
+                    continue
+                raise
+            peer, counters = self._routes[fd]
+            try:
+                sent = os.write(peer, data)
+            except OSError as excpt:
+                if excpt.errno != errno.EAGAIN:
+                    raise
+                sent = 0
+            counters[0] += sent
+            counters[1] += len(data) - sent
+
+    def stats(self):
+        """
+        Bytes forwarded and dropped each way
+        """
+        to_master, to_server = self._to_master, self._to_server
+        return {'server_path': self.server_path,
+                'master_path': self.master_path,
+                'to_master': to_master[0], 'to_master_dropped': to_master[1],
+                'to_server': to_server[0], 'to_server_dropped': to_server[1]}
+
+
+def open_links(count):
+    """
+    Opens `count` :class:`PtyLink`, closing the ones opened if one fails
+    (out of ptys)
+    """
+    links = []
+    try:
+        for _ in range(count):
+            links.append(PtyLink())
+    except OSError:
+        for link in links:
+            link.close()
+        raise
+    return links
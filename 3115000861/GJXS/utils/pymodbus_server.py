@@ -4,29 +4,50 @@ from __future__ import absolute_import, unicode_literals
 
 from pymodbus.server.sync import ModbusSerialServer
 from pymodbus.server.sync import ModbusTcpServer
+from pymodbus.server.sync import ModbusUdpServer
 from pymodbus.server.sync import ModbusSingleRequestHandler
+from pymodbus.server.sync import ModbusConnectedRequestHandler
+from pymodbus.server.sync import ModbusDisconnectedRequestHandler
 from pymodbus.device import ModbusDeviceIdentification
-from pymodbus.datastore import ModbusSequentialDataBlock
+from pymodbus.datastore.store import BaseModbusDataBlock
 from pymodbus.datastore import ModbusSlaveContext, ModbusServerContext
 
-from pymodbus.transaction import ModbusRtuFramer
+from pymodbus.transaction import ModbusAsciiFramer, ModbusRtuFramer
 
-from threading import Thread, RLock
+from threading import Event, Thread
 import logging
+import os
+import select
+import socket
+import struct
+import time
+
+from GJXS.utils.ascii_framing import AsciiFramer
+from GJXS.utils.block_index import BlockIndex
+from GJXS.utils.datagram import (
+    DatagramStats, drain, mbap_request, tune_socket)
+from GJXS.utils.datastore import (
+    ChangeFeed, SLAVE_ADDED, SLAVE_REMOVED, BLOCK_ADDED, BLOCK_REMOVED,
+    VALUES_CHANGED, REQUEST)
+from GJXS.utils.locking import StoreLock, merge_stats
+from GJXS.utils.monitor import RequestMonitor
+from GJXS.utils.pty_link import PTY_PORT, PtyLink, tty_settings
+from GJXS.utils.rtu_bus import RtuBus
+from GJXS.utils.rtu_framing import (
+    RtuFramer, crc_cache, read_frames, stream_frames)
+from GJXS.utils.slave_template import as_registers, as_template
 
 log = logging.getLogger(__name__)
 
 SERVERS = {
     "tcp": ModbusTcpServer,
-    "rtu": ModbusSerialServer
-}
-
-_FX_MAPPER = {
-    "Function_C15": 1,
-    'Function_C02': 2,
-    'Function_C16': 4,
-    'Function_C03': 3
+    "rtu": ModbusSerialServer,
+    "rtu_tcp": ModbusTcpServer,
+    "ascii": ModbusSerialServer,
+    "udp": ModbusUdpServer
 }
+# servers on a serial port, the others listen on a tcp port
+SERIAL_SERVERS = ("rtu", "ascii")
 
 _STORE_MAPPER = {
     "Function_C15": "c",
@@ -36,20 +57,250 @@ _STORE_MAPPER = {
 }
 
 
-class CustomDataBlock(ModbusSequentialDataBlock):
+_CONTEXT_KWARGS = {
+    "c": "co",
+    "d": "di",
+    "i": "ir",
+    "h": "hr"
+}
 
-    def __init__(self, *args, **kwargs):
-        super(CustomDataBlock, self).__init__(*args, **kwargs)
-        self._data_lock = RLock()
 
-    def update(self, size):
+class CustomDataBlock(BaseModbusDataBlock):
+    """
+    Data block of one table of a slave, made of any number of non
+    overlapping blocks found through a
+    :class:`~GJXS.utils.block_index.BlockIndex`, publishing every write
+    (from masters or the simulator) to a
+    :class:`~GJXS.utils.datastore.ChangeFeed`.
+
+    `validate`/`getValues`/`setValues` serve masters and need the request
+    range to fit in one block, `read`/`write` serve `ModbusSimu` and may
+    span adjacent blocks.
+
+    Writes serialize on a :class:`~GJXS.utils.locking.StoreLock`, reads
+    never wait for them (see `lock_class`).
+    """
+    # ModbusSlaveContext shifts addresses by one (zero_mode off), events
+    # carry the addresses as used by ModbusSimu
+    ADDRESS_OFFSET = 1
+    lock_class = StoreLock
+
+    def __init__(self, slave_id=None, block_name=None, feed=None,
+                 default_value=0):
+        self.slave_id = slave_id
+        self.block_name = block_name
+        self.feed = feed
+        self.default_value = default_value
+        self.address = self.ADDRESS_OFFSET
+        self._blocks = BlockIndex()
+        self._data_lock = self.lock_class()
+
+    def __str__(self):
+        return "CustomDataBlock(%s, blocks=%d)" % (self.block_name,
+                                                   len(self._blocks))
+
+    def __iter__(self):
+        for start, size, registers in self._blocks.spans():
+            for address, value in enumerate(registers, start):
+                yield address, value
+
+    def add_block(self, starting_address, registers):
+        """
+        Adds a block at `starting_address` storing its values in
+        `registers` (a list of values or copy-on-write registers). Raises
+        ValueError if it overlaps a block of the table.
+        """
+        # copy-on-write storage, readers need no lock
+        registers = as_registers(registers)
+        with self._data_lock:
+            self._blocks.add(self.ADDRESS_OFFSET + starting_address,
+                             len(registers), registers)
+        if self.feed:
+            self.feed.publish(BLOCK_ADDED, self.slave_id, self.block_name,
+                              starting_address, new=list(registers))
+
+    def clear(self):
+        """
+        Removes all the blocks of the table
+        """
         with self._data_lock:
-            values = [self.default_value] * size
-            self.values.extend(values)
+            spans = list(self._blocks.spans())
+            self._blocks.clear()
+        if self.feed:
+            for start, _, registers in spans:
+                self.feed.publish(BLOCK_REMOVED, self.slave_id,
+                                  self.block_name,
+                                  start - self.ADDRESS_OFFSET,
+                                  old=list(registers))
+
+    def reset(self):
+        with self._data_lock:
+            spans = []
+            for start, size, registers in self._blocks.spans():
+                spans.append((start, registers[:]))
+                registers[:] = [self.default_value] * size
+        if self.feed:
+            for start, old in spans:
+                self.feed.publish(VALUES_CHANGED, self.slave_id,
+                                  self.block_name,
+                                  start - self.ADDRESS_OFFSET, old,
+                                  [self.default_value] * len(old))
+
+    def validate(self, address, count=1):
+        # the index is read-copy-update, no lock needed
+        return self._blocks.find(address, count)[0] is not None
+
+    def _get(self, address, count):
+        registers, offset = self._blocks.find(address, count)
+        if registers is None:
+            return []
+        return registers[offset:offset + count]
+
+    def getValues(self, address, count=1):
+        return self._data_lock.read(self._get, address, count)
+
+    def setValues(self, address, values):
+        if not isinstance(values, list):
+            values = [values]
+        count = len(values)
+        with self._data_lock:
+            registers, offset = self._blocks.find(address, count)
+            if registers is None:
+                raise ValueError("address %s count %s is out of table %s" % (
+                    address - self.ADDRESS_OFFSET, count, self.block_name))
+            old = registers[offset:offset + count] if self.feed else None
+            registers[offset:offset + count] = values
+        if self.feed:
+            self.feed.publish(VALUES_CHANGED, self.slave_id, self.block_name,
+                              address - self.ADDRESS_OFFSET, old, values)
+
+    def _read_runs(self, runs):
+        values = []
+        for registers, offset, run in runs:
+            values.extend(registers[offset:offset + run])
+        return values
+
+    def read(self, address, count=1):
+        """
+        Values of the `count` registers from `address` (as used by
+        ModbusSimu), None if some are in no block. Reads are consistent
+        snapshots, also across adjacent blocks.
+        """
+        address += self.ADDRESS_OFFSET
+        registers, offset = self._blocks.find(address, count)
+        if registers is not None:
+            return self._data_lock.read(registers.__getitem__,
+                                        slice(offset, offset + count))
+        runs = self._blocks.split(address, count)
+        if runs is None:
+            return None
+        return self._data_lock.read_spanning(self._read_runs, runs)
+
+    def write(self, address, values):
+        """
+        Writes `values` from `address` (as used by ModbusSimu), returns
+        False without writing if some addresses are in no block. Writes
+        are published at once, also across adjacent blocks.
+        """
+        count = len(values)
+        registers, offset = self._blocks.find(
+            self.ADDRESS_OFFSET + address, count)
+        if registers is not None:
+            runs = [(registers, offset, count)]
+            lock = self._data_lock
+        else:
+            runs = self._blocks.split(self.ADDRESS_OFFSET + address, count)
+            if runs is None:
+                return False
+            lock = self._data_lock.spanning()
+        feed = self.feed
+        with lock:
+            written = 0
+            for registers, offset, run in runs:
+                new = values[written:written + run]
+                old = registers[offset:offset + run] if feed else None
+                registers[offset:offset + run] = new
+                if feed:
+                    feed.publish(VALUES_CHANGED, self.slave_id,
+                                 self.block_name, address + written, old,
+                                 new)
+                written += run
+        return True
+
+    @property
+    def lock(self):
+        return self._data_lock
+
+
+class SimuSlaveContext(ModbusSlaveContext):
+    """
+    Slave context built from the given blocks only. ModbusSlaveContext
+    evaluates its fully populated default blocks (4 x 65536 registers) even
+    when every block is passed in, which dominates adding slaves.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.store = {
+            'd': kwargs['di'],
+            'c': kwargs['co'],
+            'i': kwargs['ir'],
+            'h': kwargs['hr']
+        }
+        self.zero_mode = kwargs.get('zero_mode', False)
+
+
+def _request_range(request):
+    """
+    `(address, count)` of a decoded request, (None, 0) for requests not
+    addressing registers.
+    """
+    address = getattr(request, 'address', None)
+    if address is None:
+        return None, 0
+    count = getattr(request, 'count', None)
+    if count is None:
+        values = getattr(request, 'values', None)
+        count = len(values) if values is not None else 1
+    return address, count
+
+
+def _execute(handler_cls, handler, request):
+    """
+    Runs `request` through `handler_cls.execute`, publishing a request event
+    to the server feed first and recording it in the server monitor.
+    Requests are discarded unanswered while the server is paused. The
+    socketserver handlers are old style classes on python 2, hence no
+    super().
+    """
+    server = handler.server
+    if server.paused:
+        return
+    feed = getattr(server, 'feed', None)
+    if feed:
+        feed.publish(REQUEST, request.unit_id, address=request.function_code)
+    monitor = getattr(server, 'monitor', None)
+    if monitor is None or not monitor.enabled:
+        return handler_cls.execute(handler, request)
+    handler.response = None
+    started = time.time()
+    handler_cls.execute(handler, request)
+    latency = time.time() - started
+    response = handler.response
+    exception = None
+    if response is not None and response.isError():
+        exception = getattr(response, 'exception_code', None)
+    client = handler.client_address
+    if isinstance(client, tuple):
+        client = "%s:%s" % client[:2] if client[0] != client[1] else client[0]
+    address, count = _request_range(request)
+    monitor.record(client, request.unit_id, request.function_code, address,
+                   count, latency, exception)
 
 
 class CustomSingleRequestHandler(ModbusSingleRequestHandler):
 
+    response = None
+
     def __init__(self, request, client_address, server):
         self.request = request
         self.client_address = client_address
@@ -57,13 +308,324 @@ class CustomSingleRequestHandler(ModbusSingleRequestHandler):
         self.running = True
         self.setup()
 
+    def execute(self, request):
+        _execute(ModbusSingleRequestHandler, self, request)
+
+    def send(self, message):
+        self.response = message
+        bus = self.server.bus
+        if bus is None or not message.should_respond:
+            return ModbusSingleRequestHandler.send(self, message)
+        bus.respond(message.unit_id, self.framer.buildPacket(message),
+                    self.request.write)
+
+    def handle_once(self):
+        """
+        Reads what the serial port holds and processes the requests it
+        completes, see :class:`~GJXS.utils.rtu_framing.RtuFramer` (the
+        server `line_framer`), timed by the server `bus` if any
+        """
+        bus = self.server.bus
+        try:
+            for frame in read_frames(self.request, self.server.line_framer):
+                if bus is not None:
+                    bus.request(len(frame))
+                # frames are whole, drop what a bad frame left behind
+                self.framer.resetFrame()
+                _process(self, frame)
+        except Exception as msg:
+            self.framer.resetFrame()
+            log.debug("Error: Socket error occurred %s" % msg)
+
+
+class CustomConnectedRequestHandler(ModbusConnectedRequestHandler):
+
+    response = None
+
+    def execute(self, request):
+        _execute(ModbusConnectedRequestHandler, self, request)
+
+    def send(self, message):
+        self.response = message
+        return ModbusConnectedRequestHandler.send(self, message)
+
+
+class DatagramRequestHandler(ModbusDisconnectedRequestHandler):
+    """
+    Handler of every datagram of a :class:`MbusUdpServer`, whichever the
+    peer: :meth:`MbusUdpServer._datagram` sets the `client_address` to
+    answer before processing a request
+    """
+
+    response = None
+
+    def __init__(self, server):
+        self.request = None
+        # the peer of each datagram, the server until the first one
+        self.client_address = server.server_address
+        self.server = server
+        self.setup()
+
+    def execute(self, request):
+        _execute(ModbusDisconnectedRequestHandler, self, request)
+
+    def send(self, message):
+        self.response = message
+        if message.should_respond:
+            self.server.datagrams.send(self.server.socket,
+                                       self.framer.buildPacket(message),
+                                       self.client_address)
+
+
+class ReactorRequestHandler(CustomConnectedRequestHandler):
+    """
+    Handler of a tcp client served from a
+    :class:`~GJXS.utils.reactor.Reactor`, processing what the client sent
+    on each :meth:`handle_once` rather than looping in a thread of its own
+    """
+
+    def __init__(self, request, client_address, server):
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+        self.setup()
+
+    def handle_once(self):
+        try:
+            data = self.request.recv(1024)
+        except socket.error as msg:
+            log.error("Socket error occurred %s" % msg)
+            data = b""
+        if not data:
+            self.running = False
+            return
+        try:
+            _process(self, data)
+        except Exception as msg:
+            self.framer.resetFrame()
+            log.error("Error while handling request %s" % msg)
+
+
+class SimuRtuFramer(ModbusRtuFramer):
+    """
+    ModbusRtuFramer checking and building the CRCs with
+    :data:`~GJXS.utils.rtu_framing.crc_cache` rather than the byte by byte
+    `computeCRC` of pymodbus
+    """
+
+    def checkFrame(self):
+        try:
+            self.populateHeader()
+            return crc_cache.check(self._buffer[:self._header['len']])
+        except (IndexError, KeyError):
+            return False
+
+    def buildPacket(self, message):
+        packet = struct.pack(">BB", message.unit_id,
+                             message.function_code) + message.encode()
+        return packet + crc_cache.trailer(packet)
+
+
+class SimuRtuTcpFramer(SimuRtuFramer):
+    """
+    SimuRtuFramer of a client sending rtu frames over tcp: the stream is
+    split by an :class:`~GJXS.utils.rtu_framing.RtuFramer` without
+    silences first, so that several requests in one read, or one request
+    across reads, are all served
+    """
+
+    def __init__(self, decoder, client=None):
+        SimuRtuFramer.__init__(self, decoder, client)
+        self._frames = RtuFramer(silences=False)
+
+    def processIncomingPacket(self, data, callback, unit, **kwargs):
+        for frame in stream_frames(self._frames, data):
+            # frames are whole, drop what a bad frame left behind
+            self.resetFrame()
+            SimuRtuFramer.processIncomingPacket(self, frame, callback, unit,
+                                                **kwargs)
+
+
+def _process(handler, data):
+    context = handler.server.context
+    handler.framer.processIncomingPacket(data, handler.execute,
+                                         context.slaves(),
+                                         single=context.single)
+
+
+class MbusTcpServer(ModbusTcpServer):
+    """
+    :class:`ModbusTcpServer` which can also be served from a
+    :class:`~GJXS.utils.reactor.Reactor`, with no thread per client: the
+    reactor accepts clients on the listening socket and calls the
+    :class:`ReactorRequestHandler` of a client whenever it is readable.
+    """
+    READER_NAME = "modbus_server"
+    _reactor = None
+    # requests are discarded while paused, see `ModbusSimu.pause`
+    paused = False
+    # SO_REUSEADDR, a new server on the port does not fail on the
+    # connections of the previous one left in TIME_WAIT
+    allow_reuse_address = os.name != "nt"
+
+    @property
+    def attached(self):
+        return self._reactor is not None
+
+    @property
+    def reader_name(self):
+        # one reactor task per endpoint, servers share a reactor
+        host, port = self.server_address[:2]
+        return "%s %s:%s" % (self.READER_NAME, host, port)
+
+    def attach(self, reactor):
+        self._clients = {}
+        self._reactor = reactor
+        reactor.add_reader(self.reader_name, self._readable,
+                           self._on_readable)
+
+    def detach(self):
+        reactor, self._reactor = self._reactor, None
+        if reactor is not None:
+            reactor.run_sync(self._detach, reactor)
+
+    def _detach(self, reactor):
+        reactor.remove_reader(self.reader_name)
+        for request in list(self._clients):
+            self._disconnect(request)
+
+    def _readable(self):
+        return [self.socket] + list(self._clients)
+
+    def _on_readable(self, ready):
+        for request in ready:
+            if request is self.socket:
+                self._accept()
+                continue
+            handler = self._clients.get(request)
+            if handler is None:
+                continue
+            handler.handle_once()
+            if not handler.running:
+                self._disconnect(request)
+
+    def _accept(self):
+        try:
+            request, client_address = self.get_request()
+        except socket.error:
+            return
+        if not self.verify_request(request, client_address):
+            self.shutdown_request(request)
+            return
+        self._clients[request] = ReactorRequestHandler(request,
+                                                       client_address, self)
+
+    def _disconnect(self, request):
+        handler = self._clients.pop(request)
+        handler.running = False
+        handler.finish()
+        self.shutdown_request(request)
+
+
+class MbusUdpServer(ModbusUdpServer):
+    """
+    :class:`ModbusUdpServer` serving the datagrams from its thread or a
+    :class:`~GJXS.utils.reactor.Reactor` with a single
+    :class:`DatagramRequestHandler`, instead of a thread per datagram (see
+    :mod:`GJXS.utils.datagram`). The datagrams are counted in `datagrams`,
+    the socket stays bound across :meth:`shutdown` and restarts.
+    """
+    READER_NAME = "modbus_server"
+    _reactor = None
+    # requests are discarded while paused, see `ModbusSimu.pause`
+    paused = False
+    is_running = False
+
+    def __init__(self, *args, **kwargs):
+        ModbusUdpServer.__init__(self, *args, **kwargs)
+        tune_socket(self.socket)
+        self.datagrams = DatagramStats()
+        self.datagrams.bound(self.socket)
+        self.handler = DatagramRequestHandler(self)
+        self._stopped = Event()
+        self._stopped.set()
+
+    @property
+    def attached(self):
+        return self._reactor is not None
+
+    @property
+    def reader_name(self):
+        # one reactor task per endpoint, servers share a reactor
+        host, port = self.server_address[:2]
+        return "%s udp %s:%s" % (self.READER_NAME, host, port)
+
+    def attach(self, reactor):
+        self._reactor = reactor
+        reactor.add_reader(self.reader_name, lambda: [self.socket],
+                           lambda ready: self._drain())
+
+    def detach(self):
+        reactor, self._reactor = self._reactor, None
+        if reactor is not None:
+            reactor.run_sync(reactor.remove_reader, self.reader_name)
+
+    def serve_forever(self, poll_interval=0.5):
+        self._stopped.clear()
+        self.is_running = True
+        try:
+            while self.is_running:
+                ready = select.select([self.socket], [], [],
+                                      poll_interval)[0]
+                if ready:
+                    self._drain()
+        except (select.error, socket.error, ValueError):
+            # socket closed by `server_close`
+            pass
+        finally:
+            self._stopped.set()
+
+    def shutdown(self):
+        self.is_running = False
+        self._stopped.wait()
+
+    def _drain(self):
+        drain(self.socket, self._datagram)
+
+    def _datagram(self, datagram, address):
+        datagrams = self.datagrams
+        datagrams.received += 1
+        if not mbap_request(datagram):
+            datagrams.malformed += 1
+            return
+        handler = self.handler
+        handler.client_address = address
+        handler.framer.resetFrame()
+        try:
+            _process(handler, datagram)
+        except Exception as msg:
+            log.error("Error while handling request %s" % msg)
+
 
 class MbusSerialServer(ModbusSerialServer):
 
+    READER_NAME = "modbus_server"
+    _reactor = None
+    # requests are discarded while paused, see `ModbusSimu.pause`
+    paused = False
+
     handler = None
+    # rtu line timing, see `GJXS.utils.rtu_bus.RtuBus`
+    bus = None
 
     def __init__(self, *args, **kwargs):
         super(MbusSerialServer, self).__init__(*args, **kwargs)
+        # splits the requests read, ascii or rtu as the pymodbus framer
+        if issubclass(self.framer, ModbusAsciiFramer):
+            self.line_framer = AsciiFramer()
+        else:
+            self.line_framer = RtuFramer(self.baudrate, self.bytesize,
+                                         self.parity, self.stopbits)
         self._build_handler()
 
     def _build_handler(self):
@@ -85,21 +647,75 @@ class MbusSerialServer(ModbusSerialServer):
         :param client: The address of the client
         '''
         log.debug("Started thread to serve client")
+        if not self.socket.is_open:
+            self.socket.open()
         if not self.handler:
             self._build_handler()
+        self.socket.timeout = self.line_framer.t35
+        self.is_running = True
         while self.is_running:
-            self.handler.handle()
+            # the port timeout is t3.5, wait for requests on the port
+            try:
+                ready = select.select([self.socket], [], [], self.timeout)[0]
+            except Exception:
+                # port closed by `server_close`
+                break
+            handler = self.handler
+            if ready and handler is not None:
+                handler.handle_once()
 
     def server_close(self):
         ''' Callback for stopping the running server
         '''
         log.debug("Modbus server stopped")
         self.is_running = False
-        self.handler.finish()
-        self.handler.running = False
-        self.handler = None
+        handler, self.handler = self.handler, None
+        if handler is not None:
+            handler.finish()
+            handler.running = False
         self.socket.close()
 
+    @property
+    def attached(self):
+        return self._reactor is not None
+
+    @property
+    def reader_name(self):
+        # one reactor task per endpoint, servers share a reactor
+        return "%s %s" % (self.READER_NAME, self.device)
+
+    def attach(self, reactor):
+        """
+        Serves the serial port from `reactor` (a
+        :class:`~GJXS.utils.reactor.Reactor`). The port timeout becomes the
+        rtu interframe silence, waited for only by requests of unknown
+        length (see `GJXS.utils.rtu_framing.read_frames`).
+        """
+        if not self.socket.is_open:
+            # closed by a previous `detach`
+            self.socket.open()
+        if not self.handler:
+            self._build_handler()
+        self.socket.timeout = self.line_framer.t35
+        self._reactor = reactor
+        reactor.add_reader(self.reader_name, self._readable,
+                           lambda ready: self.handler.handle_once())
+
+    def detach(self):
+        reactor, self._reactor = self._reactor, None
+        if reactor is not None:
+            reactor.run_sync(self._detach, reactor)
+
+    def _detach(self, reactor):
+        reactor.remove_reader(self.reader_name)
+        self.socket.timeout = self.timeout
+        self.server_close()
+
+    def _readable(self):
+        if self.handler and self.socket and self.socket.is_open:
+            return [self.socket]
+        return []
+
 
 class ThreadedModbusServer(Thread):
 
@@ -112,15 +728,29 @@ class ThreadedModbusServer(Thread):
         self._server.serve_forever()
 
     def stop(self):
-        if isinstance(self._server, ModbusTcpServer):
+        if isinstance(self._server, (ModbusTcpServer, MbusUdpServer)):
             self._server.shutdown()
         else:
             if self._server.socket:
                 self._server.server_close()
 
 
+# pymodbus framer per server type, mbap (ModbusSocketFramer) otherwise
+_FRAMERS = {
+    "rtu": SimuRtuFramer,
+    "rtu_tcp": SimuRtuTcpFramer,
+    "ascii": ModbusAsciiFramer
+}
+
+
 class ModbusSimu(object):
     _server_add = ()
+    # served from the server thread or a reactor, see `start`/`stop`
+    _running = False
+    # rtu line of port "pty", see `master_path`
+    link = None
+    # rtu line timing, see `bus_stats`
+    bus = None
 
     def __init__(self, server="tcp", *args, **kwargs):
         # initialize server information
@@ -132,17 +762,41 @@ class ModbusSimu(object):
         self.context = ModbusServerContext(single=False)
         self.simulate = kwargs.get('simulate', False)
         self.dirty = False
-        if server == "tcp":
+        # datastore change events (writes, blocks, requests)
+        self.feed = ChangeFeed()
+        if server not in SERIAL_SERVERS:
             self._port = int(self._port)
             self._address = kwargs.get("address", "localhost")
-            self.server = ModbusTcpServer(self.context,
-                                          identity=self.identity,
-                                          address=(self._address, self._port))
+            if server == "udp":
+                self.server = MbusUdpServer(
+                    self.context, identity=self.identity,
+                    address=(self._address, self._port))
+            else:
+                self.server = MbusTcpServer(
+                    self.context, framer=_FRAMERS.get(server),
+                    identity=self.identity,
+                    address=(self._address, self._port),
+                    handler=CustomConnectedRequestHandler)
         else:
+            turnaround = kwargs.pop('turnaround', None)
+            if turnaround is not None:
+                self.bus = RtuBus.from_settings(
+                    kwargs, turnaround, wire=self._port == PTY_PORT)
+            if self._port == PTY_PORT:
+                self.link = PtyLink()
+                kwargs = tty_settings(kwargs)
+                kwargs['port'] = self.link.server_path
             self.server = MbusSerialServer(self.context,
-                                             framer=ModbusRtuFramer,
+                                             framer=_FRAMERS[server],
                                              identity=self.identity, **kwargs)
+            self.server.bus = self.bus
+        self.server.feed = self.feed
+        # recent requests served, see `GJXS.utils.monitor`
+        self.monitor = RequestMonitor()
+        self.server.monitor = self.monitor
         self.server_thread = ThreadedModbusServer(self.server)
+        # (slave_id, block_name) -> CustomDataBlock, see `accessor`
+        self._accessors = {}
 
     def _add_device_info(self):
         self.identity.VendorName = 'Riptide'
@@ -160,72 +814,236 @@ class ModbusSimu(object):
     def port(self):
         return self._port
 
-    def _add_default_slave_context(self):
-        return ModbusSlaveContext(
-            di=CustomDataBlock(0, 0),
-            hr=CustomDataBlock(0, 0),
-            co=CustomDataBlock(0, 0),
-            ir=CustomDataBlock(0, 0),
+    @property
+    def master_path(self):
+        """
+        Tty the masters open when serving rtu on port "pty" (a
+        :class:`~GJXS.utils.pty_link.PtyLink`), None otherwise
+        """
+        if self.link is not None:
+            return self.link.master_path
+
+    def _add_default_slave_context(self, slave_id=None, template=None):
+        blocks = {}
+        for block_name, store in _STORE_MAPPER.items():
+            blocks[_CONTEXT_KWARGS[store]] = CustomDataBlock(
+                slave_id=slave_id, block_name=block_name, feed=self.feed)
+        if template is not None:
+            for block_name, _, starting_address, _ in template:
+                block = blocks[_CONTEXT_KWARGS[_STORE_MAPPER[block_name]]]
+                block.add_block(starting_address, template.registers(
+                    block_name, starting_address))
+        return SimuSlaveContext(**blocks)
 
-        )
+    def _drop_accessors(self, slave_id):
+        for block_name in _STORE_MAPPER:
+            self._accessors.pop((slave_id, block_name), None)
 
     def add_slave(self, slave_id):
-        self.context[slave_id] = self._add_default_slave_context()
+        self._drop_accessors(slave_id)
+        self.context[slave_id] = self._add_default_slave_context(slave_id)
+        self.feed.publish(SLAVE_ADDED, slave_id)
 
     def remove_slave(self, slave_id):
         del self.context[slave_id]
+        self._drop_accessors(slave_id)
+        self.feed.publish(SLAVE_REMOVED, slave_id)
+
+    def add_slaves(self, slave_ids, blocks=()):
+        """
+        Adds a range of slaves, each with `blocks` (a
+        :class:`~GJXS.utils.slave_template.SlaveTemplate` or `(block_name,
+        block_type, starting_address, size)` tuples). The slaves share the
+        template values until written. Slave contexts are built before being
+        published to the server context. Returns the ids added, existing
+        slaves are left untouched.
+        """
+        template = as_template(blocks)
+        contexts = []
+        for slave_id in slave_ids:
+            if slave_id in self.context:
+                continue
+            contexts.append((slave_id, self._add_default_slave_context(
+                slave_id, template)))
+        for slave_id, slave in contexts:
+            self.context[slave_id] = slave
+            self.feed.publish(SLAVE_ADDED, slave_id)
+        return [slave_id for slave_id, _ in contexts]
+
+    def remove_slaves(self, slave_ids):
+        """
+        Removes a range of slaves. Returns the ids removed.
+        """
+        removed = [slave_id for slave_id in slave_ids
+                   if slave_id in self.context]
+        for slave_id in removed:
+            del self.context[slave_id]
+            self._drop_accessors(slave_id)
+            self.feed.publish(SLAVE_REMOVED, slave_id)
+        return removed
 
     def remove_all_slave(self):
+        slave_ids = [slave_id for slave_id, _ in self.context]
         self.context = ModbusServerContext(single=False)
+        self._accessors.clear()
+        for slave_id in slave_ids:
+            self.feed.publish(SLAVE_REMOVED, slave_id)
+
+    def _store(self, slave_id, block_name):
+        return self.get_slave(slave_id).store[_STORE_MAPPER[block_name]]
 
     def add_block(self, slave_id, block_name, block_type, starting_add, size):
-        slave = self.get_slave(slave_id)
-        if not slave.validate(_FX_MAPPER[block_name], starting_add, count=size):
-            slave.store[_STORE_MAPPER[block_name]].update(size)
-        else:
-            log.debug("Block '{}' on slave '{}' already exists".format(block_name, slave_id))
+        store = self._store(slave_id, block_name)
+        try:
+            store.add_block(starting_add, [store.default_value] * size)
+        except ValueError:
+            log.debug("Block '{}' at {} on slave '{}' overlaps an existing "
+                      "block".format(block_name, starting_add, slave_id))
 
     def remove_block(self, slave_id, block_name):
-        slave = self.get_slave(slave_id)
-        slave.store[_STORE_MAPPER[block_name]].reset()
+        self._store(slave_id, block_name).clear()
 
     def remove_all_blocks(self, slave_id):
-        slave = self.get_slave(slave_id)
-        slave.remove_all_blocks()
+        for store in self.get_slave(slave_id).store.values():
+            store.clear()
+
+    def accessor(self, slave_id, block_name):
+        """
+        Handle on the `block_name` table of `slave_id`, with
+        `read(address, count)` and `write(address, values)` going straight
+        to the table store, without the server context lookup and request
+        validation of every call. Handles are cached per (slave, table) and
+        dropped from the cache when the slave is removed or replaced, a
+        handle kept by the caller past that point is detached from the
+        server.
+        """
+        try:
+            return self._accessors[slave_id, block_name]
+        except KeyError:
+            store = self._accessors[slave_id, block_name] = self._store(
+                slave_id, block_name)
+            return store
 
     def set_values(self, slave_id, block_name, address, values):
-        values = values if isinstance(values, (list, tuple)) else [values]
-        slave = self.get_slave(slave_id)
-        if slave.validate(_FX_MAPPER[block_name], address, count=len(values)):
-            slave.setValues(_FX_MAPPER[block_name], address, values)
+        values = list(values) if isinstance(values, (list, tuple)) \
+            else [values]
+        self.accessor(slave_id, block_name).write(address, values)
 
     def get_values(self, slave_id, block_name, address, size=1):
-        slave = self.get_slave(slave_id)
-        if slave.validate(_FX_MAPPER[block_name], address, count=size):
-            return slave.getValues(_FX_MAPPER[block_name], address, size)
+        return self.accessor(slave_id, block_name).read(address, size)
 
     def get_slave(self, slave_id):
         return self.context[slave_id]
 
-    def start(self):
+    def lock_stats(self):
+        """
+        Contention counters of the table locks of all the slaves, see
+        :class:`~GJXS.utils.locking.StoreLock`
+        """
+        return merge_stats(store.lock for _, slave in list(self.context)
+                           for store in slave.store.values())
+
+    def start(self, reactor=None):
+        """
+        Starts serving requests, from the server thread or from `reactor`
+        (a :class:`~GJXS.utils.reactor.Reactor`)
+        """
+        self.server.paused = False
+        self._running = True
+        if self.link is not None:
+            self.link.start(reactor)
+        if reactor is not None:
+            if self.bus is not None:
+                self.bus.attach(reactor)
+            self.server.attach(reactor)
+            return
         if self.dirty:
             self.server_thread = ThreadedModbusServer(self.server)
         self.server_thread.start()
 
     def stop(self):
-        self.server_thread.stop()
+        if self.server.attached:
+            self.server.detach()
+        else:
+            self.server_thread.stop()
+        if self.bus is not None:
+            self.bus.detach()
+        # the pty line is kept, masters stay connected across restarts
+        if self.link is not None:
+            self.link.stop()
         self.dirty = True
-        # if self._server_type == 'rtu':
-        #     self._serial.close()
-        # self._server_add = ()
+        self._running = False
+
+    def close(self):
+        """
+        Stops the server if running and releases its socket or serial port
+        and the pty line if any
+        """
+        if self._running:
+            self.stop()
+        if self._server_type not in SERIAL_SERVERS:
+            self.server.server_close()
+        elif self.server.socket is not None:
+            self.server.socket.close()
+        if self.link is not None:
+            self.link.close()
+
+    @property
+    def paused(self):
+        return self.server.paused
+
+    def pause(self):
+        """
+        Stops answering requests while keeping the bound socket or open
+        serial port, the client connections, the datastore and the server
+        threads or reactor task, see :meth:`resume`. Requests received while
+        paused are discarded.
+        """
+        self.server.paused = True
+
+    def resume(self):
+        """
+        Answers requests again after :meth:`pause`, at once
+        """
+        self.server.paused = False
+
+    def set_response_delay(self, slave_id, delay):
+        """
+        Response delay of `slave_id` on the rtu line, in seconds, None for
+        the `turnaround` of the line. Requires a bus model (`turnaround`
+        given), see :class:`~GJXS.utils.rtu_bus.RtuBus`.
+        """
+        if self.bus is None:
+            raise ValueError("no bus model, give a turnaround to the "
+                             "rtu server")
+        self.bus.set_response_delay(slave_id, delay)
+
+    def bus_stats(self):
+        """
+        Utilization and turnaround of the rtu line (see
+        :meth:`~GJXS.utils.rtu_bus.RtuBus.stats`), None without a bus model
+        """
+        if self.bus is not None:
+            return self.bus.stats()
+
+    def datagram_stats(self):
+        """
+        Datagrams served and dropped by a udp server (see
+        :meth:`~GJXS.utils.datagram.DatagramStats.stats`), None otherwise
+        """
+        datagrams = getattr(self.server, 'datagrams', None)
+        if datagrams is not None:
+            return datagrams.stats()
 
     def get_slaves(self):
-        if self.server is not None:
-            return self.server._databank._slaves
+        """
+        `{slave_id: slave context}` of the slaves of the server context
+        """
+        return dict(self.context)
 
 
 if __name__ == "__main__":
-    s = ModbusSimu(server="rtu", port="/dev/ptyp0")
+    s = ModbusSimu(server="rtu", port=PTY_PORT)
     # s = ModbusSimu(address="localhost", port=5020)
     s.start()
     s.add_slave(1)
@@ -0,0 +1,363 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import functools
+import heapq
+import logging
+import select
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from itertools import count
+
+log = logging.getLogger(__name__)
+
+
+def _thread_time_func():
+    """
+    CPU time of the calling thread, from `time.thread_time` (python >= 3.7),
+    `getrusage(RUSAGE_THREAD)` on linux, else the process CPU time
+    """
+    thread_time = getattr(time, "thread_time", None)
+    if thread_time is not None:
+        return thread_time
+    try:
+        import resource
+        rusage_thread = getattr(resource, "RUSAGE_THREAD",
+                                1 if sys.platform.startswith("linux") else None)
+        if rusage_thread is not None:
+            resource.getrusage(rusage_thread)
+
+            def thread_time():
+                usage = resource.getrusage(rusage_thread)
+                return usage.ru_utime + usage.ru_stime
+            return thread_time
+    except (ImportError, ValueError, OSError):
+        pass
+    return getattr(time, "process_time", None) or time.clock
+
+
+thread_time = _thread_time_func()
+
+
+def _wakeup_pair():
+    """
+    Connected pair of sockets, writing to the second one wakes up a select
+    on the first one (windows can only select sockets)
+    """
+    if hasattr(socket, "socketpair"):
+        reader, writer = socket.socketpair()
+    else:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        writer = socket.create_connection(listener.getsockname())
+        reader, _ = listener.accept()
+        listener.close()
+    reader.setblocking(0)
+    writer.setblocking(0)
+    return reader, writer
+
+
+class ReactorTask(object):
+    """
+    Work run by a :class:`Reactor`, with its call count and the CPU and
+    wall clock time spent in it. Periodic tasks (:meth:`Reactor.call_every`)
+    have the `interval` and `cancel()` of a
+    :class:`~GJXS.utils.backgroundJob.BackgroundJob`, `once` tasks
+    (:meth:`Reactor.call_later`) run a single time.
+    """
+
+    def __init__(self, reactor, name, func, interval=None, once=False):
+        self._reactor = reactor
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.once = once
+        self.cancelled = False
+        self.calls = 0
+        self.cpu_time = 0.0
+        self.wall_time = 0.0
+
+    def __repr__(self):
+        return '<%s %s calls=%d>' % (self.__class__.__name__, self.name,
+                                     self.calls)
+
+    @property
+    def kind(self):
+        return "reader" if self.interval is None and not self.once \
+            else "timer"
+
+    def cancel(self):
+        self.cancelled = True
+        self._reactor.wakeup()
+
+    def run(self, *args):
+        cpu = thread_time()
+        started = time.time()
+        try:
+            self.func(*args)
+        except Exception:
+            log.exception("reactor task %s failed", self.name)
+        finally:
+            self.calls += 1
+            self.wall_time += time.time() - started
+            self.cpu_time += thread_time() - cpu
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'interval': self.interval,
+            'calls': self.calls,
+            'cpu_time': self.cpu_time,
+            'wall_time': self.wall_time
+        }
+
+
+class Reactor(object):
+    """
+    Single thread running the modbus server, the simulation ticks and the
+    GUI sync, instead of one thread each (and one per client with pymodbus).
+
+    Work is either periodic (:meth:`call_every`) or runs when file objects
+    become readable (:meth:`add_reader`), from one `select` loop, so requests
+    and ticks never preempt each other and there is no context switch nor
+    GIL handoff between them. Tasks must not block: a task holding the loop
+    delays every other one, which :meth:`stats` makes visible per task.
+
+    Readers and timers may be added and cancelled from any thread, other
+    work is handed to the reactor thread with :meth:`call_soon` or
+    :meth:`run_sync`::
+
+        reactor = Reactor()
+        reactor.start()
+        tick = reactor.call_every("simulation", 1.0, simulate)
+        tick.interval = 0.5
+        reactor.add_reader("modbus_server", lambda: sockets, on_readable)
+        reactor.run_sync(close_sockets)
+        reactor.stop()
+    """
+
+    def __init__(self, name="reactor"):
+        self.name = name
+        self._thread = None
+        self._running = False
+        self._timers = []
+        self._sequence = count()
+        self._readers = {}
+        self._pending = deque()
+        self._wakeup_reader, self._wakeup_writer = _wakeup_pair()
+
+    def __repr__(self):
+        return '<%s %s running=%s>' % (self.__class__.__name__, self.name,
+                                       self.running)
+
+    @property
+    def running(self):
+        return self._running
+
+    def in_reactor(self):
+        """
+        True when called from the reactor thread
+        """
+        return threading.current_thread() is self._thread
+
+    def wakeup(self):
+        """
+        Interrupts the `select` of the loop, to account for new work
+        """
+        try:
+            self._wakeup_writer.send(b"x")
+        except socket.error:
+            # buffer full, the loop is already due to wake up
+            pass
+
+    def call_every(self, name, interval, func, delay=0):
+        """
+        Runs `func()` every `interval` seconds, first after `delay`. Returns
+        the :class:`ReactorTask`, whose `interval` may be changed and which
+        is dropped once cancelled.
+        """
+        task = ReactorTask(self, name, func, interval)
+        self._schedule(task, time.time() + delay)
+        return task
+
+    def call_later(self, name, delay, func, *args):
+        """
+        Runs `func(*args)` once, after `delay` seconds. Returns the
+        :class:`ReactorTask`, which may be cancelled until it ran.
+        """
+        task = ReactorTask(self, name, functools.partial(func, *args),
+                           once=True)
+        self._schedule(task, time.time() + delay)
+        return task
+
+    def _schedule(self, task, deadline):
+        entry = (deadline, next(self._sequence), task)
+        if self.in_reactor() or not self._running:
+            heapq.heappush(self._timers, entry)
+        else:
+            # the heap is only modified by the reactor thread
+            self.call_soon(heapq.heappush, self._timers, entry)
+
+    def add_reader(self, name, fileobjs, handler):
+        """
+        Calls `handler(ready)` with the readable objects among those
+        returned by `fileobjs()` (sockets or anything with a `fileno()`),
+        which is evaluated on every turn of the loop. Replaces the reader
+        `name` if any. Returns the :class:`ReactorTask`.
+        """
+        task = ReactorTask(self, name, handler)
+        self._readers[name] = (fileobjs, task)
+        self.wakeup()
+        return task
+
+    def remove_reader(self, name):
+        if self._readers.pop(name, None) is not None:
+            self.wakeup()
+
+    def call_soon(self, func, *args):
+        """
+        Runs `func(*args)` in the reactor thread, on its next turn
+        """
+        self._pending.append((func, args))
+        self.wakeup()
+
+    def run_sync(self, func, *args):
+        """
+        Runs `func(*args)` in the reactor thread and returns its result,
+        directly when called from the reactor thread or when it is stopped
+        """
+        if self.in_reactor() or not self._running:
+            return func(*args)
+        done = threading.Event()
+        outcome = {}
+
+        def call():
+            try:
+                outcome['result'] = func(*args)
+            except Exception as excpt:
+                outcome['error'] = excpt
+            finally:
+                done.set()
+        self.call_soon(call)
+        done.wait()
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('result')
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the loop once its current turn is over, pending timers and
+        readers are kept for a restart
+        """
+        if not self._running:
+            return
+        self._running = False
+        self.wakeup()
+        if not self.in_reactor():
+            self._thread.join()
+
+    def _run(self):
+        log.info("Start %s thread" % self.name)
+        while self._running:
+            self._turn()
+        log.info("Stop %s thread" % self.name)
+
+    def _timeout(self):
+        timers = self._timers
+        while timers and timers[0][2].cancelled:
+            heapq.heappop(timers)
+        if self._pending:
+            return 0
+        if not timers:
+            return None
+        return max(0, timers[0][0] - time.time())
+
+    def _turn(self):
+        """
+        One turn of the loop: waits for readable objects or the next timer,
+        then runs the handed over calls, the readers and the due timers
+        """
+        owners = {}
+        for name, (fileobjs, task) in list(self._readers.items()):
+            try:
+                for fileobj in fileobjs():
+                    owners[fileobj] = task
+            except Exception:
+                log.exception("reactor reader %s failed", name)
+        waiting = [self._wakeup_reader] + list(owners)
+        try:
+            ready = select.select(waiting, [], [], self._timeout())[0]
+        except (select.error, socket.error, ValueError, TypeError) as excpt:
+            # a reader closed one of its objects since it was listed
+            log.debug("%s select failed: %s", self.name, excpt)
+            ready = []
+            time.sleep(0.001)
+        if self._wakeup_reader in ready:
+            ready.remove(self._wakeup_reader)
+            try:
+                while self._wakeup_reader.recv(4096):
+                    pass
+            except socket.error:
+                pass
+        while self._pending:
+            func, args = self._pending.popleft()
+            try:
+                func(*args)
+            except Exception:
+                log.exception("%s call failed", self.name)
+        by_task = {}
+        for fileobj in ready:
+            by_task.setdefault(owners[fileobj], []).append(fileobj)
+        for task, objs in by_task.items():
+            task.run(objs)
+        self._run_timers()
+
+    def _run_timers(self):
+        timers = self._timers
+        now = time.time()
+        while timers and timers[0][0] <= now:
+            deadline, _, task = heapq.heappop(timers)
+            if task.cancelled:
+                continue
+            task.run()
+            if task.once:
+                # ran, no longer listed by `tasks`
+                task.cancelled = True
+            elif not task.cancelled:
+                # no catch up burst after an overrun
+                now = time.time()
+                heapq.heappush(timers, (max(deadline + task.interval, now),
+                                        next(self._sequence), task))
+
+    def tasks(self):
+        """
+        Live :class:`ReactorTask` of the reactor, readers first
+        """
+        readers = [task for _, task in list(self._readers.values())]
+        timers = [task for _, _, task in list(self._timers)
+                  if not task.cancelled]
+        return readers + sorted(timers, key=lambda task: task.name)
+
+    def stats(self):
+        """
+        Thread count of the process and per task calls, CPU and wall clock
+        seconds
+        """
+        return {
+            'threads': threading.active_count(),
+            'tasks': [task.stats() for task in self.tasks()]
+        }
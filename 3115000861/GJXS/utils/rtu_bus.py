@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Model of the half-duplex RS-485 line an rtu server answers on: one frame
+on the line at a time, whichever slave it is for, each slave answering
+after its response delay (turnaround), frames t3.5 apart. The simulator
+then answers with the timing of a real multidrop bus, so that the scan
+time of a polling schedule measured against it (or estimated with
+:meth:`RtuBus.scan_time`) holds on site::
+
+    device = ModbusSimu(server="rtu", port="pty", baudrate=19200,
+                        turnaround=0.005)
+    device.set_response_delay(7, 0.020)
+    device.bus_stats()['utilization']
+"""
+from __future__ import absolute_import, unicode_literals
+
+import struct
+import time
+
+from GJXS.utils.rtu_framing import char_time, frame_timing
+
+# reactor tasks of the responses sent late
+_TASK_NAME = "rtu_bus"
+
+
+def _sleep_and_call(delay, func, *args):
+    if delay > 0:
+        time.sleep(delay)
+    func(*args)
+
+
+def frame_unit(frame):
+    """
+    Unit (slave id) of an rtu frame
+    """
+    (unit, ) = struct.unpack_from(">B", frame)
+    return unit
+
+
+class RtuBus(object):
+    """
+    Half-duplex line of an rtu server. The server reports every request
+    read (:meth:`request`) and hands over its response (:meth:`respond`),
+    which is written once the slave turned around and the line is free.
+
+    A pty line (`wire=True`) delivers bytes at once, the model then also
+    spends the time the frames take on the wire: a response is written
+    when its last byte would have been received. A real serial port paces
+    the bytes itself, the response is written when it may start.
+
+    Responses are delayed from the server thread (it sleeps), or from the
+    reactor serving the port once :meth:`attach` ed.
+
+    Args:
+        baudrate, bytesize, parity, stopbits: Serial settings of the line.
+        turnaround: Default response delay of the slaves, in seconds.
+        wire: True if the port does not pace the bytes at the baudrate.
+    """
+
+    def __init__(self, baudrate, bytesize=8, parity="N", stopbits=1,
+                 turnaround=0.0, wire=True):
+        self._char = char_time(baudrate, bytesize, parity, stopbits)
+        self.t15, self.t35 = frame_timing(baudrate, bytesize, parity,
+                                          stopbits)
+        self.turnaround = turnaround
+        self.wire = wire
+        # slave_id -> response delay, `turnaround` otherwise
+        self._delays = {}
+        self._schedule = _sleep_and_call
+        self._reactor = None
+        self._queued = set()
+        # when the line is idle again, when the last request ended
+        self._free_at = 0.0
+        self._request_end = 0.0
+        self.clear()
+
+    @classmethod
+    def from_settings(cls, settings, turnaround=0.0, wire=True):
+        """
+        Bus of a line opened with the serial `settings` (keyword arguments
+        of the port, pyserial defaults for those missing)
+        """
+        return cls(settings.get('baudrate', 9600),
+                   settings.get('bytesize', 8),
+                   settings.get('parity', "N"),
+                   settings.get('stopbits', 1),
+                   turnaround=turnaround, wire=wire)
+
+    def __repr__(self):
+        return '<%s %.0f%% busy>' % (self.__class__.__name__,
+                                     self.utilization() * 100)
+
+    def attach(self, reactor):
+        """
+        Delays the responses with timers of `reactor` (a
+        :class:`~GJXS.utils.reactor.Reactor`), which serves the port
+        """
+        self._reactor = reactor
+        self._schedule = self._call_later
+
+    def detach(self):
+        """
+        Back to sleeping in the server thread, the responses not sent yet
+        are dropped
+        """
+        queued, self._queued = self._queued, set()
+        for task in queued:
+            task.cancel()
+        self._reactor = None
+        self._schedule = _sleep_and_call
+
+    def _call_later(self, delay, func, *args):
+        if delay <= 0:
+            func(*args)
+            return
+        holder = []
+
+        def send():
+            self._queued.discard(holder[0])
+            func(*args)
+        task = self._reactor.call_later(_TASK_NAME, delay, send)
+        holder.append(task)
+        self._queued.add(task)
+
+    def response_delay(self, slave_id):
+        return self._delays.get(slave_id, self.turnaround)
+
+    def set_response_delay(self, slave_id, delay):
+        """
+        Response delay of `slave_id` in seconds, after the t3.5 silence
+        ending the request, None for the default `turnaround`
+        """
+        if delay is None:
+            self._delays.pop(slave_id, None)
+        else:
+            self._delays[slave_id] = delay
+
+    def wire_time(self, length):
+        return length * self._char
+
+    def request(self, length, now=None):
+        """
+        Accounts a request of `length` bytes, just read
+        """
+        now = time.time() if now is None else now
+        duration = length * self._char
+        if self.wire:
+            # on the line once the previous frame and silence are over
+            self._request_end = max(now, self._free_at) + duration
+        else:
+            self._request_end = now
+        self._free_at = max(self._free_at, self._request_end + self.t35)
+        self._busy += duration
+        self.requests += 1
+
+    def respond(self, slave_id, response, write, now=None):
+        """
+        Sends `response` (the bytes of the frame answering the last
+        request) with `write` when `slave_id` would have answered it
+        """
+        now = time.time() if now is None else now
+        # t3.5 after the request at the earliest, the line may be busy still
+        start = max(self._request_end + self.t35 +
+                    self.response_delay(slave_id), self._free_at)
+        duration = len(response) * self._char
+        end = start + duration
+        self._free_at = end + self.t35
+        self._busy += duration
+        self._turnaround += start - self._request_end
+        self.responses += 1
+        slave = self._slaves.setdefault(slave_id, [0, 0.0])
+        slave[0] += 1
+        slave[1] += duration
+        self._schedule((end if self.wire else start) - now, write, response)
+
+    def scan_time(self, polls):
+        """
+        Seconds taken by one cycle of a polling schedule, `polls` the
+        `(slave_id, request_length, response_length)` of every request:
+        frames on the wire, t3.5 silences and response delays
+        """
+        return sum(self.wire_time(request_length) +
+                   self.response_delay(slave_id) +
+                   self.wire_time(response_length) + 2 * self.t35
+                   for slave_id, request_length, response_length in polls)
+
+    def utilization(self, now=None):
+        """
+        Share of the time the line carried frames since :meth:`clear`
+        """
+        elapsed = (time.time() if now is None else now) - self._started
+        return min(1.0, self._busy / elapsed) if elapsed > 0 else 0.0
+
+    def clear(self):
+        """
+        Restarts the statistics
+        """
+        self._started = time.time()
+        self._busy = 0.0
+        self._turnaround = 0.0
+        self.requests = 0
+        self.responses = 0
+        # slave_id -> [responses, seconds on the wire]
+        self._slaves = {}
+
+    def stats(self):
+        """
+        Line statistics since :meth:`clear`: utilization, requests and
+        responses carried, mean turnaround (t3.5, response delay and time
+        waiting for the line), responses not sent yet and per slave the
+        responses, their share of the line and the response delay
+        """
+        now = time.time()
+        elapsed = now - self._started
+        return {
+            'utilization': self.utilization(now),
+            'elapsed': elapsed,
+            'busy': self._busy,
+            'requests': self.requests,
+            'responses': self.responses,
+            'turnaround': (self._turnaround / self.responses
+                           if self.responses else 0.0),
+            'queued': len(self._queued),
+            'slaves': dict(
+                (slave_id, {'responses': responses,
+                            'utilization': (busy / elapsed
+                                            if elapsed > 0 else 0.0),
+                            'delay': self.response_delay(slave_id)})
+                for slave_id, (responses, busy) in self._slaves.items())
+        }
@@ -0,0 +1,302 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Modbus rtu framing from the serial settings: character time, the t1.5
+and t3.5 silences (fixed to 750us and 1.75ms above 19200 bauds, as the
+modbus serial line specification requires) and the end of a request
+derived from its function code, so that a frame is handled as soon as its
+last byte is read instead of after a read timeout. Also the CRC16 of the
+frames, table driven and cached for repeated frames.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import struct
+import time
+
+# above this baudrate the silences no longer scale with the character time
+_FIXED_TIMING_BAUDRATE = 19200
+_FIXED_T15 = 0.00075
+_FIXED_T35 = 0.00175
+
+# frames whose CRC is kept, see `CrcCache`
+CRC_CACHE_SIZE = 1024
+
+# request length of a function code whose length cannot be derived, the
+# frame ends with a t3.5 silence
+UNKNOWN = -1
+# request adu length (unit, function code, data, crc) per function code
+_FIXED_LENGTHS = {1: 8, 2: 8, 3: 8, 4: 8, 5: 8, 6: 8, 7: 4, 8: 8, 11: 4,
+                  12: 4, 17: 4, 22: 10, 24: 6}
+# function code -> (offset of the byte count, adu length without the data)
+_COUNTED_LENGTHS = {15: (6, 9), 16: (6, 9), 20: (2, 5), 21: (2, 5),
+                    23: (10, 13)}
+
+
+def char_bits(bytesize=8, parity="N", stopbits=1):
+    """
+    Bits on the wire per character: start bit, data bits, parity bit if
+    any and stop bits
+    """
+    return 1 + bytesize + (parity not in ("N", None)) + stopbits
+
+
+def char_time(baudrate, bytesize=8, parity="N", stopbits=1):
+    """
+    Seconds on the wire per character
+    """
+    return char_bits(bytesize, parity, stopbits) / float(baudrate)
+
+
+def frame_timing(baudrate, bytesize=8, parity="N", stopbits=1):
+    """
+    Returns `(t15, t35)`, the longest silence within a frame and the
+    shortest silence between frames, in seconds
+    """
+    if not baudrate or baudrate > _FIXED_TIMING_BAUDRATE:
+        return _FIXED_T15, _FIXED_T35
+    char = char_time(baudrate, bytesize, parity, stopbits)
+    return 1.5 * char, 3.5 * char
+
+
+def wire_time(length, baudrate, bytesize=8, parity="N", stopbits=1):
+    """
+    Seconds taken by `length` bytes on the wire, back to back
+    """
+    return length * char_time(baudrate, bytesize, parity, stopbits)
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+# crc of one byte, and of two bytes (little-endian word) built on first use
+_CRC_TABLE = _crc_table()
+_CRC_WORD_TABLE = []
+# frames from this length on are processed two bytes at a time
+_WORD_CRC_LENGTH = 32
+
+
+def _crc_word_table():
+    if not _CRC_WORD_TABLE:
+        table = _CRC_TABLE
+        words = []
+        for word in range(1 << 16):
+            crc = (word >> 8) ^ table[word & 0xFF]
+            words.append((crc >> 8) ^ table[crc & 0xFF])
+        _CRC_WORD_TABLE[:] = words
+    return _CRC_WORD_TABLE
+
+
+def crc16(data):
+    """
+    Modbus CRC16 of `data`, as the little-endian pair of bytes closing a
+    rtu frame. Table driven, a byte at a time for short frames and a word
+    at a time from `_WORD_CRC_LENGTH` bytes.
+    """
+    crc = 0xFFFF
+    table = _CRC_TABLE
+    length = len(data)
+    if length < _WORD_CRC_LENGTH:
+        for byte in bytearray(data):
+            crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+        return struct.pack("<H", crc)
+    words = _crc_word_table()
+    for word in struct.unpack_from("<%dH" % (length // 2), data):
+        crc = words[crc ^ word]
+    if length & 1:
+        (byte, ) = struct.unpack_from(">B", data, length - 1)
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return struct.pack("<H", crc)
+
+
+class CrcCache(object):
+    """
+    CRC trailers of the frames seen last: a server polled for unchanged
+    registers receives the same requests and sends the same responses over
+    and over, whose CRC is then a dict lookup. Emptied when `size` frames
+    are cached. Shared by the rtu servers (dict operations are atomic).
+    """
+
+    def __init__(self, size=CRC_CACHE_SIZE):
+        self._size = size
+        self._trailers = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._trailers)
+
+    def trailer(self, data):
+        """
+        CRC pair of bytes closing the frame starting with `data`
+        """
+        trailer = self._trailers.get(data)
+        if trailer is not None:
+            self.hits += 1
+            return trailer
+        self.misses += 1
+        trailer = crc16(data)
+        if len(self._trailers) >= self._size:
+            self._trailers = {}
+        self._trailers[data] = trailer
+        return trailer
+
+    def check(self, frame):
+        """
+        True if `frame` ends with the CRC of the bytes before
+        """
+        return len(frame) > 2 and self.trailer(frame[:-2]) == frame[-2:]
+
+    def clear(self):
+        self._trailers = {}
+        self.hits = self.misses = 0
+
+
+crc_cache = CrcCache()
+
+
+def request_length(frame):
+    """
+    Length of the rtu request starting `frame`, None while too few bytes
+    are known to tell, :data:`UNKNOWN` for function codes of no derivable
+    length
+    """
+    if len(frame) < 2:
+        return None
+    (function_code, ) = struct.unpack_from(">B", frame, 1)
+    length = _FIXED_LENGTHS.get(function_code)
+    if length is not None:
+        return length
+    counted = _COUNTED_LENGTHS.get(function_code)
+    if counted is None:
+        return UNKNOWN
+    offset, length = counted
+    if len(frame) <= offset:
+        return None
+    (count, ) = struct.unpack_from(">B", frame, offset)
+    return length + count
+
+
+class RtuFramer(object):
+    """
+    Splits the bytes read from a serial port into rtu frames. Reads are
+    expected in bulk (whatever the port holds), with their time of arrival:
+
+    - a frame of known length (see :func:`request_length`) is complete as
+      soon as its last byte is read, several frames read at once are split
+    - bytes following a silence of t3.5 or more start a new frame, an
+      incomplete frame before them is dropped, unless they complete it
+      with a valid CRC (the silence was the reader's, late on a busy
+      reactor, rather than the line's)
+    - a frame of unknown length ends with a t3.5 silence, see
+      :meth:`needs_silence` and :meth:`flush`
+
+    CRCs are left to the server (see :data:`crc_cache`). `dropped` counts
+    the incomplete frames. Without `silences` (rtu over tcp, see
+    :func:`stream_frames`) frames only end on their length, and a frame
+    failing its CRC is taken for a framing error: its first byte is
+    dropped (counted in `dropped`) and the bytes after it framed again, so
+    that a stray byte does not shift all the frames that follow.
+    """
+
+    def __init__(self, baudrate=None, bytesize=8, parity="N", stopbits=1,
+                 length=request_length, silences=True):
+        self.t15, self.t35 = frame_timing(baudrate, bytesize, parity,
+                                          stopbits)
+        self._length = length
+        self._silences = silences
+        self._buffer = b""
+        self._last = 0.0
+        self.dropped = 0
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    def needs_silence(self):
+        """
+        True if the pending bytes make a frame of unknown length, which
+        only a t3.5 silence completes
+        """
+        return bool(self._buffer) and \
+            self._length(self._buffer) == UNKNOWN
+
+    def feed(self, data, now=None):
+        """
+        Adds the bytes of a read, returns the frames they complete
+        """
+        now = time.time() if now is None else now
+        frames = []
+        if self._silences and self._buffer and \
+                now - self._last >= self.t35 and not self._completes(data):
+            frames.extend(self.flush())
+        if not data:
+            return frames
+        self._last = now
+        buf = self._buffer + data
+        while buf:
+            length = self._length(buf)
+            if length is None or length == UNKNOWN or len(buf) < length:
+                break
+            if not self._silences and not crc_cache.check(buf[:length]):
+                self.dropped += 1
+                buf = buf[1:]
+                continue
+            frames.append(buf[:length])
+            buf = buf[length:]
+        self._buffer = buf
+        return frames
+
+    def _completes(self, data):
+        buf = self._buffer + data
+        length = self._length(buf)
+        if length is None or length == UNKNOWN or len(buf) < length:
+            return False
+        return crc_cache.check(buf[:length])
+
+    def flush(self):
+        """
+        Ends the pending bytes with a silence: returns them as a frame of
+        unknown length, drops them if incomplete
+        """
+        buf, self._buffer = self._buffer, b""
+        if not buf:
+            return []
+        if self._length(buf) == UNKNOWN:
+            return [buf]
+        self.dropped += 1
+        return []
+
+
+def read_frames(port, framer):
+    """
+    Reads what `port` (a pyserial port, its timeout t3.5) holds and returns
+    the frames completed. Waits for more bytes only for a frame of unknown
+    length, until a t3.5 silence.
+    """
+    frames = framer.feed(port.read(port.in_waiting or 1))
+    while framer.needs_silence():
+        data = port.read(port.in_waiting or 1)
+        frames.extend(framer.feed(data))
+        if not data:
+            frames.extend(framer.flush())
+    return frames
+
+
+def stream_frames(framer, data):
+    """
+    Frames completed by `data`, received from a stream (rtu over tcp) by
+    `framer` (an :class:`RtuFramer` without silences), those of known
+    length with a valid CRC. A frame of unknown length ends with the data
+    received, its CRC is left to the server.
+    """
+    frames = framer.feed(data)
+    if framer.needs_silence():
+        frames.extend(framer.flush())
+    return frames
@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Several rtu buses simulated at once: one rtu `ModbusSimu` per serial or
+pty port, each with its own slaves and serial settings, all served by a
+small pool of :class:`~GJXS.utils.reactor.Reactor` threads instead of a
+server thread per port::
+
+    ports = RtuPorts("pymodbus", threads=2)
+    bus = ports.add_port("pty", baudrate=19200, parity="E")
+    bus.add_slaves([1, 2], profile.template())
+    ports.add_port("/dev/ttyUSB0", baudrate=9600)
+    ports.start()
+    ports.stats()
+    ports.close()
+"""
+from __future__ import absolute_import, unicode_literals
+
+import importlib
+from collections import OrderedDict
+
+from GJXS.utils.engine import BACKENDS
+from GJXS.utils.pty_link import PTY_PORT
+from GJXS.utils.reactor import Reactor
+
+# serial settings reported by `RtuPorts.stats`, with their pyserial defaults
+SERIAL_SETTINGS = OrderedDict([("baudrate", 9600), ("bytesize", 8),
+                               ("parity", "N"), ("stopbits", 1)])
+
+
+class RtuPorts(object):
+    """
+    Rtu ports of one backend, `modbus_tk` or `pymodbus`, spread over
+    `threads` reactors (round robin in the order they are added). A port is
+    named after its device, or after the tty given to the masters for a
+    `pty` port (see :class:`~GJXS.utils.pty_link.PtyLink`).
+
+    Ports added while running are served at once. A port blocking its
+    reactor (a slow serial read) delays the other ports of that reactor
+    only.
+    """
+
+    def __init__(self, backend="modbus_tk", threads=1):
+        if threads < 1:
+            raise ValueError("threads must be 1 or more, got %r" % threads)
+        self._module = importlib.import_module(BACKENDS[backend])
+        self.backend = backend
+        self._reactors = [Reactor("rtu_ports-%d" % number)
+                          for number in range(threads)]
+        # name -> (ModbusSimu, reactor, serial settings)
+        self._ports = OrderedDict()
+        self._added = 0
+        self._running = False
+
+    def __repr__(self):
+        return '<%s %s: %s>' % (self.__class__.__name__, self.backend,
+                                ", ".join(self._ports))
+
+    def __len__(self):
+        return len(self._ports)
+
+    def __iter__(self):
+        return iter(self._ports)
+
+    def __contains__(self, name):
+        return name in self._ports
+
+    def __getitem__(self, name):
+        return self._ports[name][0]
+
+    @property
+    def running(self):
+        return self._running
+
+    def add_port(self, port=PTY_PORT, **settings):
+        """
+        Adds a port, `pty` or the path of a serial device, with its serial
+        `settings` (`baudrate`, `bytesize`, `parity`, `stopbits`,
+        `timeout`...). Returns the rtu `ModbusSimu` of the port, its name is
+        :func:`port_name` of it.
+        """
+        device = self._module.ModbusSimu(server="rtu", port=port, **settings)
+        name = port_name(device)
+        if name in self._ports:
+            device.close()
+            raise ValueError("port %s already served" % name)
+        reactor = self._reactors[self._added % len(self._reactors)]
+        self._added += 1
+        self._ports[name] = (device, reactor, settings)
+        if self._running:
+            device.start(reactor)
+        return device
+
+    def remove_port(self, name):
+        """
+        Stops serving port `name` and closes it
+        """
+        device, _, _ = self._ports.pop(name)
+        device.close()
+
+    def start(self):
+        if self._running:
+            return
+        for reactor in self._reactors:
+            reactor.start()
+        for device, reactor, _ in self._ports.values():
+            device.start(reactor)
+        self._running = True
+
+    def stop(self):
+        """
+        Stops serving every port, the ports stay open (pty masters keep
+        their line)
+        """
+        if not self._running:
+            return
+        for device, _, _ in self._ports.values():
+            device.stop()
+        for reactor in self._reactors:
+            reactor.stop()
+        self._running = False
+
+    def close(self):
+        self.stop()
+        for name in list(self._ports):
+            self.remove_port(name)
+
+    def stats(self):
+        """
+        Per port: its name, serial settings, reactor, requests served (see
+        :meth:`~GJXS.utils.monitor.RequestMonitor.totals`), for a pty
+        port the bytes exchanged with the master and for a port with a bus
+        model (`turnaround` given) the utilization of the line
+        """
+        stats = []
+        for name, (device, reactor, settings) in self._ports.items():
+            port = OrderedDict([("name", name), ("reactor", reactor.name)])
+            for setting, default in SERIAL_SETTINGS.items():
+                port[setting] = settings.get(setting, default)
+            port.update(device.monitor.totals())
+            if device.link is not None:
+                link_stats = device.link.stats()
+                port['bytes_in'] = link_stats['to_server']
+                port['bytes_out'] = link_stats['to_master']
+            if device.bus is not None:
+                port['utilization'] = device.bus.utilization()
+            stats.append(port)
+        return stats
+
+
+def port_name(device):
+    """
+    Name of an rtu `ModbusSimu` port: the tty of its masters for a `pty`
+    port, its device otherwise
+    """
+    return device.master_path or device.port
@@ -0,0 +1,226 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+from itertools import chain
+
+PAGE_SHIFT = 6
+PAGE_SIZE = 1 << PAGE_SHIFT
+_PAGE_MASK = PAGE_SIZE - 1
+_ZERO_PAGE = (0, ) * PAGE_SIZE
+
+
+class RegisterPages(object):
+    """
+    Read-only register image split in pages of `PAGE_SIZE` values. Pages
+    are tuples and can be shared by any number of :class:`CowRegisters`.
+
+    Args:
+        values: Initial values, or the number of registers to fill with 0.
+    """
+
+    def __init__(self, values):
+        if isinstance(values, int):
+            size = values
+            # zero filled images share a single page
+            pages = [_ZERO_PAGE] * (size >> PAGE_SHIFT)
+            if size & _PAGE_MASK:
+                pages.append(_ZERO_PAGE[:size & _PAGE_MASK])
+        else:
+            values = list(values)
+            size = len(values)
+            pages = [tuple(values[start:start + PAGE_SIZE])
+                     for start in range(0, size, PAGE_SIZE)]
+        self.pages = tuple(pages)
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+
+class CowRegisters(object):
+    """
+    Copy-on-write register list backed by shared :class:`RegisterPages`.
+
+    Supports the list operations the backends use on block storage:
+    len, iteration, integer and slice reads (returning lists), same size
+    slice assignment and extend.
+
+    Pages are never modified in place. A write copies the pages it touches
+    and publishes the new page list with a single assignment (read-copy-
+    update): memory grows with the pages that diverged from the template,
+    and readers need no lock, every read taking the page list once and
+    seeing all or none of a write. Writers must be serialized by the
+    caller.
+    """
+
+    def __init__(self, pages):
+        self._template = pages.pages
+        self._pages = pages.pages
+        self._size = pages.size
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return chain.from_iterable(self._pages)
+
+    def __repr__(self):
+        return '<%s size=%d copied_pages=%d>' % (
+            self.__class__.__name__, self._size, self.copied_pages())
+
+    def _index(self, item):
+        if item < 0:
+            item += self._size
+        if not 0 <= item < self._size:
+            raise IndexError("register index out of range")
+        return item
+
+    def __getitem__(self, item):
+        pages = self._pages
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self._size)
+            if step != 1:
+                return [pages[i >> PAGE_SHIFT][i & _PAGE_MASK]
+                        for i in range(start, stop, step)]
+            values = []
+            while start < stop:
+                offset = start & _PAGE_MASK
+                end = min(offset + stop - start, PAGE_SIZE)
+                values.extend(pages[start >> PAGE_SHIFT][offset:end])
+                start += end - offset
+            return values
+        item = self._index(item)
+        return pages[item >> PAGE_SHIFT][item & _PAGE_MASK]
+
+    def _write(self, start, values):
+        """
+        Publishes a copy of the pages with `values` written from `start`
+        """
+        pages = list(self._pages)
+        stop = start + len(values)
+        written = 0
+        while start < stop:
+            number = start >> PAGE_SHIFT
+            offset = start & _PAGE_MASK
+            end = min(offset + stop - start, PAGE_SIZE)
+            count = end - offset
+            page = list(pages[number])
+            page[offset:end] = values[written:written + count]
+            pages[number] = tuple(page)
+            written += count
+            start += count
+        self._pages = tuple(pages)
+
+    def __setitem__(self, item, value):
+        if not isinstance(item, slice):
+            self._write(self._index(item), [value])
+            return
+        start, stop, step = item.indices(self._size)
+        value = list(value)
+        if step != 1 or len(value) != max(stop - start, 0):
+            raise ValueError("register blocks can't be resized")
+        self._write(start, value)
+
+    def extend(self, values):
+        values = list(values)
+        pages = list(self._pages)
+        if pages and len(pages[-1]) < PAGE_SIZE:
+            fill = PAGE_SIZE - len(pages[-1])
+            pages[-1] = pages[-1] + tuple(values[:fill])
+            values = values[fill:]
+        pages.extend(tuple(values[start:start + PAGE_SIZE])
+                     for start in range(0, len(values), PAGE_SIZE))
+        # pages first, readers bound their reads by the size
+        self._pages = tuple(pages)
+        self._size = sum(len(page) for page in pages)
+
+    def copied_pages(self):
+        """
+        Number of pages copied from the template
+        """
+        template = self._template
+        return sum(1 for number, page in enumerate(self._pages)
+                   if number >= len(template) or page is not template[number])
+
+
+def as_registers(values):
+    """
+    `values` (a list of values or a block size) as :class:`CowRegisters`,
+    returned as is if it is already
+    """
+    if isinstance(values, CowRegisters):
+        return values
+    return CowRegisters(RegisterPages(values))
+
+
+class SlaveTemplate(object):
+    """
+    Register map shared by every slave created from it.
+
+    Slaves get one :class:`CowRegisters` per block, all backed by the same
+    read-only pages, so adding many slaves of the same device type costs a
+    list of page references per block instead of a copy of the registers::
+
+        template = SlaveTemplate([
+            ("Function_C03", HOLDING_REGISTERS, 0, 100),
+            ("Function_C16", ANALOG_INPUTS, 0, [1, 2, 3]),
+        ])
+        modbus_device.add_slaves(range(1, 248), template)
+
+    Args:
+        blocks: `(block_name, block_type, starting_address, values)` tuples,
+            `block_name` being the table of the block (a table may have
+            several blocks) and `values` a list of initial values or a block
+            size.
+    """
+
+    def __init__(self, blocks=()):
+        self.blocks = []
+        self._values = {}
+        self._pages = {}
+        for block in blocks:
+            self.add_block(*block)
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def add_block(self, block_name, block_type, starting_address, values):
+        if isinstance(values, int):
+            size = values
+        else:
+            values = list(values)
+            size = len(values)
+        if (block_name, starting_address) in self._values:
+            raise ValueError("block %s at %s already in template" % (
+                block_name, starting_address))
+        self.blocks.append((block_name, block_type, starting_address, size))
+        self._values[block_name, starting_address] = values
+
+    def registers(self, block_name, starting_address):
+        """
+        New :class:`CowRegisters` of the block of `block_name` at
+        `starting_address`. The pages are built once.
+        """
+        key = (block_name, starting_address)
+        pages = self._pages.get(key)
+        if pages is None:
+            pages = self._pages[key] = RegisterPages(self._values[key])
+        return CowRegisters(pages)
+
+    def values(self, block_name, starting_address):
+        """
+        Initial values of the block of `block_name` at `starting_address`
+        """
+        values = self._values[block_name, starting_address]
+        return [0] * values if isinstance(values, int) else list(values)
+
+
+def as_template(blocks):
+    """
+    `blocks` as a :class:`SlaveTemplate`, `blocks` being a template already
+    or `(block_name, block_type, starting_address, size)` tuples.
+    """
+    if isinstance(blocks, SlaveTemplate):
+        return blocks
+    return SlaveTemplate(blocks)
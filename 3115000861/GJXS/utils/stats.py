@@ -0,0 +1,173 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+from __future__ import absolute_import, unicode_literals
+
+import time
+from collections import defaultdict
+from threading import Lock
+
+from GJXS.utils.datastore import (
+    SLAVE_ADDED, SLAVE_REMOVED, BLOCK_ADDED, BLOCK_REMOVED, VALUES_CHANGED,
+    REQUEST)
+
+
+class SlaveStats(object):
+    """
+    Aggregate statistics of one slave, updated incrementally from datastore
+    change events.
+
+    Min/max/mean are computed over the current values of all registers of
+    the slave. Values are tracked as a histogram, so a write only costs a
+    couple of dict updates and min/max are recomputed lazily when the
+    current extreme disappears.
+    """
+
+    def __init__(self, slave_id):
+        self.slave_id = slave_id
+        self.blocks = {}
+        self.requests = 0
+        self.writes = 0
+        self.last_write = None
+        self._histogram = defaultdict(int)
+        self._count = 0
+        self._sum = 0
+        self._min = None
+        self._max = None
+
+    def _add_values(self, values):
+        histogram = self._histogram
+        for value in values:
+            histogram[value] += 1
+        self._count += len(values)
+        self._sum += sum(values)
+        if values:
+            low, high = min(values), max(values)
+            if self._min is not None and low < self._min:
+                self._min = low
+            if self._max is not None and high > self._max:
+                self._max = high
+
+    def _remove_values(self, values):
+        histogram = self._histogram
+        for value in values:
+            left = histogram[value] - 1
+            if left > 0:
+                histogram[value] = left
+            else:
+                histogram.pop(value, None)
+                if value == self._min:
+                    self._min = None
+                if value == self._max:
+                    self._max = None
+        self._count -= len(values)
+        self._sum -= sum(values)
+
+    def block_added(self, block_name, values):
+        self.blocks[block_name] = self.blocks.get(block_name, 0) + len(values)
+        self._add_values(values)
+
+    def block_removed(self, block_name, values):
+        left = self.blocks.get(block_name, 0) - len(values)
+        if left > 0:
+            self.blocks[block_name] = left
+        else:
+            self.blocks.pop(block_name, None)
+        self._remove_values(values)
+
+    def values_changed(self, old, new):
+        self._remove_values(old)
+        self._add_values(new)
+        self.writes += len(new)
+        self.last_write = time.time()
+
+    @property
+    def min(self):
+        if self._min is None and self._histogram:
+            self._min = min(self._histogram)
+        return self._min
+
+    @property
+    def max(self):
+        if self._max is None and self._histogram:
+            self._max = max(self._histogram)
+        return self._max
+
+    @property
+    def mean(self):
+        return float(self._sum) / self._count if self._count else None
+
+
+class PlantStats(object):
+    """
+    Per slave statistics of a whole simulated plant. Instances are
+    `ChangeFeed` subscribers::
+
+        stats = PlantStats()
+        modbus_device.feed.subscribe(stats)
+
+    and :meth:`snapshot` can be polled by the GUI at its own pace.
+    """
+
+    def __init__(self):
+        self._slaves = {}
+        self._lock = Lock()
+        self._last_snapshot = time.time()
+        self._last_requests = {}
+
+    def __call__(self, event, slave_id, block_name, address, old, new):
+        with self._lock:
+            if event == REQUEST:
+                slave = self._slaves.get(slave_id)
+                if slave is not None:
+                    slave.requests += 1
+            elif event == VALUES_CHANGED:
+                self._slave(slave_id).values_changed(old, new)
+            elif event == BLOCK_ADDED:
+                self._slave(slave_id).block_added(block_name, new)
+            elif event == BLOCK_REMOVED:
+                self._slave(slave_id).block_removed(block_name, old)
+            elif event == SLAVE_ADDED:
+                self._slave(slave_id)
+            elif event == SLAVE_REMOVED:
+                self._slaves.pop(slave_id, None)
+
+    def _slave(self, slave_id):
+        slave = self._slaves.get(slave_id)
+        if slave is None:
+            slave = self._slaves[slave_id] = SlaveStats(slave_id)
+        return slave
+
+    def clear(self):
+        with self._lock:
+            self._slaves.clear()
+            self._last_requests.clear()
+
+    def snapshot(self):
+        """
+        Returns one dict per slave, ordered by slave id, with the per table
+        register counts, the request rate since the previous snapshot, the
+        last write time and the min/max/mean of the register values.
+        """
+        with self._lock:
+            now = time.time()
+            elapsed = max(now - self._last_snapshot, 1e-6)
+            rows = []
+            last_requests = {}
+            for slave_id in sorted(self._slaves):
+                slave = self._slaves[slave_id]
+                previous = self._last_requests.get(slave_id, slave.requests)
+                last_requests[slave_id] = slave.requests
+                rows.append({
+                    'slave_id': slave_id,
+                    'blocks': dict(slave.blocks),
+                    'requests': slave.requests,
+                    'request_rate': (slave.requests - previous) / elapsed,
+                    'writes': slave.writes,
+                    'last_write': slave.last_write,
+                    'min': slave.min,
+                    'max': slave.max,
+                    'mean': slave.mean
+                })
+            self._last_snapshot = now
+            self._last_requests = last_requests
+            return rows
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Microbenchmark of the pymodbus backend register access paths:
+
+    - context: server context lookup, validation and function code mapping
+      on every call (`ModbusSlaveContext.validate` + `getValues`/
+      `setValues`)
+    - simu: `ModbusSimu.get_values`/`set_values`
+    - accessor: handle from `ModbusSimu.accessor`, resolved once
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python tools/bench_accessors.py [-n CALLS] [-c COUNT]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import time
+
+from GJXS.utils.profiles import DeviceProfile
+from GJXS.utils.pymodbus_server import ModbusSimu
+
+SLAVE = 1
+TABLE = "Function_C03"
+FX = 3
+
+
+def _timed(calls, func):
+    started = time.time()
+    for _ in range(calls):
+        func()
+    return (time.time() - started) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--calls", type=int, default=100000)
+    parser.add_argument("-c", "--count", type=int, default=4,
+                        help="registers read/written per call")
+    args = parser.parse_args()
+    count = args.count
+    values = list(range(count))
+
+    # port 0: the tcp server binds an ephemeral port and is never started
+    simu = ModbusSimu(server="tcp", port=0, address="127.0.0.1")
+    simu.add_slaves([SLAVE], DeviceProfile.uniform("", 0, 1000).template())
+    table = simu.accessor(SLAVE, TABLE)
+
+    def context_read():
+        slave = simu.context[SLAVE]
+        if slave.validate(FX, 10, count):
+            slave.getValues(FX, 10, count)
+
+    def context_write():
+        slave = simu.context[SLAVE]
+        if slave.validate(FX, 10, count):
+            slave.setValues(FX, 10, values)
+
+    paths = [
+        ("context", context_read, context_write),
+        ("simu", lambda: simu.get_values(SLAVE, TABLE, 10, count),
+         lambda: simu.set_values(SLAVE, TABLE, 10, values)),
+        ("accessor", lambda: table.read(10, count),
+         lambda: table.write(10, values)),
+    ]
+    print("%d calls, %d registers per call" % (args.calls, count))
+    print("%-10s %12s %12s" % ("path", "read us", "write us"))
+    baseline = None
+    for name, read, write in paths:
+        timings = (_timed(args.calls, read) * 1e6,
+                   _timed(args.calls, write) * 1e6)
+        baseline = baseline or timings
+        print("%-10s %12.2f %12.2f   x%.1f / x%.1f" % (
+            name, timings[0], timings[1], baseline[0] / timings[0],
+            baseline[1] / timings[1]))
+    simu.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
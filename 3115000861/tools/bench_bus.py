@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Capacity planning of an rtu polling schedule against the bus model (see
+`GJXS.utils.rtu_bus`): several slaves on one pty line, each with its own
+response delay, polled round robin by one rtu master (separate process).
+Reports the scan time measured by the master against the one estimated by
+`RtuBus.scan_time`, the utilization of the line and the share and
+turnaround of every slave.
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python tools/bench_bus.py [-b BACKEND] [-s SLAVES]
+        [-r BAUDRATE] [-c COUNT] [-T TURNAROUND] [-D DELAYS] [-d SECONDS]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import multiprocessing
+import time
+
+from GJXS.utils.engine import BACKENDS
+from GJXS.utils.profiles import DeviceProfile
+from GJXS.utils.pty_link import PTY_PORT, tty_settings
+from GJXS.utils.rtu_ports import RtuPorts
+
+# read holding registers: request adu, response adu without the data
+REQUEST_BYTES = 8
+RESPONSE_BYTES = 5
+
+
+def _master(path, settings, slaves, count, duration, queue):
+    import serial
+    import modbus_tk.defines as cst
+    from modbus_tk.modbus_rtu import RtuMaster
+    master = RtuMaster(serial.Serial(path, **tty_settings(settings)))
+    master.set_timeout(2)
+    scans, errors = [], 0
+    stop = time.time() + duration
+    while time.time() < stop:
+        started = time.time()
+        for slave in slaves:
+            try:
+                master.execute(slave, cst.READ_HOLDING_REGISTERS, 0, count)
+            except Exception:
+                errors += 1
+        scans.append(time.time() - started)
+    master.close()
+    queue.put((scans, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-b", "--backend", default="pymodbus",
+                        choices=sorted(BACKENDS))
+    parser.add_argument("-s", "--slaves", type=int, default=4)
+    parser.add_argument("-r", "--baudrate", type=int, default=19200)
+    parser.add_argument("-c", "--count", type=int, default=10,
+                        help="registers read per poll")
+    parser.add_argument("-T", "--turnaround", type=float, default=0.005,
+                        help="default response delay, seconds")
+    parser.add_argument("-D", "--delays", default="",
+                        help="response delays of the first slaves, "
+                             "comma separated seconds")
+    parser.add_argument("-d", "--duration", type=float, default=3.0)
+    args = parser.parse_args()
+    settings = {"baudrate": args.baudrate}
+    slaves = list(range(1, args.slaves + 1))
+    ports = RtuPorts(args.backend)
+    device = ports.add_port(PTY_PORT, turnaround=args.turnaround, **settings)
+    device.add_slaves(slaves, DeviceProfile.uniform("", 0, 125).template())
+    for slave, delay in zip(slaves, args.delays.split(",")):
+        if delay:
+            device.set_response_delay(slave, float(delay))
+    polls = [(slave, REQUEST_BYTES, RESPONSE_BYTES + 2 * args.count)
+             for slave in slaves]
+    estimated = device.bus.scan_time(polls)
+    ports.start()
+    device.bus.clear()
+    print("%s: %d slaves, %d baud, %d registers, turnaround %.1fms, %.1fs" % (
+        args.backend, len(slaves), args.baudrate, args.count,
+        args.turnaround * 1e3, args.duration))
+
+    queue = multiprocessing.Queue()
+    master = multiprocessing.Process(target=_master, args=(
+        device.master_path, settings, slaves, args.count, args.duration,
+        queue))
+    master.start()
+    scans, errors = queue.get()
+    master.join()
+    stats = device.bus_stats()
+    ports.close()
+
+    measured = sum(scans) / len(scans) if scans else 0.0
+    print("scan time    measured %7.2fms  estimated %7.2fms  (%d scans, "
+          "%d errors)" % (measured * 1e3, estimated * 1e3, len(scans),
+                          errors))
+    print("line         utilization %5.1f%%  turnaround %6.2fms  "
+          "requests %d  responses %d" % (
+              stats['utilization'] * 100, stats['turnaround'] * 1e3,
+              stats['requests'], stats['responses']))
+    for slave in slaves:
+        slave_stats = stats['slaves'].get(slave)
+        if slave_stats is None:
+            continue
+        print("slave %-6d utilization %5.1f%%  delay %6.2fms  responses %d"
+              % (slave, slave_stats['utilization'] * 100,
+                 slave_stats['delay'] * 1e3, slave_stats['responses']))
+
+
+if __name__ == "__main__":
+    main()
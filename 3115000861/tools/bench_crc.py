@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of the rtu CRC16: the bit by bit `calculate_crc` of modbus_tk,
+the byte by byte `computeCRC` of pymodbus, the table driven `crc16` of
+`GJXS.utils.rtu_framing` and its `CrcCache` on repeated frames, for a
+request and the responses to reading 10 and 125 registers. Then the CRC
+work of a request served by modbus_tk (`RtuQuery` against `SimuRtuQuery`).
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python tools/bench_crc.py [-n NUMBER]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import os
+import struct
+import timeit
+
+from modbus_tk.modbus_rtu import RtuQuery
+from modbus_tk.utils import calculate_crc
+from pymodbus.utilities import computeCRC
+
+from GJXS.utils.modbus import SimuRtuQuery
+from GJXS.utils.rtu_framing import CrcCache, crc16
+
+# frame lengths without the CRC: request, responses of 10 and 125 registers
+SIZES = (("request", 6), ("10 registers", 23), ("125 registers", 253))
+
+
+def _time(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def _request_crcs(query_class, request, response_pdu):
+    def serve():
+        query = query_class()
+        query.parse_request(request)
+        query.build_response(response_pdu)
+    return serve
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--number", type=int, default=2000)
+    args = parser.parse_args()
+    for name, size in SIZES:
+        data = os.urandom(size)
+        cache = CrcCache()
+        expected = crc16(data)
+        assert struct.pack(">H", calculate_crc(data)) == expected
+        assert struct.pack(">H", computeCRC(data)) == expected
+        cache.trailer(data)
+        timings = [("modbus_tk", lambda: calculate_crc(data)),
+                   ("pymodbus", lambda: computeCRC(data)),
+                   ("crc16", lambda: crc16(data)),
+                   ("cached", lambda: cache.trailer(data))]
+        print("%-14s %s" % (name, "  ".join(
+            "%s %7.2fus" % (label, _time(func, args.number) * 1e6)
+            for label, func in timings)))
+
+    request = b"\x01\x03\x00\x00\x00\x0a"
+    request += crc16(request)
+    response_pdu = b"\x03\x14" + os.urandom(20)
+    print("%-14s %s" % ("served request", "  ".join(
+        "%s %7.2fus" % (label, _time(
+            _request_crcs(query_class, request, response_pdu),
+            args.number) * 1e6)
+        for label, query_class in (("RtuQuery", RtuQuery),
+                                   ("SimuRtuQuery", SimuRtuQuery)))))
+
+
+if __name__ == "__main__":
+    main()
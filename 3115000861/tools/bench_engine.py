@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of the request latency under GUI load: a tcp client (separate
+process) polls the server while a busy thread stands for the GUI
+(rendering, list repopulation), with the server in the GUI process and
+with the server in an engine process (`EngineProxy`).
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python tools/bench_engine.py [-b BACKEND] [-n REQUESTS]
+        [-g]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import importlib
+import multiprocessing
+import threading
+import time
+
+from GJXS.utils.engine import BACKENDS, EngineProxy
+from GJXS.utils.profiles import DeviceProfile
+from GJXS.utils.reactor import Reactor
+
+SLAVE = 1
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def _client(port, requests, queue):
+    import modbus_tk.defines as cst
+    from modbus_tk.modbus_tcp import TcpMaster
+    master = TcpMaster("127.0.0.1", port)
+    master.set_timeout(5)
+    latencies = []
+    for _ in range(requests):
+        started = time.time()
+        master.execute(SLAVE, cst.READ_HOLDING_REGISTERS, 0, 10)
+        latencies.append(time.time() - started)
+    master.close()
+    queue.put(latencies)
+
+
+def _gui_load(stop):
+    """
+    Pure python work holding the interpreter lock, as redraws do
+    """
+    while not stop.is_set():
+        sum(i * i for i in range(10000))
+
+
+def run(backend, port, engine, requests, gui):
+    template = DeviceProfile.uniform("", 0, 100).template()
+    reactor = None
+    if engine:
+        device = EngineProxy(backend, server="tcp", port=port,
+                             address="127.0.0.1")
+        device.add_slaves([SLAVE], template)
+        device.start()
+    else:
+        module = importlib.import_module(BACKENDS[backend])
+        device = module.ModbusSimu(server="tcp", port=port,
+                                   address="127.0.0.1")
+        device.add_slaves([SLAVE], template)
+        reactor = Reactor()
+        reactor.start()
+        device.start(reactor)
+    stop = threading.Event()
+    load = threading.Thread(target=_gui_load, args=(stop, ))
+    load.daemon = True
+    if gui:
+        load.start()
+    time.sleep(0.3)
+
+    queue = multiprocessing.Queue()
+    client = multiprocessing.Process(target=_client,
+                                     args=(port, requests, queue))
+    client.start()
+    latencies = queue.get()
+    client.join()
+    stop.set()
+    print("%-8s gui load %-3s  request ms p50 %6.2f  p99 %7.2f  "
+          "max %7.2f" % ("engine" if engine else "inline",
+                         "on" if gui else "off",
+                         _percentile(latencies, 50) * 1e3,
+                         _percentile(latencies, 99) * 1e3,
+                         max(latencies) * 1e3))
+    device.stop()
+    if engine:
+        device.close()
+    else:
+        reactor.stop()
+        if backend == "pymodbus":
+            device.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-b", "--backend", default="pymodbus",
+                        choices=sorted(BACKENDS))
+    parser.add_argument("-p", "--port", type=int, default=15020)
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("-g", "--no-gui-load", dest="gui",
+                        action="store_false",
+                        help="run without the busy GUI thread")
+    args = parser.parse_args()
+    print("%s: %d requests" % (args.backend, args.requests))
+    for number, engine in enumerate((False, True)):
+        run(args.backend, args.port + number, engine, args.requests,
+            args.gui)
+
+
+if __name__ == "__main__":
+    main()
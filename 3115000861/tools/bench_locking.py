@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Multi-threaded benchmark of the datastore locking: reader threads poll a
+table (as the server threads do) while writer threads update it (as the
+simulation and the GUI do), with lock free readers (`StoreLock`) and
+with readers taking the writers lock (`MutexLock`, the former scheme).
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python tools/bench_locking.py [-b BACKEND] [-r READERS]
+        [-w WRITERS] [-d SECONDS]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import threading
+import time
+
+from GJXS.utils.locking import MutexLock, StoreLock
+from GJXS.utils.profiles import DeviceProfile
+
+SLAVE = 1
+TABLE = "Function_C03"
+SIZE = 1000
+
+
+def _device(backend, lock_class):
+    if backend == "pymodbus":
+        from GJXS.utils.pymodbus_server import CustomDataBlock, ModbusSimu
+        CustomDataBlock.lock_class = lock_class
+        # port 0: binds an ephemeral port, the server is never started
+        device = ModbusSimu(server="tcp", port=0, address="127.0.0.1")
+    else:
+        from GJXS.utils.modbus import SimuSlave, ModbusSimu
+        SimuSlave.lock_class = lock_class
+        device = ModbusSimu(server="tcp", port=0)
+    device.add_slaves([SLAVE], DeviceProfile.uniform("", 0, SIZE).template())
+    return device
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def run(backend, lock_class, readers, writers, duration, count):
+    device = _device(backend, lock_class)
+    table = device.accessor(SLAVE, TABLE)
+    stop = threading.Event()
+    latencies = [[] for _ in range(readers)]
+    writes = [0] * writers
+
+    def read(latency):
+        address = 0
+        while not stop.is_set():
+            started = time.time()
+            table.read(address, count)
+            latency.append(time.time() - started)
+            address = (address + count) % (SIZE - count)
+
+    def write(number):
+        value = 0
+        while not stop.is_set():
+            # a simulation tick: rewrite the whole table
+            table.write(0, [value] * SIZE)
+            value = (value + 1) & 0xffff
+            writes[number] += 1
+
+    threads = [threading.Thread(target=read, args=(latency, ))
+               for latency in latencies]
+    threads += [threading.Thread(target=write, args=(number, ))
+                for number in range(writers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    stats = device.lock_stats()
+    latency = sum(latencies, [])
+    print("%-9s reads/s %9.0f  writes/s %7.0f  read us p50 %7.1f "
+          "p99 %8.1f max %9.1f" % (
+              lock_class.__name__, len(latency) / duration,
+              sum(writes) / duration, _percentile(latency, 50) * 1e6,
+              _percentile(latency, 99) * 1e6, max(latency or [0]) * 1e6))
+    print("%-9s read waits %d (%.3fs), write waits %d (%.3fs)" % (
+        "", stats["read_waits"], stats["read_wait_time"],
+        stats["write_waits"], stats["write_wait_time"]))
+    if backend == "pymodbus":
+        device.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-b", "--backend", default="pymodbus",
+                        choices=["pymodbus", "modbus_tk"])
+    parser.add_argument("-r", "--readers", type=int, default=4)
+    parser.add_argument("-w", "--writers", type=int, default=2)
+    parser.add_argument("-d", "--duration", type=float, default=2.0)
+    parser.add_argument("-c", "--count", type=int, default=10,
+                        help="registers per read")
+    args = parser.parse_args()
+    print("%s: %d readers, %d writers, %.1fs" % (
+        args.backend, args.readers, args.writers, args.duration))
+    for lock_class in (MutexLock, StoreLock):
+        run(args.backend, lock_class, args.readers, args.writers,
+            args.duration, args.count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of the server execution models: tcp clients (separate
+processes) poll the server while simulation and sync jobs update the
+datastore, with one thread per job (and per client with pymodbus) and
+with everything run by a single `Reactor`.
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python tools/bench_reactor.py [-b BACKEND] [-c CLIENTS]
+        [-j JOBS] [-d SECONDS]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+
+from GJXS.utils.backgroundJob import BackgroundJob
+from GJXS.utils.profiles import DeviceProfile
+from GJXS.utils.reactor import Reactor
+
+SLAVE = 1
+TABLE = "Function_C03"
+SIZE = 100
+
+
+def _device(backend, port):
+    if backend == "pymodbus":
+        from GJXS.utils.pymodbus_server import ModbusSimu
+    else:
+        from GJXS.utils.modbus import ModbusSimu
+    device = ModbusSimu(server="tcp", port=port, address="127.0.0.1")
+    device.add_slaves([SLAVE], DeviceProfile.uniform("", 0, SIZE).template())
+    return device
+
+
+def _client(port, duration, counter):
+    import modbus_tk.defines as cst
+    from modbus_tk.modbus_tcp import TcpMaster
+    master = TcpMaster("127.0.0.1", port)
+    master.set_timeout(5)
+    requests = 0
+    stop = time.time() + duration
+    while time.time() < stop:
+        master.execute(SLAVE, cst.READ_HOLDING_REGISTERS, 0, 10)
+        requests += 1
+    master.close()
+    with counter.get_lock():
+        counter.value += requests
+
+
+def run(backend, port, use_reactor, clients, jobs, duration):
+    device = _device(backend, port)
+    table = device.accessor(SLAVE, TABLE)
+    ticks = [0]
+
+    def simulate():
+        ticks[0] = (ticks[0] + 1) & 0xffff
+        table.write(0, [ticks[0]] * SIZE)
+
+    def sync():
+        table.read(0, SIZE)
+
+    reactor = None
+    if use_reactor:
+        reactor = Reactor()
+        reactor.start()
+        running = [reactor.call_every("simulation", 0.01, simulate)
+                   for _ in range(jobs)]
+        running.append(reactor.call_every("modbus_sync", 0.1, sync))
+        device.start(reactor)
+    else:
+        running = [BackgroundJob("simulation", 0.01, simulate)
+                   for _ in range(jobs)]
+        running.append(BackgroundJob("modbus_sync", 0.1, sync))
+        for job in running:
+            job.start()
+        device.start()
+    time.sleep(0.3)
+
+    counter = multiprocessing.Value("l", 0)
+    processes = [multiprocessing.Process(target=_client,
+                                         args=(port, duration, counter))
+                 for _ in range(clients)]
+    cpu = os.times()
+    for process in processes:
+        process.start()
+    time.sleep(duration / 2.0)
+    threads = threading.active_count()
+    for process in processes:
+        process.join()
+    cpu = sum(os.times()[:2]) - sum(cpu[:2])
+
+    print("%-8s requests/s %8.0f  threads %3d  server cpu %.2fs  "
+          "ticks %d" % ("reactor" if use_reactor else "threads",
+                        counter.value / duration, threads, cpu, ticks[0]))
+    if reactor is not None:
+        for task in reactor.stats()['tasks']:
+            print("%10s %-14s calls %8d  cpu %.3fs  wall %.3fs" % (
+                "", task['name'], task['calls'], task['cpu_time'],
+                task['wall_time']))
+    for job in running:
+        job.cancel()
+    device.stop()
+    if reactor is not None:
+        reactor.stop()
+    if backend == "pymodbus":
+        device.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-b", "--backend", default="pymodbus",
+                        choices=["pymodbus", "modbus_tk"])
+    parser.add_argument("-p", "--port", type=int, default=15020)
+    parser.add_argument("-c", "--clients", type=int, default=4)
+    parser.add_argument("-j", "--jobs", type=int, default=4,
+                        help="simulation jobs, ticking every 10ms")
+    parser.add_argument("-d", "--duration", type=float, default=3.0)
+    args = parser.parse_args()
+    print("%s: %d clients, %d simulation jobs, %.1fs" % (
+        args.backend, args.clients, args.jobs, args.duration))
+    for number, use_reactor in enumerate((False, True)):
+        run(args.backend, args.port + number, use_reactor, args.clients,
+            args.jobs, args.duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of toggling a tcp server: full `stop`/`start` cycles against
+`pause`/`resume`, with a request served after every restart (so that
+connections of the previous run are left in TIME_WAIT). Reports the
+restart latency, the time until the first request is answered and the
+restarts which failed.
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python tools/bench_restart.py [-b BACKEND] [-n CYCLES]
+        [-r]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import importlib
+import time
+
+import modbus_tk.defines as cst
+from modbus_tk.modbus_tcp import TcpMaster
+
+from GJXS.utils.engine import BACKENDS
+from GJXS.utils.profiles import DeviceProfile
+from GJXS.utils.reactor import Reactor
+
+SLAVE = 1
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def _request(port, timeout=2.0):
+    """
+    Sends requests until one is answered, False if none was within
+    `timeout` seconds (a threaded modbus_tk server binds its socket after
+    `start` returned)
+    """
+    stop = time.time() + timeout
+    while time.time() < stop:
+        master = TcpMaster("127.0.0.1", port)
+        master.set_timeout(timeout)
+        try:
+            master.execute(SLAVE, cst.READ_HOLDING_REGISTERS, 0, 1)
+            return True
+        except Exception:
+            time.sleep(0.001)
+        finally:
+            master.close()
+    return False
+
+
+def run(backend, port, cycles, reactor, fast):
+    module = importlib.import_module(BACKENDS[backend])
+    device = module.ModbusSimu(server="tcp", port=port, address="127.0.0.1")
+    device.add_slaves([SLAVE], DeviceProfile.uniform("", 0, 10).template())
+    device.start(reactor)
+    if fast:
+        down, up = device.pause, device.resume
+    else:
+        down, up = device.stop, lambda: device.start(reactor)
+    restarts, answers, failures = [], [], 0
+    for _ in range(cycles):
+        _request(port)
+        down()
+        started = time.time()
+        try:
+            up()
+        except Exception:
+            failures += 1
+            continue
+        restarted = time.time()
+        if not _request(port):
+            failures += 1
+            continue
+        restarts.append(restarted - started)
+        answers.append(time.time() - started)
+    device.stop()
+    if backend == "pymodbus":
+        device.server.server_close()
+    print("%-13s %-8s restart us p50 %9.1f max %9.1f  first answer ms "
+          "p50 %7.2f max %7.2f  failures %d" % (
+              "pause/resume" if fast else "stop/start",
+              "reactor" if reactor else "threads",
+              _percentile(restarts or [0], 50) * 1e6,
+              max(restarts or [0]) * 1e6,
+              _percentile(answers or [0], 50) * 1e3,
+              max(answers or [0]) * 1e3, failures))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-b", "--backend", default="pymodbus",
+                        choices=sorted(BACKENDS))
+    parser.add_argument("-p", "--port", type=int, default=15020)
+    parser.add_argument("-n", "--cycles", type=int, default=50)
+    parser.add_argument("-r", "--reactor", action="store_true",
+                        help="serve from a reactor instead of threads")
+    args = parser.parse_args()
+    reactor = None
+    if args.reactor:
+        reactor = Reactor()
+        reactor.start()
+    print("%s: %d cycles" % (args.backend, args.cycles))
+    for number, fast in enumerate((False, True)):
+        run(args.backend, args.port + number, args.cycles, reactor, fast)
+    if reactor is not None:
+        reactor.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of the rtu throughput over pty lines (see
+`GJXS.utils.pty_link`): one rtu bus per line, all served by
+`GJXS.utils.rtu_ports.RtuPorts` from a pool of reactors, polled by one rtu
+master (separate process) per line. The lines cycle through the given
+parities, reported only: the ttys carry no parity bit (see
+`GJXS.utils.pty_link.tty_settings`). Ptys are not paced at the baudrate,
+the wire limit of a real line (frames back to back, t3.5 apart, see
+`GJXS.utils.rtu_framing`) is reported along. Reports the master side tty of every line, its settings, the
+requests served and the bytes exchanged.
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python tools/bench_rtu.py [-b BACKEND] [-l LINES]
+        [-t THREADS] [-d SECONDS] [-r BAUDRATE] [-P PARITIES]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import multiprocessing
+import time
+
+from GJXS.utils.engine import BACKENDS
+from GJXS.utils.profiles import DeviceProfile
+from GJXS.utils.pty_link import PTY_PORT, tty_settings
+from GJXS.utils.rtu_framing import frame_timing, wire_time
+from GJXS.utils.rtu_ports import RtuPorts
+
+SLAVE = 1
+COUNT = 10
+# request and response adu of reading COUNT registers
+FRAME_BYTES = 8 + 5 + 2 * COUNT
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def _master(path, settings, duration, queue):
+    import serial
+    import modbus_tk.defines as cst
+    from modbus_tk.modbus_rtu import RtuMaster
+    master = RtuMaster(serial.Serial(path, **tty_settings(settings)))
+    master.set_timeout(2)
+    latencies, errors = [], 0
+    stop = time.time() + duration
+    while time.time() < stop:
+        started = time.time()
+        try:
+            master.execute(SLAVE, cst.READ_HOLDING_REGISTERS, 0, COUNT)
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.time() - started)
+    master.close()
+    queue.put((path, latencies, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-b", "--backend", default="pymodbus",
+                        choices=sorted(BACKENDS))
+    parser.add_argument("-l", "--lines", type=int, default=4)
+    parser.add_argument("-t", "--threads", type=int, default=1,
+                        help="reactors serving the lines")
+    parser.add_argument("-d", "--duration", type=float, default=3.0)
+    parser.add_argument("-r", "--baudrate", type=int, default=115200)
+    parser.add_argument("-P", "--parities", default="N,E",
+                        help="parities of the lines, in turn")
+    args = parser.parse_args()
+    template = DeviceProfile.uniform("", 0, 10).template()
+    parities = args.parities.split(",")
+    ports = RtuPorts(args.backend, threads=args.threads)
+    settings = {}
+    for number in range(args.lines):
+        port_settings = {"baudrate": args.baudrate,
+                         "parity": parities[number % len(parities)]}
+        device = ports.add_port(PTY_PORT, **port_settings)
+        device.add_slaves([SLAVE], template)
+        settings[device.master_path] = port_settings
+    ports.start()
+    print("%s: %d lines, %d reactors, %d baud, %.1fs" % (
+        args.backend, args.lines, args.threads, args.baudrate,
+        args.duration))
+
+    queue = multiprocessing.Queue()
+    masters = [multiprocessing.Process(
+        target=_master, args=(path, port_settings, args.duration, queue))
+        for path, port_settings in settings.items()]
+    for master in masters:
+        master.start()
+    results = {}
+    for _ in masters:
+        path, latencies, errors = queue.get()
+        results[path] = (latencies, errors)
+    for master in masters:
+        master.join()
+
+    total = []
+    for port in ports.stats():
+        latencies, errors = results[port['name']]
+        total.extend(latencies)
+        print("%-12s %-10s %6d%s  requests/s %6.0f  ms p50 %6.2f  "
+              "errors %d  served %d  bytes in %d out %d" % (
+                  port['name'], port['reactor'], port['baudrate'],
+                  port['parity'], len(latencies) / args.duration,
+                  _percentile(latencies or [0], 50) * 1e3, errors,
+                  port['requests'], port['bytes_in'], port['bytes_out']))
+    ports.close()
+    print("%-12s requests/s %7.0f  ms p50 %6.2f  p99 %6.2f" % (
+        "all", len(total) / args.duration,
+        _percentile(total or [0], 50) * 1e3,
+        _percentile(total or [0], 99) * 1e3))
+    t35 = frame_timing(args.baudrate)[1]
+    print("%-12s requests/s %7.0f  at %d baud (%d per line)" % (
+        "wire limit", args.lines / (wire_time(FRAME_BYTES, args.baudrate) +
+                                    2 * t35),
+        args.baudrate, 1 / (wire_time(FRAME_BYTES, args.baudrate) + 2 * t35)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of the transports sharing a datastore: tcp (mbap) and rtu over
+tcp polled by tcp clients, rtu and ascii over a pty line polled by a
+serial client, all clients pymodbus masters in separate processes and
+all servers run by one `Reactor`. Pty lines are not paced at the
+baudrate, the rtu figure is bound by the pymodbus rtu client, which
+waits its own interframe silences.
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python tools/bench_transports.py [-b BACKEND] [-c CLIENTS]
+        [-d SECONDS] [-p PORT]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import importlib
+import multiprocessing
+import time
+
+from GJXS.utils.engine import BACKENDS
+from GJXS.utils.profiles import DeviceProfile
+from GJXS.utils.pty_link import PTY_PORT
+from GJXS.utils.reactor import Reactor
+
+SLAVE = 1
+COUNT = 10
+BAUDRATE = 115200
+
+
+def _client(transport, target, duration, counter):
+    from pymodbus.client.sync import ModbusSerialClient, ModbusTcpClient
+    from pymodbus.transaction import ModbusRtuFramer
+    if transport == "tcp":
+        client = ModbusTcpClient("127.0.0.1", port=target)
+    elif transport == "rtu_tcp":
+        client = ModbusTcpClient("127.0.0.1", port=target,
+                                 framer=ModbusRtuFramer)
+    else:
+        client = ModbusSerialClient(method=transport, port=target,
+                                    baudrate=BAUDRATE, timeout=2)
+    client.connect()
+    requests = 0
+    stop = time.time() + duration
+    while time.time() < stop:
+        if not client.read_holding_registers(0, COUNT,
+                                             unit=SLAVE).isError():
+            requests += 1
+    client.close()
+    with counter.get_lock():
+        counter.value += requests
+
+
+def run(module, transport, port, reactor, clients, duration):
+    if transport in module.SERIAL_SERVERS:
+        device = module.ModbusSimu(server=transport, port=PTY_PORT,
+                                   baudrate=BAUDRATE)
+        target, clients = device.master_path, 1
+    else:
+        device = module.ModbusSimu(server=transport, port=port,
+                                   address="127.0.0.1")
+        target = port
+    device.add_slaves([SLAVE], DeviceProfile.uniform("", 0, COUNT)
+                      .template())
+    device.start(reactor)
+    time.sleep(0.2)
+    counter = multiprocessing.Value("L", 0)
+    processes = [multiprocessing.Process(
+        target=_client, args=(transport, target, duration, counter))
+        for _ in range(clients)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    totals = device.monitor.totals()
+    device.close()
+    print("%-8s clients %2d  requests/s %7.0f  served %d  latency %6.3fms"
+          % (transport, clients, counter.value / duration,
+             totals['requests'], totals['latency'] * 1e3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-b", "--backend", default="pymodbus",
+                        choices=sorted(BACKENDS))
+    parser.add_argument("-c", "--clients", type=int, default=2)
+    parser.add_argument("-d", "--duration", type=float, default=3.0)
+    parser.add_argument("-p", "--port", type=int, default=15030)
+    args = parser.parse_args()
+    module = importlib.import_module(BACKENDS[args.backend])
+    reactor = Reactor()
+    reactor.start()
+    print("%s: %.1fs per transport" % (args.backend, args.duration))
+    for offset, transport in enumerate(("tcp", "rtu_tcp", "rtu", "ascii")):
+        run(module, transport, args.port + offset, reactor, args.clients,
+            args.duration)
+    reactor.stop()
+
+
+if __name__ == "__main__":
+    main()
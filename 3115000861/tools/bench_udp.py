@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of modbus over udp (see `GJXS.utils.datagram`): peers (separate
+processes) keep a window of read requests in flight on their own socket,
+the server answers all of them from one `Reactor` or its server thread.
+Reports the datagrams per second and the drops counted by the server,
+the responses the peers received and the threads of the server process.
+
+Usage (from the repository root)::
+
+    PYTHONPATH=. python tools/bench_udp.py [-b BACKEND] [-c PEERS]
+        [-w WINDOW] [-d SECONDS] [-p PORT] [--thread]
+"""
+from __future__ import absolute_import, print_function
+
+import argparse
+import importlib
+import multiprocessing
+import socket
+import struct
+import threading
+import time
+
+from GJXS.utils.engine import BACKENDS
+from GJXS.utils.profiles import DeviceProfile
+from GJXS.utils.reactor import Reactor
+
+SLAVE = 1
+COUNT = 10
+
+
+def _peer(port, window, duration, counter):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(0.2)
+    address = ("127.0.0.1", port)
+    transaction = 0
+
+    def send():
+        request = struct.pack(">HHHBBHH", transaction & 0xffff, 0, 6, SLAVE,
+                              3, 0, COUNT)
+        sock.sendto(request, address)
+
+    for transaction in range(window):
+        send()
+    responses = 0
+    stop = time.time() + duration
+    while time.time() < stop:
+        try:
+            sock.recv(512)
+            responses += 1
+        except socket.timeout:
+            # lost on the way, refill the window
+            pass
+        transaction += 1
+        send()
+    sock.close()
+    with counter.get_lock():
+        counter.value += responses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-b", "--backend", default="pymodbus",
+                        choices=sorted(BACKENDS))
+    parser.add_argument("-c", "--peers", type=int, default=4)
+    parser.add_argument("-w", "--window", type=int, default=8,
+                        help="requests in flight per peer")
+    parser.add_argument("-d", "--duration", type=float, default=3.0)
+    parser.add_argument("-p", "--port", type=int, default=15050)
+    parser.add_argument("--thread", action="store_true",
+                        help="serve from the server thread, not a reactor")
+    args = parser.parse_args()
+    module = importlib.import_module(BACKENDS[args.backend])
+    device = module.ModbusSimu(server="udp", port=args.port,
+                               address="127.0.0.1")
+    device.add_slaves([SLAVE], DeviceProfile.uniform("", 0, COUNT)
+                      .template())
+    reactor = None
+    if not args.thread:
+        reactor = Reactor()
+        reactor.start()
+    device.start(reactor)
+    time.sleep(0.2)
+
+    counter = multiprocessing.Value("L", 0)
+    peers = [multiprocessing.Process(
+        target=_peer, args=(args.port, args.window, args.duration, counter))
+        for _ in range(args.peers)]
+    for peer in peers:
+        peer.start()
+    time.sleep(args.duration / 2)
+    threads = threading.active_count()
+    for peer in peers:
+        peer.join()
+    stats = device.datagram_stats()
+    device.close()
+    if reactor is not None:
+        reactor.stop()
+
+    print("%s from %s: %d peers, window %d, %.1fs, %d threads" % (
+        args.backend, "thread" if args.thread else "reactor", args.peers,
+        args.window, args.duration, threads))
+    print("server       datagrams/s %7.0f  answered %d  dropped %d "
+          "(malformed %d, send %d, kernel %s)" % (
+              stats['per_second'], stats['answered'], stats['dropped'],
+              stats['malformed'], stats['send_errors'], stats['kernel']))
+    print("peers        responses/s %7.0f" % (counter.value / args.duration))
+
+
+if __name__ == "__main__":
+    main()